@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Benchmark the pre/post observation hooks with stub decoders.
+
+Every stage runs as a child process and is measured with wait4(), giving wall
+time, cpu time and peak RSS. Syscall counts come from strace -c when it is
+installed, the in-process stages also report the read/write syscalls from
+/proc/self/io. Add-ons that were refused and errors logged by a stage are listed
+with it, so a stage that did not do its work is not mistaken for a fast one.
+Results are printed as JSON so they can be compared over time.
+"""
+
+import argparse
+import logging
+from json import dumps, loads
+from os import chmod, environ, killpg, listdir, wait4, path, makedirs
+from os import waitstatus_to_exitcode
+from random import randrange, seed
+from re import findall, search
+from shutil import copy, rmtree, which
+from signal import SIGTERM
+from struct import pack
+from subprocess import run, Popen, DEVNULL, PIPE
+from sys import executable
+from tempfile import mkdtemp
+from time import monotonic
+
+LOGGER = logging.getLogger("hookbench")
+SCRIPTS = path.join(path.dirname(path.abspath(__file__)), "..", "scripts")
+OBS_ID = "1000"
+TIMESTAMP = "2024-01-01T00-00-00"
+
+# stand-ins for the decoders, sources run until stopped, the stages reading a
+# pipe end on EOF like the real ones
+STUB_SLEEP = """#!/bin/sh
+exec sleep 300
+"""
+STUB_CAT = """#!/bin/sh
+exec cat >/dev/null
+"""
+STUB_GRSAT = """#!/bin/sh
+while [ $# -gt 0 ]; do
+  if [ "$1" = "--kiss_out" ]; then cp "$KISS_SOURCE" "$2"; fi
+  shift
+done
+exec sleep 300
+"""
+STUBS = {
+    "gr_satellites": STUB_GRSAT,
+    "satdump": STUB_SLEEP,
+    "meteor_demod": STUB_CAT,
+    "meteor_decode": STUB_CAT,
+    "rx_sdr": STUB_SLEEP,
+    "rx_fm": STUB_SLEEP,
+    "rffft": STUB_CAT,
+    "direwolf": STUB_CAT,
+}
+
+# runs one in-process stage and reports the syscalls it made
+RUNNER = """
+import sys
+sys.argv = sys.argv[1:]
+exec(sys.argv[0])
+with open("/proc/self/io") as f:
+    io = dict(line.split(": ") for line in f.read().splitlines())
+print(int(io["syscr"]) + int(io["syscw"]), file=sys.stderr)
+"""
+
+# names of the add-ons running, after the pre hook
+RUNNING = """
+import sys, json
+sys.path.insert(0, sys.argv[1])
+from supervisor import states
+print(json.dumps(sorted(s.name for s, state in states() if s.running(state))))
+"""
+
+# stops every add-on the hooks left running, they are in sessions of their own
+STOP_ALL = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from supervisor import states
+for supervisor, state in list(states()):
+    if supervisor.running(state) is not None:
+        supervisor.stop()
+"""
+
+
+def esc(data):
+    return data.replace(b"\xdb", b"\xdb\xdd").replace(b"\xc0", b"\xdb\xdc")
+
+
+def make_kiss(filename, frames, frame_size, image=False):
+    """Synthetic gr-satellites KISS file, optionally Stratosat image frames."""
+    seed(frames)
+    with open(filename, "wb") as f:
+        for i in range(frames):
+            f.write(b"\xc0\x09" + pack(">Q", 1704067200000 + i * 100) + b"\xc0")
+            if image:
+                addr = i * 56
+                payload = b"\xff\xd8\xff" if i == 0 else b""
+                payload += bytes(randrange(256) for _ in range(56 - len(payload)))
+                frame = b"\x02\x00\x3e\x01\x00" + pack("<I", addr)[:3] + payload
+            else:
+                frame = bytes(randrange(256) for _ in range(frame_size))
+            f.write(b"\xc0\x00" + esc(frame) + b"\xc0")
+    return path.getsize(filename)
+
+
+class HookBench(object):
+    def __init__(self, frames, frame_size, image, use_strace, keep):
+        self.frames = frames
+        self.frame_size = frame_size
+        self.image = image
+        self.norad = 53385 if image else 99999
+        self.strace = which("strace") if use_strace else None
+        self.keep = keep
+        self.pgids = set()
+        self.work = mkdtemp(prefix="hookbench_")
+        self.bin = path.join(self.work, "bin")
+        self.tmp = path.join(self.work, "app")
+        self.data = path.join(self.tmp, "data")
+        self.kiss = path.join(self.work, "source.kiss")
+        tle = {"tle0": "0 BENCHSAT", "tle1": "1 x", "tle2": f"2 {self.norad} x"}
+        self.args = [
+            OBS_ID,
+            "435000000",
+            dumps(tle),
+            TIMESTAMP,
+            "9600",
+            "satnogs_fsk.py",
+        ]
+        self.env = dict(
+            environ,
+            PATH=f"{self.bin}:{environ.get('PATH', '')}",
+            PYTHONDONTWRITEBYTECODE="1",
+            SATNOGS_APP_PATH=self.tmp,
+            SATNOGS_OUTPUT_PATH=self.data,
+            SATNOGS_STATION_ID="1",
+            SATNOGS_SOAPY_RX_DEVICE="driver=stub",
+            SATNOGS_ANTENNA="RX",
+            SATNOGS_RX_SAMP_RATE="2048000",
+            UDP_DUMP_HOST="127.0.0.1",
+            KISS_SOURCE=self.kiss,
+            SATDUMP_ENABLE="true",
+            METEOR_NORAD=str(self.norad),
+            BANDSCAN_ENABLE="true",
+            BANDSCAN_FREQ="435000000",
+            BANDSCAN_DIR=path.join(self.work, "bandscan"),
+            DIREWOLF_ENABLE="true",
+            UDP_HUB_ENABLE="true",
+            TELEMETRY_ENABLE="true",
+            GPIO_ENABLE="true",
+            GPIO_BACKEND="stub",
+        )
+
+    def setup(self):
+        makedirs(self.bin)
+        makedirs(self.data)
+        for name in listdir(SCRIPTS):  # all of them, like the image
+            if path.isfile(path.join(SCRIPTS, name)) and not name.startswith("test_"):
+                copy(path.join(SCRIPTS, name), self.bin)
+                chmod(path.join(self.bin, name), 0o755)
+        for name, content in STUBS.items():
+            if which(name) is None or name == "gr_satellites":
+                with open(path.join(self.bin, name), "w") as f:
+                    f.write(content)
+                chmod(path.join(self.bin, name), 0o755)
+        size = make_kiss(self.kiss, self.frames, self.frame_size, self.image)
+        LOGGER.info(f"Synthetic KISS file: {self.frames} frames, {size} bytes")
+        return size
+
+    def cleanup(self):
+        if path.isdir(self.tmp):
+            run([executable, "-c", STOP_ALL, self.bin], env=self.env, stderr=DEVNULL)
+        for pgid in self.pgids:
+            try:
+                killpg(pgid, SIGTERM)
+            except ProcessLookupError:
+                pass
+        if not self.keep:
+            rmtree(self.work, ignore_errors=True)
+
+    def measure(self, stage, cmd, python=False):
+        strace_out = path.join(self.work, f"{stage}.strace")
+        if python:
+            cmd = [executable, "-c", RUNNER] + cmd
+        if self.strace is not None:
+            cmd = [self.strace, "-f", "-c", "-o", strace_out] + cmd
+        # a file, as add-ons left running by the stage may inherit it
+        with open(path.join(self.work, f"{stage}.log"), "w+") as log:
+            start = monotonic()
+            proc = Popen(
+                cmd, env=self.env, stdout=DEVNULL, stderr=log, start_new_session=True
+            )
+            self.pgids.add(proc.pid)
+            _, status, rusage = wait4(proc.pid, 0)
+            wall = monotonic() - start
+            log.seek(0)
+            stderr = log.read()
+        status = waitstatus_to_exitcode(status)
+        refused = findall(r"Not starting (\S+),", stderr)
+        errors = findall(r" - ERROR - (.*)", stderr)
+        result = {
+            "stage": stage,
+            "frames": self.frames,
+            "wall_s": round(wall, 4),
+            "user_s": round(rusage.ru_utime, 4),
+            "sys_s": round(rusage.ru_stime, 4),
+            "max_rss_kb": rusage.ru_maxrss,
+            "syscalls": None,
+            "status": status,
+            "ok": status == 0 and not refused and not errors,
+            "refused": refused,
+            "errors": errors,
+        }
+        if self.strace is not None:
+            result["syscalls"] = self.strace_total(strace_out)
+        elif python:
+            lines = stderr.strip().splitlines()
+            if lines and lines[-1].isdigit():
+                result["syscalls"] = int(lines[-1])
+                result["syscalls_source"] = "proc_io"
+        if not result["ok"]:
+            LOGGER.warning(f"{stage}: exited {status}, refused {refused}, {errors}")
+        LOGGER.info(f"{stage}: {wall:.3f}s")
+        return result
+
+    def running(self):
+        """Names of the add-ons running now."""
+        proc = run(
+            [executable, "-c", RUNNING, self.bin],
+            env=self.env,
+            stdout=PIPE,
+            stderr=DEVNULL,
+        )
+        try:
+            return loads(proc.stdout)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def strace_total(filename):
+        try:
+            with open(filename, "r") as f:
+                match = search(
+                    r"\n\s*[\d.]+\s+[\d.]+\s+\d*\s+(\d+)\s+\d*\s*total", f.read()
+                )
+        except OSError:
+            return None
+        return int(match.group(1)) if match else None
+
+    def import_time(self, module):
+        proc = Popen(
+            [executable, "-X", "importtime", "-c", f"import {module}"],
+            env=dict(self.env, PYTHONPATH=self.bin),
+            stdout=DEVNULL,
+            stderr=PIPE,
+        )
+        _, stderr = proc.communicate()
+        for line in stderr.decode().splitlines():
+            fields = [f.strip() for f in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                return int(fields[1]) / 1e6
+        return None
+
+    def run(self):
+        results = []
+        kiss_size = self.setup()
+        kiss_file = path.join(self.tmp, f"grsat_{OBS_ID}.kiss")
+        try:
+            for module in ["kiss", "grsat", "imagedecode"]:
+                results.append(
+                    {"stage": f"import_{module}", "wall_s": self.import_time(module)}
+                )
+            results.append(self.measure("satnogs-pre", ["satnogs-pre"] + self.args))
+            results[-1]["running"] = self.running()
+            results.append(self.measure("satnogs-post", ["satnogs-post"] + self.args))
+            results.append(
+                self.measure("grsat_start", ["grsat.py", "start"] + self.args)
+            )
+            results.append(self.measure("grsat_stop", ["grsat.py", "stop"] + self.args))
+            self.clear_data()
+            copy(self.kiss, kiss_file)
+            snippet = (
+                "sys.path.insert(0, sys.argv[1]); from grsat import GrSat; "
+                "GrSat('stop', *sys.argv[2:]).kiss_to_json()"
+            )
+            results.append(
+                self.measure("kiss_to_json", [snippet, self.bin] + self.args, True)
+            )
+            snippet = (
+                "sys.path.insert(0, sys.argv[1]); from imagedecode import ImageDecode; "
+                "ImageDecode(sys.argv[2], sys.argv[3], sys.argv[4])"
+            )
+            results.append(
+                self.measure(
+                    "imagedecode",
+                    [
+                        snippet,
+                        self.bin,
+                        kiss_file,
+                        str(self.norad),
+                        f"{self.data}/img_",
+                    ],
+                    True,
+                )
+            )
+        finally:
+            self.cleanup()
+        return {
+            "frames": self.frames,
+            "frame_size": self.frame_size,
+            "kiss_bytes": kiss_size,
+            "norad": self.norad,
+            "strace": self.strace is not None,
+            "results": results,
+        }
+
+    def clear_data(self):
+        rmtree(self.data, ignore_errors=True)
+        makedirs(self.data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-n", "--frames", default="1000", help="comma separated KISS sizes in frames"
+    )
+    parser.add_argument("-s", "--frame-size", type=int, default=64, help="frame bytes")
+    parser.add_argument(
+        "-i", "--image", action="store_true", help="use Stratosat image frames"
+    )
+    parser.add_argument("--no-strace", action="store_true", help="skip strace")
+    parser.add_argument("-k", "--keep", action="store_true", help="keep work dir")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(
+        format="%(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.WARNING,
+    )
+    report = []
+    for frames in args.frames.split(","):
+        bench = HookBench(
+            int(frames), args.frame_size, args.image, not args.no_strace, args.keep
+        )
+        report.append(bench.run())
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(dumps(report, indent=2))
+    else:
+        print(dumps(report, indent=2))
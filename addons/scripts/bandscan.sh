@@ -13,7 +13,7 @@ set -eu
 : "${BANDSCAN_INPUT_FORMAT:=float}"
 : "${SATNOGS_RF_GAIN:=0}"
 : "${SATNOGS_OTHER_SETTINGS:=0}"
-BANDSCAN_PID="$SATNOGS_APP_PATH/bandscan.pid"
+: "${BANDSCAN_PACK:=false}"
 
 # if unset, try calculating channels
 if [ -n "${BANDSCAN_CHANNELS:-}" ]; then
@@ -31,31 +31,41 @@ if [ "${1^^}" == "START" ]; then
     DAY=$(date -Idate)
     SAVEDIR="$BANDSCAN_DIR/$BANDSCAN_FREQ/$DAY"
     mkdir -p "$SAVEDIR" "$SATNOGS_APP_PATH"
-    INDEX=$(find "$SAVEDIR" -mindepth 1 -maxdepth 1 -type f | wc -l)
-    $BANDSCAN_BIN -d "$SATNOGS_SOAPY_RX_DEVICE" \
-                  -a "$SATNOGS_ANTENNA" \
-                  -p "$SATNOGS_PPM_ERROR" \
-                  -g "$SATNOGS_RF_GAIN" \
-                  -t "$SATNOGS_OTHER_SETTINGS" \
-                  -s "$BANDSCAN_SAMPLERATE" \
-                  -f "$BANDSCAN_FREQ" \
-                  -F "$BANDSCAN_OUTPUT_FORMAT" - \
-    | rffft -q \
-            -f "$BANDSCAN_FREQ" \
-            -s "$BANDSCAN_SAMPLERATE" \
-            -F "$BANDSCAN_INPUT_FORMAT" \
-            -c "$CHANNELS" \
-            -t 1 \
-            -p "$SAVEDIR" \
-            -o "$DAY" \
-            -S "$INDEX" &
-    echo $! > "$BANDSCAN_PID"
+    # continue after the highest rffft file index, older files may be packed away
+    shopt -s nullglob
+    FILES=("$SAVEDIR"/*.bin)
+    INDEX=0
+    if [ ${#FILES[@]} -gt 0 ]; then
+      LAST="${FILES[-1]##*_}"
+      INDEX=$((10#${LAST%.bin} + 1))
+    fi
+    # stopping ends the sdr, rffft writes the last spectra on EOF
+    # the observation waits for this, so it is given a short timeout
+    supervisor.py start bandscan -t 2 -- \
+      $BANDSCAN_BIN -d "$SATNOGS_SOAPY_RX_DEVICE" \
+                    -a "$SATNOGS_ANTENNA" \
+                    -p "$SATNOGS_PPM_ERROR" \
+                    -g "$SATNOGS_RF_GAIN" \
+                    -t "$SATNOGS_OTHER_SETTINGS" \
+                    -s "$BANDSCAN_SAMPLERATE" \
+                    -f "$BANDSCAN_FREQ" \
+                    -F "$BANDSCAN_OUTPUT_FORMAT" - \
+      '|' rffft -q \
+                -f "$BANDSCAN_FREQ" \
+                -s "$BANDSCAN_SAMPLERATE" \
+                -F "$BANDSCAN_INPUT_FORMAT" \
+                -c "$CHANNELS" \
+                -t 1 \
+                -p "$SAVEDIR" \
+                -o "$DAY" \
+                -S "$INDEX"
+    if [[ "${BANDSCAN_PACK^^}" =~ (TRUE|YES|1) ]]; then
+      ( nice bandscan_store.py pack "$BANDSCAN_DIR/$BANDSCAN_FREQ" && \
+        nice bandscan_stats.py "$BANDSCAN_DIR/$BANDSCAN_FREQ" ) > /dev/null &
+    fi
 fi
 
 if [ "${1^^}" == "STOP" ]; then
-   if [ -f "$BANDSCAN_PID" ]; then
-       echo "Stopping bandscan"
-       kill "$(cat "$BANDSCAN_PID")"
-       rm -f "$BANDSCAN_PID"
-   fi
+   echo "Stopping bandscan"
+   supervisor.py stop bandscan
 fi
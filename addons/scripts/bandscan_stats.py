@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from json import dump
+from os import path, replace
+
+import numpy as np
+
+from bandscan_store import stores
+
+LOGGER = logging.getLogger("bandscan")
+
+BLOCK_ROWS = 4096  # spectra processed at a time
+HIST_MIN = -200.0  # dB, per channel histogram used for the percentiles
+HIST_STEP = 0.25
+HIST_BINS = 1600
+PERCENTILES = [10, 50, 90, 99]  # the 10th is used as noise floor
+MAX_BURSTS = 10000  # listed per day, all are counted
+
+
+def to_db(block):
+    return 10 * np.log10(np.maximum(block, 1e-20))
+
+
+def percentiles(hist, qs):
+    """Value at each percentile of every channel, from the histogram rows."""
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1:]
+    result = []
+    for q in qs:
+        idx = np.argmax(cum >= total * q / 100, axis=1)
+        result.append(HIST_MIN + (idx + 0.5) * HIST_STEP)
+    return result
+
+
+class BurstFinder(object):
+    """Runs of consecutive spectra above the threshold, per channel, that may
+    continue from one block to the next.
+    """
+
+    def __init__(self, nchan):
+        self.open = np.full(nchan, -1)  # start row of a run still going on
+        self.runs = []  # (channel, start row, end row) arrays per block
+
+    def feed(self, above, offset):
+        prev = self.open >= 0
+        edges = np.diff(np.vstack((prev, above)).astype(np.int8), axis=0)
+        start_row, start_chan = np.nonzero(edges == 1)
+        end_row, end_chan = np.nonzero(edges == -1)
+        # runs carried over start before this block
+        carried = np.nonzero(prev)[0]
+        start_chan = np.concatenate((carried, start_chan))
+        start_row = np.concatenate((self.open[carried], start_row + offset))
+        order = np.lexsort((start_row, start_chan))
+        start_chan, start_row = start_chan[order], start_row[order]
+        order = np.lexsort((end_row, end_chan))
+        end_chan, end_row = end_chan[order], end_row[order] + offset
+        # the first n starts of a channel pair up with its n ends
+        ends = np.bincount(end_chan, minlength=len(self.open))
+        first = np.searchsorted(start_chan, start_chan, "left")
+        rank = np.arange(len(start_chan)) - first
+        closed = rank < ends[start_chan]
+        self.runs.append((end_chan, start_row[closed], end_row))
+        self.open[:] = -1
+        self.open[start_chan[~closed]] = start_row[~closed]
+
+    def finish(self, rows):
+        still = np.nonzero(self.open >= 0)[0]
+        self.runs.append((still, self.open[still], np.full(len(still), rows)))
+        self.open[:] = -1
+        chans, starts, ends = (np.concatenate(r) for r in zip(*self.runs))
+        self.runs = []
+        return chans, starts, ends
+
+
+def analyse(store, threshold=6.0, min_burst=1):
+    """Noise floor, percentiles, occupancy and bursts of every channel."""
+    rows, nchan = len(store), store.nchan
+    spectra = store.spectra
+    hist = np.zeros((nchan, HIST_BINS), dtype=np.int64)
+    offsets = np.arange(nchan) * HIST_BINS
+    for start in range(0, rows, BLOCK_ROWS):
+        db = to_db(np.asarray(spectra[start : start + BLOCK_ROWS]))
+        idx = np.clip(((db - HIST_MIN) / HIST_STEP).astype(np.int64), 0, HIST_BINS - 1)
+        hist += np.bincount(
+            (idx + offsets).ravel(), minlength=nchan * HIST_BINS
+        ).reshape(nchan, HIST_BINS)
+    levels = percentiles(hist, PERCENTILES)
+    floor = levels[0]
+    limit = floor + threshold
+
+    occupied = np.zeros(nchan, dtype=np.int64)
+    finder = BurstFinder(nchan)
+    for start in range(0, rows, BLOCK_ROWS):
+        above = to_db(np.asarray(spectra[start : start + BLOCK_ROWS])) > limit
+        occupied += above.sum(axis=0)
+        finder.feed(above, start)
+    chans, starts, ends = finder.finish(rows)
+    keep = ends - starts >= min_burst
+    chans, starts, ends = chans[keep], starts[keep], ends[keep]
+    order = np.argsort(starts, kind="stable")
+    chans, starts, ends = chans[order], starts[order], ends[order]
+
+    times = np.asarray(store.times)
+    tint = float(store.header["tint"]) or (
+        float(np.median(np.diff(times))) if rows > 1 else 1.0
+    )
+    burst_time = np.bincount(chans, weights=ends - starts, minlength=nchan) * tint
+    summary = {
+        "freq": float(store.header["freq"]),
+        "bw": float(store.header["bw"]),
+        "nchan": nchan,
+        "spectra": rows,
+        "start": float(times[0]) if rows else None,
+        "end": float(times[-1]) if rows else None,
+        "threshold_db": threshold,
+        "channels": {
+            "freq": np.round(store.frequencies).tolist(),
+            "noise_floor_db": np.round(floor, 2).tolist(),
+            **{
+                f"p{q}_db": np.round(level, 2).tolist()
+                for q, level in zip(PERCENTILES, levels)
+            },
+            "occupancy": np.round(occupied / max(rows, 1), 4).tolist(),
+            "bursts": np.bincount(chans, minlength=nchan).tolist(),
+            "burst_time_s": np.round(burst_time, 1).tolist(),
+        },
+        "bursts_total": int(len(chans)),
+        # start unix time, duration in seconds, channel
+        "bursts": [
+            [round(float(times[s]), 1), round(float((e - s) * tint), 1), int(c)]
+            for c, s, e in zip(
+                chans[:MAX_BURSTS], starts[:MAX_BURSTS], ends[:MAX_BURSTS]
+            )
+        ],
+    }
+    return summary
+
+
+def summarise(freq_dir, days=None, threshold=6.0, min_burst=1, force=False):
+    """Write DAY.stats.json for every packed day that changed since the last run."""
+    written = 0
+    for day, store in stores(freq_dir):
+        if days and day not in days:
+            continue
+        out = path.join(freq_dir, f"{day}.stats.json")
+        if (
+            not force
+            and path.isfile(out)
+            and path.getmtime(out) >= path.getmtime(store.spec_file)
+        ):
+            continue
+        summary = analyse(store, threshold, min_burst)
+        summary["day"] = day
+        with open(f"{out}.tmp", "w") as f:
+            dump(summary, f, separators=(",", ":"))
+        replace(f"{out}.tmp", out)
+        LOGGER.info(
+            f"{out}: {summary['spectra']} spectra, {summary['bursts_total']} bursts"
+        )
+        written += 1
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Noise floor, occupancy and bursts of packed bandscan days"
+    )
+    parser.add_argument("freq_dir", help="BANDSCAN_DIR/frequency")
+    parser.add_argument("days", nargs="*", help="only these days, YYYY-MM-DD")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=6.0, help="dB above the noise floor"
+    )
+    parser.add_argument(
+        "-m", "--min-burst", type=int, default=1, help="shortest burst, in spectra"
+    )
+    parser.add_argument("-f", "--force", action="store_true", help="redo all days")
+    args = parser.parse_args()
+    count = summarise(
+        args.freq_dir, args.days, args.threshold, args.min_burst, args.force
+    )
+    print(f"Wrote {count} summaries")
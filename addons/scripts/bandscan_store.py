@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from datetime import datetime, timezone
+from os import getenv, path, scandir, unlink
+from pathlib import Path
+
+import numpy as np
+
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(
+        logging, getenv("BANDSCAN_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    ),
+)
+LOGGER = logging.getLogger("bandscan")
+
+RFFFT_HEADER = 256  # ascii header in front of every rffft spectrum
+STORE_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("nchan", "<u4"),
+        ("freq", "<f8"),  # center frequency, Hz
+        ("bw", "<f8"),  # bandwidth, Hz
+        ("tint", "<f8"),  # integration time, s
+        ("reserved", "S24"),
+    ]
+)
+MAGIC = b"BANDSCAN"
+VERSION = 1
+
+
+def read_rffft(filename):
+    """Spectra from one rffft .bin file as (header, unix time, float32 array)."""
+    with open(filename, "rb") as f:
+        while True:
+            raw = f.read(RFFFT_HEADER)
+            if len(raw) < RFFFT_HEADER:
+                return
+            header = {}
+            for line in raw.split(b"\0")[0].decode(errors="replace").splitlines():
+                key, _, value = line.partition(" ")
+                header[key] = value.strip()
+            if "NCHAN" not in header or "UTC_START" not in header:
+                LOGGER.warning(f"Invalid header in {filename}")
+                return
+            if header.get("NBITS", "32") != "32":
+                LOGGER.warning(
+                    f"Only 32 bit float spectra supported, skipping {filename}"
+                )
+                return
+            nchan = int(header["NCHAN"])
+            spectrum = np.frombuffer(f.read(nchan * 4), dtype="<f4")
+            if len(spectrum) < nchan:
+                return
+            ts = datetime.fromisoformat(header["UTC_START"])
+            yield header, ts.replace(tzinfo=timezone.utc).timestamp(), spectrum
+
+
+class SpectrumStore(object):
+    """Append-only spectra of one frequency and day.
+
+    name.spec holds a small header and float32 rows of nchan, name.time the
+    float64 unix time of each row. Both are memory mapped on access, queries
+    only read the rows and channels asked for.
+    """
+
+    def __init__(self, name, freq=None, bw=None, nchan=None, tint=0.0):
+        self.spec_file = f"{name}.spec"
+        self.time_file = f"{name}.time"
+        if path.isfile(self.spec_file):
+            header = np.fromfile(self.spec_file, dtype=STORE_HEADER, count=1)
+            if len(header) == 0 or header[0]["magic"] != MAGIC:
+                raise ValueError(f"{self.spec_file} is not a bandscan store")
+            self.header = header[0]
+        elif nchan is None:
+            raise FileNotFoundError(self.spec_file)
+        else:
+            self.header = np.zeros(1, dtype=STORE_HEADER)[0]
+            self.header["magic"] = MAGIC
+            self.header["version"] = VERSION
+            self.header["nchan"] = nchan
+            self.header["freq"] = freq
+            self.header["bw"] = bw
+            self.header["tint"] = tint
+            with open(self.spec_file, "wb") as f:
+                f.write(self.header.tobytes())
+            open(self.time_file, "wb").close()
+        self.nchan = int(self.header["nchan"])
+
+    def __len__(self):
+        rows = (path.getsize(self.spec_file) - STORE_HEADER.itemsize) // (
+            self.nchan * 4
+        )
+        return min(rows, path.getsize(self.time_file) // 8)
+
+    @property
+    def times(self):
+        if len(self) == 0:
+            return np.empty(0, dtype="<f8")
+        return np.memmap(self.time_file, dtype="<f8", mode="r", shape=len(self))
+
+    @property
+    def spectra(self):
+        if len(self) == 0:
+            return np.empty((0, self.nchan), dtype="<f4")
+        return np.memmap(
+            self.spec_file,
+            dtype="<f4",
+            mode="r",
+            offset=STORE_HEADER.itemsize,
+            shape=(len(self), self.nchan),
+        )
+
+    @property
+    def frequencies(self):
+        """Center frequency of each channel."""
+        bw = float(self.header["bw"])
+        return float(self.header["freq"]) + bw * (
+            np.arange(self.nchan) / self.nchan - 0.5
+        )
+
+    def append(self, times, spectra):
+        """Add rows, the ones not newer than the last stored row are skipped."""
+        times = np.asarray(times, dtype="<f8")
+        spectra = np.asarray(spectra, dtype="<f4").reshape(-1, self.nchan)
+        if len(self) > 0:
+            keep = times > self.times[-1]
+            times, spectra = times[keep], spectra[keep]
+        if len(times) == 0:
+            return 0
+        rows = len(self)  # drop a half written row from an interrupted append
+        with open(self.spec_file, "r+b") as f:
+            f.seek(STORE_HEADER.itemsize + rows * self.nchan * 4)
+            f.write(spectra.tobytes())
+            f.truncate()
+        with open(self.time_file, "r+b") as f:
+            f.seek(rows * 8)
+            f.write(times.tobytes())
+            f.truncate()
+        return len(times)
+
+    def rows(self, start=None, end=None):
+        """Row slice for unix times start <= t < end."""
+        times = self.times
+        first = 0 if start is None else int(np.searchsorted(times, start, "left"))
+        last = len(times) if end is None else int(np.searchsorted(times, end, "left"))
+        return slice(first, last)
+
+    def channels(self, fmin=None, fmax=None):
+        """Channel slice for frequencies fmin <= f < fmax."""
+        freqs = self.frequencies
+        first = 0 if fmin is None else int(np.searchsorted(freqs, fmin, "left"))
+        last = self.nchan if fmax is None else int(np.searchsorted(freqs, fmax, "left"))
+        return slice(first, last)
+
+    def query(self, start=None, end=None, fmin=None, fmax=None):
+        """Times, frequencies and the time x frequency block of spectra."""
+        rows = self.rows(start, end)
+        chans = self.channels(fmin, fmax)
+        return self.times[rows], self.frequencies[chans], self.spectra[rows, chans]
+
+
+def bin_files(day_dir):
+    return sorted(
+        entry.path for entry in scandir(day_dir) if entry.name.endswith(".bin")
+    )
+
+
+def pack_day(day_dir, keep=False, skip_newest=False):
+    """Move the rffft files of one day into day_dir.spec/.time next to it."""
+    files = bin_files(day_dir)
+    if skip_newest:  # still being written by rffft
+        files = files[:-1]
+    store = None
+    packed = 0
+    for filename in files:
+        times, spectra = [], []
+        for header, ts, spectrum in read_rffft(filename):
+            if store is None:
+                store = SpectrumStore(
+                    day_dir.rstrip("/"),
+                    float(header["FREQ"].split()[0]),
+                    float(header["BW"].split()[0]),
+                    int(header["NCHAN"]),
+                    float(header.get("LENGTH", "0").split()[0]),
+                )
+            if len(spectrum) != store.nchan:
+                LOGGER.warning(f"Channel count changed in {filename}, skipping")
+                break
+            times.append(ts)
+            spectra.append(spectrum)
+        else:
+            if store is not None and len(times) > 0:
+                order = np.argsort(times, kind="stable")
+                packed += store.append(np.array(times)[order], np.array(spectra)[order])
+            if not keep:
+                unlink(filename)
+    if not keep and not skip_newest and len(bin_files(day_dir)) == 0:
+        try:
+            Path(day_dir).rmdir()
+        except OSError:
+            pass
+    LOGGER.info(f"Packed {packed} spectra from {len(files)} files in {day_dir}")
+    return packed
+
+
+def pack(freq_dir, keep=False):
+    """Pack every day directory under BANDSCAN_DIR/freq, today's is left running."""
+    today = datetime.now().date().isoformat()
+    packed = 0
+    for day_dir in sorted(p for p in Path(freq_dir).iterdir() if p.is_dir()):
+        packed += pack_day(str(day_dir), keep, skip_newest=day_dir.name >= today)
+    return packed
+
+
+def stores(freq_dir):
+    """Day name and store of every packed day under BANDSCAN_DIR/freq."""
+    for spec in sorted(Path(freq_dir).glob("*.spec")):
+        yield spec.stem, SpectrumStore(str(spec.with_suffix("")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack and query bandscan spectra")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="pack rffft files into day stores")
+    p.add_argument("freq_dir", help="BANDSCAN_DIR/frequency")
+    p.add_argument("-k", "--keep", action="store_true", help="keep the .bin files")
+    q = sub.add_parser("query", help="extract a time x frequency block")
+    q.add_argument("store", help="day store, without .spec")
+    q.add_argument("--start", help="UTC start time, ISO format")
+    q.add_argument("--end", help="UTC end time, ISO format")
+    q.add_argument("--fmin", type=float, help="lowest frequency, Hz")
+    q.add_argument("--fmax", type=float, help="highest frequency, Hz")
+    q.add_argument("-o", "--output", help="save times, freqs and data to a .npz")
+    args = parser.parse_args()
+
+    if args.cmd == "pack":
+        print(f"Packed {pack(args.freq_dir, args.keep)} spectra")
+    else:
+
+        def unix(text):
+            if text is None:
+                return None
+            ts = datetime.fromisoformat(text)
+            return ts.replace(tzinfo=ts.tzinfo or timezone.utc).timestamp()
+
+        store = SpectrumStore(args.store)
+        times, freqs, data = store.query(
+            unix(args.start), unix(args.end), args.fmin, args.fmax
+        )
+        print(
+            f"{len(times)} spectra x {len(freqs)} channels, "
+            f"{freqs[0] if len(freqs) else 0:.0f}-{freqs[-1] if len(freqs) else 0:.0f} Hz"
+        )
+        if args.output:
+            np.savez(args.output, times=times, freqs=freqs, data=data)
@@ -12,20 +12,15 @@ set -eu
 : "${SDR_BIN:=rx_fm}"
 : "${DIREWOLF_BIN:=direwolf}"
 : "${DIREWOLF_SAMPLERATE:=48000}"
-DIREWOLF_PID="$SATNOGS_APP_PATH/direwolf.pid"
 
 if [ "${1^^}" == "START" ]; then
     echo "Starting direwolf"
-    $SDR_BIN -d "$SATNOGS_SOAPY_RX_DEVICE" -a "$SATNOGS_ANTENNA" -p "$SATNOGS_PPM_ERROR" -g "$SATNOGS_RF_GAIN" -f "$DIREWOLF_FREQ" -s "$DIREWOLF_SAMPLERATE" - \
-    | $DIREWOLF_BIN -c "$DIREWOLF_CONF" -r "$DIREWOLF_SAMPLERATE" -D 1 -t 0 &
-    echo $! > "$DIREWOLF_PID"
+    supervisor.py start direwolf -t 2 -- \
+      $SDR_BIN -d "$SATNOGS_SOAPY_RX_DEVICE" -a "$SATNOGS_ANTENNA" -p "$SATNOGS_PPM_ERROR" -g "$SATNOGS_RF_GAIN" -f "$DIREWOLF_FREQ" -s "$DIREWOLF_SAMPLERATE" - \
+      '|' $DIREWOLF_BIN -c "$DIREWOLF_CONF" -r "$DIREWOLF_SAMPLERATE" -D 1 -t 0
 fi
 
 if [ "${1^^}" == "STOP" ]; then
-   if [ -f "$DIREWOLF_PID" ]; then
-       echo "Stopping direwolf"
-       kill "$(cat "$DIREWOLF_PID")"
-       killall "$SDR_BIN"
-       rm -f "$DIREWOLF_PID"
-   fi
+   echo "Stopping direwolf"
+   supervisor.py stop direwolf
 fi
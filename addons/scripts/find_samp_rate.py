@@ -1,11 +1,35 @@
 #!/usr/bin/env python3
+from functools import lru_cache
+from math import ceil
+from os import getenv, replace
+from pathlib import Path
+from re import compile as re_compile
 from sys import argv
 
 # This script takes two arguments: {{BAUD}} {{SCRIPT_NAME}}
-# and tries to figure out the IQ sample rate
+# and tries to figure out the IQ sample rate.
+# With --table it writes the sample rate of every baudrate in the satyaml files,
+# sourced by samp_rate.sh so the shell hooks don't need to start python.
+
+SATYAML_PATH = getenv(
+    "SATYAML_PATH", "/usr/lib/python3/dist-packages/satellites/satyaml"
+)
+SAMP_RATE_FILE = getenv("SAMP_RATE_FILE", f"{SATYAML_PATH}/samp_rate.table")
+SCRIPT_TYPES = ["bpsk", "fsk", "sstv", "qubik", "apt", "ssb", "other"]
+COMMON_BAUDS = [1200, 2400, 4800, 9600, 19200]
+_BAUDRATE = re_compile(r"baudrate:\s*([\d.]+)")
+
+
+def script_type(script):
+    """Flowgraph family of a satnogs script name, in the order it is matched."""
+    for name in SCRIPT_TYPES[:-1]:
+        if f"_{name}" in script:
+            return name
+    return "other"  # cw, fm, afsk, etc...
 
 
 # from satnogs_gr-satellites/find_samp_rate.py
+@lru_cache(maxsize=256)
 def find_samp_rate(baudrate, script="", sps=4, audio_samp_rate=48000):
     try:
         baudrate = int(float(baudrate))
@@ -13,35 +37,63 @@ def find_samp_rate(baudrate, script="", sps=4, audio_samp_rate=48000):
         baudrate = 9600
     if baudrate < 1:
         baudrate = 9600
-    if "_bpsk" in script:
+    kind = script_type(script)
+    if kind in ["bpsk", "ssb"]:
         return find_decimation(baudrate, 2, audio_samp_rate, sps) * baudrate
-    elif "_fsk" in script:
+    elif kind in ["fsk", "qubik"]:
         return max(4, find_decimation(baudrate, 2, audio_samp_rate)) * baudrate
-    elif "_sstv" in script:
+    elif kind in ["sstv", "apt"]:
         return 4 * 4160 * 4
-    elif "_qubik" in script:
-        return max(4, find_decimation(baudrate, 2, audio_samp_rate)) * baudrate
-    elif "_apt" in script:
-        return 4 * 4160 * 4
-    elif "_ssb" in script:
-        return find_decimation(baudrate, 2, audio_samp_rate, sps) * baudrate
-    else:  # cw, fm, afsk, etc...
+    else:
         return audio_samp_rate
 
 
-# from gr-satnogs/python/utils.py
+# from gr-satnogs/python/utils.py, the smallest decimation >= min_decimation that
+# reaches audio_samp_rate, rounded up to a multiple
 def find_decimation(baudrate, min_decimation=4, audio_samp_rate=48e3, multiple=2):
-    while min_decimation * baudrate < audio_samp_rate:
-        min_decimation = min_decimation + 1
-    if min_decimation % multiple:
-        min_decimation = min_decimation + multiple - min_decimation % multiple
-    return min_decimation
+    decimation = max(min_decimation, ceil(audio_samp_rate / baudrate))
+    return -(-decimation // multiple) * multiple
+
+
+def satyaml_bauds(satyaml_path=SATYAML_PATH):
+    """All baudrates used by the transmitters in the satyaml files."""
+    bauds = set(COMMON_BAUDS)
+    for satyaml in Path(satyaml_path).glob("*.yml"):
+        try:
+            text = satyaml.read_text()
+        except (OSError, UnicodeDecodeError):
+            continue
+        for baud in _BAUDRATE.findall(text):
+            try:
+                baud = int(float(baud))
+            except ValueError:
+                continue
+            if baud > 0:
+                bauds.add(baud)
+    return sorted(bauds)
+
+
+def write_table(table_file=SAMP_RATE_FILE, satyaml_path=SATYAML_PATH):
+    """Write a bash associative array of sample rates keyed by 'baud,type'."""
+    rows = [
+        f"[{baud},{kind}]={find_samp_rate(baud, f'_{kind}')}"
+        for baud in satyaml_bauds(satyaml_path)
+        for kind in SCRIPT_TYPES
+    ]
+    with open(f"{table_file}.tmp", "w") as f:
+        f.write("# generated by find_samp_rate.py --table\n")
+        f.write("SAMP_RATE_TABLE=(\n  " + "\n  ".join(rows) + "\n)\n")
+    replace(f"{table_file}.tmp", table_file)
+    return len(rows)
 
 
 if __name__ == "__main__":
-    if len(argv) == 2:
+    if len(argv) >= 2 and argv[1] == "--table":
+        table = argv[2] if len(argv) >= 3 else SAMP_RATE_FILE
+        print(f"Wrote {write_table(table)} sample rates to {table}")
+    elif len(argv) == 2:
         print(find_samp_rate(argv[1]))
     elif len(argv) == 3:
         print(find_samp_rate(argv[1], argv[2]))
     else:
-        print(f"Usage: {argv[0]} <baudrate> [script_name]")
+        print(f"Usage: {argv[0]} <baudrate> [script_name] | --table [file]")
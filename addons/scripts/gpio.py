@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
 import argparse
-from mcp2221 import MCP2221, find_devices
-from mcp2221.enums import *
-from mcp2221.exceptions import *
+import logging
+from json import dumps, loads, JSONDecodeError
+from os import getenv, unlink
+from signal import signal, SIGTERM
+from socket import socket, AF_UNIX, SOCK_STREAM
+from socketserver import StreamRequestHandler, UnixStreamServer
+from sys import exit
+
+from supervisor import Supervisor
+
+try:
+    from mcp2221 import MCP2221, find_devices
+    from mcp2221.enums import GPIODirection, MemoryType
+    from mcp2221.enums import GPIO0Function, GPIO1Function, GPIO2Function
+    from mcp2221.enums import GPIO3Function
+except ImportError:
+    MCP2221 = None
 
 # Hook the gpios to a 4x relay board
 # GPIO functions
@@ -15,83 +29,207 @@ from mcp2221.exceptions import *
 # in /etc/udev/rules.d/99-mcp.rules
 # SUBSYSTEM=="usb", ATTRS{idVendor}=="04d8", ATTR{idProduct}=="00dd", MODE="0660", GROUP="plugdev"
 
-
-def set_outputs(arg: dict):
+LOGGER = logging.getLogger("gpio")  # imported by the hooks, leave the root
+LOGGER.setLevel(
+    getattr(logging, getenv("GPIO_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING")))
+)
+
+try:
+    TIMEOUT = float(getenv("GPIO_TIMEOUT", "2"))
+except ValueError:
+    TIMEOUT = 2.0
+BACKEND = getenv("GPIO_BACKEND", "mcp2221")  # or stub, to test without the device
+SOCKET = getenv(
+    "GPIO_SOCKET", f"{getenv('SATNOGS_APP_PATH', '/tmp/.satnogs')}/gpio.sock"
+)
+DAEMON = getenv("GPIO_DAEMON", "True").upper() in ["TRUE", "YES", "1"]
+PINS = ["lna", "antenna", "pa", "rot"]  # gp0..gp3
+UHF_FREQ = 410000000
+
+
+def pin_values(arg: dict):
+    """Output level of the pins set by the request, by pin number."""
+    values = {}
+    if "lna" in arg:
+        values[0] = int(arg["lna"]) == 0  # disables the LNA
+    if "freq" in arg:
+        values[1] = int(arg["freq"]) > UHF_FREQ
+    if "pa" in arg:
+        values[2] = int(arg["pa"]) != 0
+    if "rot" in arg:
+        values[3] = int(arg["rot"]) == 0  # disables the rotator
+    return values
+
+
+class StubDevice(object):
+    """Stands in for the MCP2221, the pins are only kept in memory."""
+
+    def __init__(self):
+        self.values = [False] * 4
+        self.writes = 0
+
+    def write(self, pin, value):
+        self.values[pin] = value
+        self.writes += 1
+
+    def init(self):
+        pass
+
+
+class Mcp2221Device(object):
+    def __init__(self):
+        if MCP2221 is None:
+            raise RuntimeError("pymcp2221 is not installed")
+        self.mcp = MCP2221(find_devices()[0])
+
+    def write(self, pin, value):
+        setattr(self.mcp, f"gpio{pin}_value", value)
+
+    def init(self):
+        functions = [GPIO0Function, GPIO1Function, GPIO2Function, GPIO3Function]
+        self.mcp.set_default_memory_target(MemoryType.Flash)
+        for pin, function in enumerate(functions):
+            getattr(self.mcp, f"gpio{pin}_write_function")(function.GPIO)
+            self.mcp.gpio_write_powerup_direction(pin, GPIODirection.Output)
+            setattr(self.mcp, f"gpio{pin}_powerup_value", False)
+            self.mcp.gpio_write_powerup_value(pin, False)
+
+
+class Controller(object):
+    """Keeps the device open and the output levels cached, so a request only
+    writes the pins that change.
+    """
+
+    def __init__(self, backend=BACKEND):
+        self.backend = backend
+        self.device = None
+        self.state = [None] * 4  # unknown until read or written
+
+    def open(self):
+        """A reopened device may have reset to its power-up levels, so nothing
+        cached is trusted and the next request writes all of its pins.
+        """
+        self.state = [None] * 4
+        self.device = StubDevice() if self.backend == "stub" else Mcp2221Device()
+
+    def close(self):
+        self.device = None
+        self.state = [None] * 4
+
+    def apply(self, arg: dict):
+        """Set the pins in the request, returns the pins written or None if the
+        device failed. After a failure, like a USB replug, the device is opened
+        again and the request retried once.
+        """
+        values = pin_values(arg)
+        for attempt in range(2):
+            try:
+                if self.device is None:
+                    self.open()
+                changed = []
+                for pin, value in values.items():
+                    if self.state[pin] != value:
+                        self.device.write(pin, value)
+                        self.state[pin] = value
+                        changed.append(pin)
+                        LOGGER.info(f"{PINS[pin]} output {'on' if value else 'off'}")
+                if "init" in arg:
+                    LOGGER.info("Setting device defaults")
+                    self.device.init()
+                return changed
+            except Exception as e:
+                LOGGER.error(f"MCP2221 failed: {e}" + ("" if attempt else ", retrying"))
+                self.close()
+        return None
+
+    def status(self):
+        return {name: self.state[pin] for pin, name in enumerate(PINS)}
+
+
+class RequestHandler(StreamRequestHandler):
+    """One JSON request per line, like the arguments of set_outputs, answered with
+    the pins written and the cached state.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                arg = loads(line)
+                changed = self.server.controller.apply(arg)
+                reply = {"changed": changed, "state": self.server.controller.status()}
+            except (JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+                reply = {"error": str(e)}
+            self.wfile.write(dumps(reply).encode() + b"\n")
+
+
+def serve(sock_path=SOCKET, backend=BACKEND):
+    """Resident service, owns the device between observations."""
     try:
-        mcp = MCP2221(find_devices()[0])
-    except Exception as e:
-        print(f'Failed to initialize MCP2221: {e}')
-        return
+        unlink(sock_path)
+    except FileNotFoundError:
+        pass
+    server = UnixStreamServer(sock_path, RequestHandler)
+    server.controller = Controller(backend)
+    server.controller.apply({})  # open the device
+    signal(SIGTERM, lambda signum, frame: exit(0))
+    LOGGER.info(f"Listening on {sock_path}, {server.controller.status()}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        unlink(sock_path)
+
 
+def request(arg: dict, sock_path=SOCKET, timeout=TIMEOUT):
+    """Send a request to the service, None if it is not running."""
     try:
-        if 'lna' in arg:
-            if int(arg['lna']) == 0:
-                print('LNA disable')
-                mcp.gpio0_value = True
-            else:
-                print('LNA enable')
-                mcp.gpio0_value = False
-
-        if 'freq' in arg:
-            if int(arg['freq']) > 410000000:
-                print('Set antenna to UHF')
-                mcp.gpio1_value = True
-            else:
-                print('Set antenna to VHF')
-                mcp.gpio1_value = False
-
-        if 'pa' in arg:
-            if int(arg['pa']) == 0:
-                print('PA disable')
-                mcp.gpio2_value = False
-            else:
-                print('PA enable')
-                mcp.gpio2_value = True
-
-        if 'rot' in arg:
-            if int(arg['rot']) == 0:
-                print('ROT disable')
-                mcp.gpio3_value = True
-            else:
-                print('ROT enable')
-                mcp.gpio3_value = False
-
-        if 'init' in arg:
-            print('Setting device defaults')
-            mcp.set_default_memory_target(MemoryType.Flash)
-
-            mcp.gpio0_write_function(GPIO0Function.GPIO)
-            mcp.gpio_write_powerup_direction(0, GPIODirection.Output)
-            mcp.gpio0_powerup_value = False
-            mcp.gpio_write_powerup_value(0, False)
-
-            mcp.gpio1_write_function(GPIO1Function.GPIO)
-            mcp.gpio_write_powerup_direction(0, GPIODirection.Output)
-            mcp.gpio1_powerup_value = False
-            mcp.gpio_write_powerup_value(0, False)
-
-            mcp.gpio2_write_function(GPIO2Function.GPIO)
-            mcp.gpio_write_powerup_direction(0, GPIODirection.Output)
-            mcp.gpio2_powerup_value = False
-            mcp.gpio_write_powerup_value(0, False)
-
-            mcp.gpio3_write_function(GPIO3Function.GPIO)
-            mcp.gpio_write_powerup_direction(0, GPIODirection.Output)
-            mcp.gpio3_powerup_value = False
-            mcp.gpio_write_powerup_value(0, False)
-
-    except (FailedCommandException, IOException, InvalidParameterException, InvalidReturnValueWarning) as e:
-        print(f'MCP2221 exception {e}')
+        with socket(AF_UNIX, SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(sock_path)
+            sock.sendall(dumps(arg).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                return loads(f.readline())
+    except (OSError, JSONDecodeError) as e:
+        LOGGER.debug(f"gpio service not reachable: {e}")
+        return None
+
+
+def set_outputs(arg: dict):
+    """Set the outputs in one request to the service, without it the device is
+    opened here, and the service is started for the next observation.
+    """
+    reply = request(arg)
+    if reply is not None:
+        if "error" in reply or reply["changed"] is None:
+            LOGGER.warning(f"gpio service failed: {reply}")
+        return reply
+    controller = Controller()
+    reply = {"changed": controller.apply(arg), "state": controller.status()}
+    controller.close()
+    if DAEMON:
+        Supervisor("gpio").start(["gpio.py", "--daemon"], timeout=2, wait=0)
+    return reply
 
 
 if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
     parser = argparse.ArgumentParser(argument_default=argparse.SUPPRESS)
-    parser.add_argument('-f', type=int, dest='freq', help='Select antenna based on frequency [Hz]')
-    parser.add_argument('-l', type=int, dest='lna', choices=(0, 1), help='LNA enable')
-    parser.add_argument('-p', type=int, dest='pa', choices=(0, 1), help='PA enable')
-    parser.add_argument('-r', type=int, dest='rot', choices=(0, 1), help='ROT enable')
-    parser.add_argument('-i', action='store_true', dest='init', help='Program defaults to device')
+    parser.add_argument(
+        "-f", type=int, dest="freq", help="Select antenna based on frequency [Hz]"
+    )
+    parser.add_argument("-l", type=int, dest="lna", choices=(0, 1), help="LNA enable")
+    parser.add_argument("-p", type=int, dest="pa", choices=(0, 1), help="PA enable")
+    parser.add_argument("-r", type=int, dest="rot", choices=(0, 1), help="ROT enable")
+    parser.add_argument(
+        "-i", action="store_true", dest="init", help="Program defaults to device"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true", help="Keep the device open, serve requests"
+    )
     args, oth = parser.parse_known_args()
     if len(oth) > 0:
-        print(f'Warning: unknown arguments passed {oth}')
-    set_outputs(vars(args))
+        print(f"Warning: unknown arguments passed {oth}")
+    if vars(args).pop("daemon", False):
+        serve()
+    else:
+        print(dumps(set_outputs(vars(args))))
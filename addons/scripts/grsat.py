@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 import logging
 from base64 import b64encode
-from datetime import datetime, timedelta
-from json import loads, dump, JSONDecodeError
-from os import getenv, unlink, kill, path
-from struct import unpack
-from subprocess import Popen, DEVNULL
-from sys import argv
+from datetime import datetime
+from json import loads, dumps, JSONDecodeError
+from os import getenv, replace, unlink, path, scandir, open as os_open
+from os import O_WRONLY, O_CREAT, O_EXCL
+from signal import signal, SIGTERM
+from sys import argv, executable
+from time import sleep
+
+from find_samp_rate import find_samp_rate
+from kiss import CHUNK_SIZE, KissDecoder, parse_kiss_file
+from satyaml_index import lookup, known
+from supervisor import Supervisor
 
 try:
     from imagedecode import ImageDecode
@@ -19,13 +25,11 @@ except ImportError:
 else:
     HAS_IMAGEDECODE = True
 
-logging.basicConfig(
-    format="%(name)s - %(levelname)s - %(message)s",
-    level=getattr(
-        logging, getenv("GRSAT_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
-    ),
+LOGGER = logging.getLogger("grsat")  # also imported by the hooks, leave the root
+LOGGER.setLevel(
+    getattr(logging, getenv("GRSAT_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING")))
 )
-LOGGER = logging.getLogger("grsat")
+BATCH_SIZE = 1 << 20  # read size when the whole KISS file is available
 
 
 class GrSat(object):
@@ -40,6 +44,7 @@ class GrSat(object):
         script="",
     ):
         self.cmd = cmd
+        self.args = [obs_id, freq, tle, timestamp, baud, script]
         try:
             self.obs_id = int(obs_id)
         except ValueError:
@@ -59,7 +64,7 @@ class GrSat(object):
         self.baud = baud  # can be "None"
         self.script_name = script
 
-        self.udp_port = getenv("UDP_DUMP_PORT", "57356")
+        self.udp_port = getenv("GRSAT_UDP_PORT", getenv("UDP_DUMP_PORT", "57356"))
         self.udp_host = getenv("UDP_DUMP_HOST", "")
         self.station_id = getenv("SATNOGS_STATION_ID", "0")
         self.tmp = getenv("SATNOGS_APP_PATH", "/tmp/.satnogs")
@@ -74,17 +79,38 @@ class GrSat(object):
             "1",
             "yes",
         ]
+        self.live = getenv("GRSAT_LIVE", "False").lower() in ["true", "1", "yes"]
+        try:
+            self.live_interval = float(getenv("GRSAT_LIVE_INTERVAL", "1"))
+        except ValueError:
+            self.live_interval = 1.0
+        try:
+            self.live_timeout = float(getenv("GRSAT_LIVE_TIMEOUT", "10"))
+        except ValueError:
+            self.live_timeout = 10.0
+        try:  # for gr_satellites to write the last frames to the KISS file
+            self.stop_timeout = float(getenv("GRSAT_STOP_TIMEOUT", "5"))
+        except ValueError:
+            self.stop_timeout = 5.0
+        self.following = False
+        self.data_prefix = f"data_{str(self.obs_id)}_"
+        self.suffixes = None  # timestamp -> next free _gN, seeded from data dir
 
         self.kiss_file = f"{self.tmp}/grsat_{self.obs_id}.kiss"
+        self.live_file = f"{self.kiss_file}.live"  # how far the live process got
         self.log_file = f"{self.tmp}/grsat_{self.obs_id}.log"
-        self.pid_file = f"{self.tmp}/grsat_{self.station_id}.pid"
+        self.process = Supervisor("grsat", self.station_id)
+        self.live_process = Supervisor("grsat_live", self.station_id)
         if self.tle is not None:
             self.norad = int(self.tle["tle2"].split()[1])
             self.sat_name = self.tle["tle0"]  # may start with '0 ' or not
         else:
             self.norad = 0
             self.sat_name = ""
-        self.samp_rate = self.find_samp_rate(self.baud, self.script_name)
+        # set by satnogs_hooks.py when udphub resamples for us
+        self.samp_rate = getenv("GRSAT_SAMP_RATE") or find_samp_rate(
+            self.baud, self.script_name
+        )
 
     def main(self):
         LOGGER.info(
@@ -97,14 +123,20 @@ class GrSat(object):
             self.start_gr_satellites()
         elif "stop" in self.cmd:
             self.stop_gr_satellites()
+        elif "live" in self.cmd:
+            self.follow_kiss()
         else:
             LOGGER.error("Unknown command, use start or stop")
 
     def start_gr_satellites(self):
+        if known(self.norad) is False:
+            LOGGER.info(f"No satyaml for {self.norad}, not starting gr_satellites")
+            return
+        sat = lookup(self.norad)
         LOGGER.info(f"Starting gr_satellites at {self.samp_rate} sps")
         gr_app = [
             self.app,
-            str(self.norad),
+            sat["file"] if sat else str(self.norad),  # skips the search by norad
             "--samp_rate",
             str(self.samp_rate),
             "--iq",
@@ -124,28 +156,55 @@ class GrSat(object):
 
         LOGGER.debug(" ".join(gr_app))
         try:
-            if self.keep_logs:
-                logfile = open(self.log_file, "w")
-            else:
-                logfile = DEVNULL
-            s = Popen(gr_app, stdout=logfile, stderr=logfile)
-            with open(self.pid_file, "w") as pf:
-                pf.write(str(s.pid))
-        except (FileNotFoundError, TypeError, OSError) as e:
+            self.process.start(
+                gr_app, self.log_file if self.keep_logs else None, self.stop_timeout
+            )
+        except OSError as e:
             LOGGER.warning(f"Unable to launch {self.app}: {e}")
+            return
+        if self.live:
+            self.start_live()
 
-    def stop_gr_satellites(self):
+    def start_live(self):
+        LOGGER.info("Starting live KISS processing")
         try:
-            with open(self.pid_file, "r") as pf:
-                kill(int(pf.readline()), 15)
-            unlink(self.pid_file)
-            LOGGER.info("Stopped gr_satellites")
-        except (FileNotFoundError, ProcessLookupError, OSError):
+            self.live_process.start(
+                [executable, path.abspath(__file__), "live"] + self.args,
+                timeout=self.live_timeout,
+            )
+        except OSError as e:
+            LOGGER.warning(f"Unable to launch live processing: {e}")
+
+    def stop_live(self):
+        """Tell the live process to flush the tail, returns True if it finished."""
+        if self.live_process.running() is None:
+            return False
+        if not self.live_process.stop():
+            LOGGER.warning("Live processing did not finish in time")
+            return False
+        LOGGER.info("Stopped live processing")
+        return True
+
+    def stop_gr_satellites(self):
+        if self.process.running() is None:
             LOGGER.info("No gr_satellites running")
+        elif self.process.stop():
+            LOGGER.info("Stopped gr_satellites")
+        else:
+            LOGGER.warning(f"gr_satellites did not stop in {self.stop_timeout}s")
+        live_done = self.stop_live()
 
         if path.isfile(self.kiss_file):
-            self.kiss_to_json()
-            if HAS_IMAGEDECODE:
+            if not live_done:
+                self.kiss_to_json()
+            if path.isfile(self.live_file):
+                unlink(self.live_file)
+            sat = lookup(self.norad)
+            if (
+                HAS_IMAGEDECODE
+                and (sat is None or sat["image_decoder"] is not False)
+                and not (live_done and ImageDecode.stream_decoder(self.norad))
+            ):
                 ImageDecode(
                     self.kiss_file, self.norad, f"{self.data}/data_{str(self.obs_id)}_"
                 )
@@ -159,82 +218,142 @@ class GrSat(object):
             unlink(self.log_file)
 
     @staticmethod  # from satnogs-open-flowgraph/satnogs_wrapper.py
-    def parse_kiss_file(infile):
-        ts = datetime.now()  # MUST be overwritten by timestamps in file
-        for row in infile.read().split(b"\xC0"):
-            if len(row) == 9 and row[0] == 9:  # timestamp frame
-                ts = datetime(1970, 1, 1) + timedelta(
-                    seconds=unpack(">Q", row[1:])[0] / 1000
-                )
-            if len(row) > 0 and row[0] == 0:  # data frame
-                yield ts, row[1:].replace(b"\xdb\xdc", b"\xc0").replace(
-                    b"\xdb\xdd", b"\xdb"
-                )
+    def parse_kiss_file(infile, chunk_size=CHUNK_SIZE):
+        yield from parse_kiss_file(infile, datetime.now(), chunk_size)
 
     def kiss_to_json(self):
+        """Write the frames the live process has not, all if it did not run."""
+        offset, ts = self.load_live_state()
         with open(self.kiss_file, "rb") as kf:
-            LOGGER.info("Processing kiss file")
-            dp = f"{self.data}/data_{str(self.obs_id)}_"
-            num_frames = 0
-            for ts, frame in self.parse_kiss_file(kf):
-                if len(frame) == 0:
-                    continue
-                datafile = f'{dp}{ts.strftime("%Y-%m-%dT%H-%M-%S_g")}'
-                ext = 0
-                while True:
-                    if path.isfile(f"{datafile}{ext}"):
-                        ext += 1
-                    else:
-                        datafile += str(ext)
-                        break
-                data = {
-                    "decoder_name": "gr-satellites",
-                    "pdu": b64encode(frame).decode(),
-                }
-                with open(datafile, "w") as df:
-                    dump(data, df, default=str)
-                num_frames += 1
-                LOGGER.debug(f"{datafile} len {len(frame)}")
+            if offset > 0:
+                LOGGER.info(f"Processing kiss file after the live frames, at {offset}")
+                kf.seek(offset)
+            else:
+                LOGGER.info("Processing kiss file")
+            num_frames = self.write_frames(parse_kiss_file(kf, ts, BATCH_SIZE))
             LOGGER.info(f"Total frames: {num_frames}")
 
-    @classmethod  # from satnogs_gr-satellites/find_samp_rate.py
-    def find_samp_rate(cls, baudrate, script="", sps=4, audio_samp_rate=48000):
+    def load_live_state(self):
+        """Offset after the last frame written live and its timestamp."""
         try:
-            baudrate = int(float(baudrate))
-        except ValueError:
-            baudrate = 9600
-        if baudrate < 1:
-            baudrate = 9600
-
-        if "_bpsk" in script:
-            return cls.find_decimation(baudrate, 2, audio_samp_rate, sps) * baudrate
-        elif "_fsk" in script:
-            return max(4, cls.find_decimation(baudrate, 2, audio_samp_rate)) * baudrate
-        elif "_sstv" in script:
-            return 4 * 4160 * 4
-        elif "_qubik" in script:
-            return max(4, cls.find_decimation(baudrate, 2, audio_samp_rate)) * baudrate
-        elif "_apt" in script:
-            return 4 * 4160 * 4
-        elif "_ssb" in script:
-            return cls.find_decimation(baudrate, 2, audio_samp_rate, sps) * baudrate
-        else:  # cw, fm, afsk, etc...
-            return audio_samp_rate
-
-    @staticmethod  # from gr-satnogs/python/utils.py
-    def find_decimation(baudrate, min_decimation=4, audio_samp_rate=48e3, multiple=2):
-        while min_decimation * baudrate < audio_samp_rate:
-            min_decimation = min_decimation + 1
-        if min_decimation % multiple:
-            min_decimation = min_decimation + multiple - min_decimation % multiple
-        return min_decimation
+            with open(self.live_file, "r") as f:
+                state = loads(f.read())
+            return int(state["offset"]), datetime.fromisoformat(state["ts"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.warning(f"Unable to read {self.live_file}: {e}")
+        return 0, datetime.now()
+
+    def save_live_state(self, offset, ts):
+        try:
+            with open(f"{self.live_file}.tmp", "w") as f:
+                f.write(dumps({"offset": offset, "ts": ts.isoformat()}))
+            replace(f"{self.live_file}.tmp", self.live_file)
+        except OSError as e:
+            LOGGER.warning(f"Unable to write {self.live_file}: {e}")
+
+    def follow_kiss(self):
+        """Tail the KISS file while gr_satellites runs, stops on SIGTERM."""
+        self.following = True
+        signal(SIGTERM, self.stop_following)
+        while self.following and not path.isfile(self.kiss_file):
+            sleep(self.live_interval)
+        if not path.isfile(self.kiss_file):
+            LOGGER.info("No kiss file to follow")
+            return
+        decoder = KissDecoder(datetime.now())
+        image = None
+        if HAS_IMAGEDECODE:
+            image = ImageDecode.stream(
+                self.norad, f"{self.data}/data_{str(self.obs_id)}_", self.tmp
+            )
+        num_frames = 0
+        offset = 0
+        with open(self.kiss_file, "rb") as kf:
+            LOGGER.info("Following kiss file")
+            while True:
+                following = self.following
+                num_frames += self.write_frames(decoder.read(kf), image)
+                # saved after every batch, so stop only writes what is left if
+                # this process is killed or times out
+                if kf.tell() - len(decoder.buffer) > offset:
+                    offset = kf.tell() - len(decoder.buffer)
+                    self.save_live_state(offset, decoder.ts)
+                if not following:
+                    break
+                sleep(self.live_interval)
+            num_frames += self.write_frames(decoder.flush(), image)
+        LOGGER.info(f"Total frames: {num_frames}")
+        if image is not None:
+            image.flush()
+
+    def stop_following(self, signum, frame):
+        self.following = False
+
+    def write_frames(self, frames, image=None):
+        if self.suffixes is None:
+            self.suffixes = self.scan_suffixes()
+        num_frames = 0
+        for ts, frame in frames:
+            if len(frame) == 0:
+                continue
+            if image is not None:
+                image.feed((ts, frame))
+            datafile = self.write_frame(ts, frame)
+            if datafile is None:
+                continue
+            num_frames += 1
+            LOGGER.debug(f"{datafile} len {len(frame)}")
+        return num_frames
+
+    def write_frame(self, ts, frame):
+        stamp = ts.strftime("%Y-%m-%dT%H-%M-%S")
+        data = dumps(
+            {
+                "decoder_name": "gr-satellites",
+                "pdu": b64encode(frame).decode(),
+            }
+        ).encode()
+        ext = self.suffixes.get(stamp, 0)
+        while True:
+            datafile = f"{self.data}/{self.data_prefix}{stamp}_g{ext}"
+            try:
+                fd = os_open(datafile, O_WRONLY | O_CREAT | O_EXCL, 0o666)
+                break
+            except FileExistsError:
+                ext += 1
+            except OSError as e:
+                LOGGER.error(f"Unable to write {datafile}: {e}")
+                return None
+        self.suffixes[stamp] = ext + 1
+        with open(fd, "wb") as df:
+            df.write(data)
+        return datafile
+
+    def scan_suffixes(self):
+        """Find the next free _gN suffix per timestamp with one directory scan."""
+        suffixes = {}
+        try:
+            with scandir(self.data) as it:
+                for entry in it:
+                    if not entry.name.startswith(self.data_prefix):
+                        continue
+                    name = entry.name[len(self.data_prefix) :]
+                    stamp, sep, ext = name.rpartition("_g")
+                    if sep and ext.isdigit():
+                        suffixes[stamp] = max(suffixes.get(stamp, 0), int(ext) + 1)
+        except OSError as e:
+            LOGGER.warning(f"Unable to scan {self.data}: {e}")
+        return suffixes
 
 
 if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
     if len(argv) != 8:
         LOGGER.error(
             "Wrong number of arguments, expected: "
-            "<start|stop> {{ID}} {{FREQ}} {{TLE}} {{TIMESTAMP}} {{BAUD}} {{SCRIPT_NAME}}"
+            "<start|stop|live> {{ID}} {{FREQ}} {{TLE}} {{TIMESTAMP}} {{BAUD}} {{SCRIPT_NAME}}"
         )
         exit(0)
     GrSat(argv[1], argv[2], argv[3], argv[4], argv[5], argv[6], argv[7]).main()
@@ -1,23 +1,173 @@
 #!/usr/bin/env python3
 import logging
-from datetime import datetime, timedelta
-from io import BytesIO
-from os import path, getenv
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from glob import glob
+from importlib.util import module_from_spec, spec_from_file_location
+from json import dump
+from os import makedirs, path, getenv, scandir, unlink
 from pathlib import Path
-from struct import unpack
+from re import compile as re_compile
+from struct import Struct
 from subprocess import Popen, DEVNULL
-from sys import argv
+from sys import argv, modules
+from time import monotonic
 
-logging.basicConfig(
-    format="%(name)s - %(levelname)s - %(message)s",
-    level=getattr(
-        logging, getenv("GRSAT_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
-    ),
+from kiss import parse_kiss_file
+
+LOGGER = logging.getLogger("imagedecode")  # also imported by the hooks, leave the root
+LOGGER.setLevel(
+    getattr(logging, getenv("GRSAT_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING")))
+)
+
+try:
+    MAX_IMAGE_SIZE = int(getenv("IMAGEDECODE_MAX_SIZE", 8 << 20))
+    MAX_IMAGE_GAP = int(getenv("IMAGEDECODE_MAX_GAP", 256 << 10))
+    MIN_IMAGE_FILL = float(getenv("IMAGEDECODE_MIN_FILL", 0))
+    PREVIEW_INTERVAL = float(getenv("IMAGEDECODE_PREVIEW_INTERVAL", 10))
+    BATCH_PASS_GAP = float(getenv("IMAGEDECODE_BATCH_GAP", 900))
+except ValueError:
+    MAX_IMAGE_SIZE = 8 << 20
+    MAX_IMAGE_GAP = 256 << 10
+    MIN_IMAGE_FILL = 0
+    PREVIEW_INTERVAL = 10
+    BATCH_PASS_GAP = 900
+
+PLUGIN_PATH = getenv(
+    "IMAGEDECODE_PLUGIN_PATH",
+    "/usr/lib/python3/dist-packages/satellites/satyaml/imagedecode",
 )
-LOGGER = logging.getLogger("imagedecode")
+PLUGIN_GROUP = "satnogs.imagedecode"  # entry point name is the norad id
+_SUPPORTED_NORAD = re_compile(r"supported_norad\s*=\s*\[([\d\s,]*)\]")
+
+Frame = namedtuple("Frame", ["ts", "data"])  # data is the raw frame as bytes
+_EXPORT_NORAD = re_compile(r"^(\d+)-")  # satnogs db export: norad-user-date.csv
+
+
+def parse_timestamp(text):
+    """YYYY-MM-DD HH:MM:SS[.ffffff], fixed positions instead of strptime."""
+    if len(text) < 19 or text[4] != "-" or text[7] != "-" or text[13] != ":":
+        raise ValueError(f"Bad timestamp {text}")
+    micro = 0
+    if len(text) > 19:
+        if text[19] != ".":
+            raise ValueError(f"Bad timestamp {text}")
+        micro = int(text[20:26].ljust(6, "0"))
+    return datetime(
+        int(text[0:4]),
+        int(text[5:7]),
+        int(text[8:10]),
+        int(text[11:13]),
+        int(text[14:16]),
+        int(text[17:19]),
+        micro,
+    )
+
+
+class ChunkStore(object):
+    """Sparse image buffer, keeps the received ranges and builds the image on write.
+
+    Chunks outside of max_size are rejected, and anything following a gap
+    larger than max_gap is treated as a bogus address and left out.
+    """
+
+    def __init__(self, max_size=MAX_IMAGE_SIZE, max_gap=MAX_IMAGE_GAP):
+        self.max_size = max_size
+        self.max_gap = max_gap
+        self.chunks = {}  # address -> payload, last write wins
+        self.accepted = 0
+        self.rejected = 0
+        self.dirty = None  # (start, end) changed since the last write
+
+    def __len__(self):
+        return self.ranges()[-1][1] if self.chunks else 0
+
+    def write(self, addr, payload):
+        if addr < 0 or addr + len(payload) > self.max_size:
+            LOGGER.debug(f"Rejected chunk at {addr} len {len(payload)}")
+            self.rejected += 1
+            return False
+        self.chunks[addr] = payload
+        self.accepted += 1
+        end = addr + len(payload)
+        if self.dirty is None:
+            self.dirty = (addr, end)
+        else:
+            self.dirty = (min(self.dirty[0], addr), max(self.dirty[1], end))
+        return True
+
+    def clear(self):
+        self.chunks.clear()
+        self.accepted = 0
+        self.rejected = 0
+        self.dirty = None
+
+    def ranges(self):
+        """Received ranges as sorted, merged (start, end) tuples."""
+        ranges = []
+        for addr in sorted(self.chunks):
+            end = addr + len(self.chunks[addr])
+            if ranges and addr - ranges[-1][1] > self.max_gap:
+                break  # outlier, everything after this is dropped
+            if ranges and addr <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([addr, end])
+        return ranges
+
+    def gaps(self):
+        """Missing (start, end) ranges between the start of the image and the end."""
+        gaps = []
+        pos = 0
+        for start, end in self.ranges():
+            if start > pos:
+                gaps.append((pos, start))
+            pos = end
+        return gaps
+
+    def fill(self):
+        """Percentage of the image that has been received."""
+        ranges = self.ranges()
+        if not ranges:
+            return 0.0
+        return 100.0 * sum(end - start for start, end in ranges) / ranges[-1][1]
+
+    def getvalue(self, start=0, end=None):
+        size = len(self)
+        end = size if end is None else min(end, size)
+        image = bytearray(max(0, end - start))
+        for addr, payload in self.chunks.items():
+            if addr < end and addr + len(payload) > start:
+                part = payload[max(0, start - addr) : end - addr]
+                pos = max(0, addr - start)
+                image[pos : pos + len(part)] = part
+        return image
+
+
+class ImageParts(object):
+    """Reassembly buffer for one image, keeps track of the received chunks."""
+
+    def __init__(self):
+        self.data = ChunkStore()
+        self.chunks = set()
+        self.total = 0
+
+    def write(self, chunk, addr, payload):
+        if self.data.write(addr, payload):
+            self.chunks.add(chunk)
+        self.total = max(self.total, chunk + 1)
+
+    def missing(self):
+        return sorted(set(range(self.total)) - self.chunks)
 
 
 class ImageDecode(object):
+    supported_norad = []
+    streaming = False  # implements add_frame()
+    batch_decode = False  # implements decode(), of self.frames instead of a file
+
     def __init__(self, frame_file=None, norad_id=None, image_file=None):
         self.frame_file = frame_file
         try:
@@ -26,35 +176,79 @@ class ImageDecode(object):
             self.norad_id = None
         self.image_file = image_file
         self.frames = []
-        self.imagedata = BytesIO()
-        if frame_file is None:
-            self.image_name = ""
-            self.image_ts = ""
-        elif image_file is None:
+        self.imagedata = ChunkStore()
+        if image_file is not None:
+            self.image_name = image_file
+            self.image_ts = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+        elif frame_file is not None:
             self.image_name = path.splitext(frame_file)[0]
             self.image_ts = ""
         else:
-            self.image_name = image_file
-            self.image_ts = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+            self.image_name = ""
+            self.image_ts = ""
         self.image_ext = ".jpg"
-        if self.norad_id is not None:
+        self.last_update = 0
+        self.preview_path = None
+        self.reports = []  # one per image written or skipped
+        if self.norad_id is not None and frame_file is not None:
             self.main()
 
     def main(self):
-        if self.norad_id in StratosatDecode.supported_norad:  # Geoscan, StratoSat
-            StratosatDecode(self.frame_file, self.norad_id, self.image_file)
-        elif self.norad_id in Cas5aDecode.supported_norad:  # CAS-5A
-            Cas5aDecode(self.frame_file, self.norad_id, self.image_file)
-        elif self.norad_id in SirenDecode.supported_norad:  # Siren
-            SirenDecode(self.frame_file, self.norad_id, self.image_file)
-        elif self.norad_id in Lucky7Decode.supported_norad:  # Lucky-7
-            Lucky7Decode(self.frame_file, self.norad_id, self.image_file)
-        elif self.norad_id in SharjahsatDecode.supported_norad:  # Sharjahsat-1
-            SharjahsatDecode(self.frame_file, self.norad_id, self.image_file)
-        elif self.norad_id in ExternalDecode.supported_norad:  # JY1Sat
-            ExternalDecode(self.frame_file, self.norad_id, self.image_file)
-        else:
+        decoder = self.get_decoder(self.norad_id)
+        if decoder is None:
             LOGGER.debug(f"No image decoder found for {self.norad_id}")
+        else:
+            decoder(self.frame_file, self.norad_id, self.image_file)
+
+    @staticmethod
+    def get_decoder(norad_id):
+        """Decoder class for norad_id, plugins are only loaded when first asked for."""
+        if norad_id not in DECODERS:
+            DECODERS[norad_id] = load_plugin(norad_id)
+        return DECODERS[norad_id]
+
+    @staticmethod
+    def image_id(data):
+        """Id of the image a frame belongs to, None if the frames carry none."""
+        return None
+
+    @classmethod
+    def stream_decoder(cls, norad_id):
+        """Decoder class that can be fed frame by frame, None if there is none."""
+        decoder = cls.get_decoder(norad_id)
+        if decoder is None or not decoder.streaming:
+            return None
+        return decoder
+
+    @classmethod
+    def stream(cls, norad_id, image_file, preview_path=None):
+        """Start a streaming decoder, feed() it frames and flush() at the end.
+
+        With preview_path set, the image is updated there while frames arrive
+        and only written to image_file on flush, so it is not uploaded half done.
+        """
+        decoder = cls.stream_decoder(norad_id)
+        if decoder is None:
+            return None
+        decoder = decoder(None, norad_id, image_file)
+        decoder.preview_path = preview_path
+        return decoder
+
+    def feed(self, frame):
+        self.add_frame(frame)
+        self.update()
+
+    def flush(self):
+        """Write the final image the same way as a batch decode, with its report,
+        and drop the preview.
+        """
+        preview = self.preview_file()
+        self.write_image()
+        if preview != self.reports[-1]["file"] and path.isfile(preview):
+            try:
+                unlink(preview)
+            except OSError as e:
+                LOGGER.warning(f"Unable to remove preview {preview}: {e}")
 
     def parse_file(self):
         try:
@@ -71,255 +265,344 @@ class ImageDecode(object):
                 LOGGER.debug(f"Bad hex file row, missing '|' separator")
                 continue
             data = row.split("|")
-            if len(data) == 2 or len(data) == 4:  # satnogs db export old/new
-                self.frames.append(
-                    (
-                        datetime.strptime(data[0].strip(), "%Y-%m-%d %H:%M:%S"),
-                        data[1].strip(),
-                    )
-                )
-            elif len(data) == 3:  # getkiss+
-                self.frames.append(
-                    (
-                        datetime.strptime(data[0].strip(), "%Y-%m-%d %H:%M:%S.%f"),
-                        data[2].strip(),
-                    )
-                )
-            else:
-                LOGGER.debug(f"Unknown hex line format")
+            try:
+                if len(data) == 2 or len(data) == 4:  # satnogs db export old/new
+                    ts = parse_timestamp(data[0].strip())
+                    frame = bytes.fromhex(data[1])
+                elif len(data) == 3:  # getkiss+
+                    ts = parse_timestamp(data[0].strip())
+                    frame = bytes.fromhex(data[2])
+                else:
+                    LOGGER.debug(f"Unknown hex line format")
+                    continue
+            except ValueError:
+                LOGGER.debug("Bad hex file row, unable to parse")
+                continue
+            self.frames.append(Frame(ts, frame))
 
     def parse_kiss_file(self, infile):
-        self.frames = []
-        ts = datetime.utcnow()  # MUST be overwritten by timestamps in file
-        for row in infile.read().split(b"\xC0"):
-            if len(row) == 9 and row[0] == 9:  # timestamp frame
-                ts = datetime(1970, 1, 1) + timedelta(
-                    seconds=unpack(">Q", row[1:])[0] / 1000
-                )
-            if len(row) > 0 and row[0] == 0:  # data frame
-                self.frames.append(
-                    (
-                        ts,
-                        row[1:]
-                        .replace(b"\xdb\xdc", b"\xc0")
-                        .replace(b"\xdb\xdd", b"\xdb")
-                        .hex(bytes_per_sep=2),
-                    )
-                )
+        self.frames = [
+            Frame(ts, frame) for ts, frame in parse_kiss_file(infile, datetime.utcnow())
+        ]
+
+    def write_images(self, images):
+        for num_images, image_id in enumerate(sorted(images)):
+            image = images[image_id]
+            missing = image.missing()
+            LOGGER.info(
+                f"Image {num_images}: {len(image.chunks)}/{image.total} chunks, "
+                f"missing {missing[:10]}{'...' if len(missing) > 10 else ''}"
+            )
+            self.imagedata = image.data
+            self.image_ext = f"_{num_images}.jpg"
+            self.write_image()
+            self.reports[-1].update(
+                chunks=len(image.chunks), total_chunks=image.total, missing=missing
+            )
 
     def write_image(self):
-        if self.imagedata.getbuffer().nbytes == 0:
-            LOGGER.warning(f"No image data found in {self.frame_file}")
+        report = {
+            "file": None,
+            "size": len(self.imagedata),
+            "fill": round(self.imagedata.fill(), 1),
+            "gaps": self.imagedata.gaps(),
+            "frames_used": self.imagedata.accepted,
+            "frames_rejected": self.imagedata.rejected,
+        }
+        self.reports.append(report)
+        if len(self.imagedata) == 0:
+            LOGGER.warning(f"No image data found in {self.frame_file or 'the frames'}")
             return
-        image_file = f"{self.image_name}{self.image_ts}{self.image_ext}"
+        fill = report["fill"]
+        LOGGER.info(
+            f"Image fill {fill:.1f}%, {len(report['gaps'])} gaps, "
+            f"{self.imagedata.rejected} rejected chunks"
+        )
+        if fill < MIN_IMAGE_FILL:
+            LOGGER.info(f"Skipping image, less than {MIN_IMAGE_FILL}% received")
+            return
+        image_file = self.image_path()
+        report["file"] = image_file
         LOGGER.info(f"Writing image to: {image_file}")
         with open(image_file, "wb") as f:
-            f.write(self.imagedata.getbuffer())
+            f.write(self.imagedata.getvalue())
+
+    def update(self, force=False):
+        """Rewrite the changed part of the image, at most every PREVIEW_INTERVAL."""
+        if self.imagedata.dirty is None:
+            return
+        if not force and monotonic() - self.last_update < PREVIEW_INTERVAL:
+            return  # before len(), that sorts all the chunks
+        size = len(self.imagedata)
+        if size == 0:
+            return
+        self.last_update = monotonic()
+        image_file = self.preview_file()
+        start, end = self.imagedata.dirty
+        exists = path.isfile(image_file)
+        if not exists:
+            start, end = 0, size
+        LOGGER.debug(f"Updating {image_file} {start}-{end}")
+        try:
+            with open(image_file, "r+b" if exists else "w+b") as f:
+                f.seek(start)
+                f.write(self.imagedata.getvalue(start, end))
+                f.truncate(size)
+        except OSError as e:
+            LOGGER.warning(f"Unable to update {image_file}: {e}")
+            return
+        self.imagedata.dirty = None
+
+    def image_path(self):
+        return f"{self.image_name}{self.image_ts}{self.image_ext}"
+
+    def preview_file(self):
+        if self.preview_path is None:
+            return self.image_path()
+        return path.join(self.preview_path, path.basename(self.image_path()))
 
 
-class StratosatDecode(ImageDecode):
+class StratosatDecode(ImageDecode):  # Geoscan, StratoSat
     supported_norad = [53385, 57167]
+    streaming = True
+    batch_decode = True
+    header = Struct("<2sB2sHB")  # cmd, len, mode, addr low 16, addr high 8
 
     def __init__(self, frame_file, norad_id, image_file):
+        self.start = None  # (cmd_match, offset) from the start frame
+        self.pending = []  # frames received before the start frame
         super().__init__(frame_file, norad_id, image_file)
 
     def main(self):
         self.parse_file()
-        self.imagedata.seek(0)
-        self.imagedata.truncate()
-        cmd_match = "0200"  # default to Stratosat TK-1, 0100 Geoscan-Edelveis
-        offset = 0
-        hr = False
-        for ts, row in self.frames:  # find start frame, memory offset, detect lr/hr
-            if len(row) != 128:
-                continue
-            if row[16:22].upper() == "FFD8FF":
-                offset = int((row[14:16] + row[12:14] + row[10:12]), 16)
-                hr = row[6:10].upper() == "2098"
-                if hr:
-                    offset = 0
-                cmd_match = row[0:4].upper()
-                break
-        LOGGER.debug(f"Stratosat: cmd_match={cmd_match}, offset={offset}, hr={hr}")
-        for ts, row in self.frames:
-            if len(row) != 128:
-                continue
-            cmd = row[0:4]
-            addr = int((row[14:16] + row[12:14] + row[10:12]), 16) - offset
-            dlen = (int(row[4:6], 16) + 2) * 2
-            payload = row[16:dlen]
-            if cmd == cmd_match and addr >= 0:
-                self.imagedata.seek(addr)
-                self.imagedata.write(bytes.fromhex(payload))
+        self.decode()
+
+    def decode(self):
+        self.imagedata.clear()
+        for frame in self.frames:
+            self.add_frame(frame)
+        self.resolve()
         self.write_image()
 
+    def add_frame(self, frame):
+        ts, row = frame
+        if len(row) != 64:
+            return
+        if self.start is None:
+            if row[8:11] != b"\xff\xd8\xff":  # wait for start frame
+                self.pending.append(row)
+                return
+            cmd, dlen, mode, addr, addr_hi = self.header.unpack_from(row)
+            hr = mode == b"\x20\x98"  # detect lr/hr
+            self.start = (cmd, 0 if hr else addr | addr_hi << 16)
+            LOGGER.debug(
+                f"Stratosat: cmd_match={cmd.hex()}, offset={self.start[1]}, hr={hr}"
+            )
+            self.add_pending()
+        self.add(row)
+
+    def flush(self):
+        self.resolve()
+        super().flush()
+
+    def resolve(self):
+        if self.start is None:  # default to Stratosat TK-1, 0100 Geoscan-Edelveis
+            self.start = (b"\x02\x00", 0)
+            self.add_pending()
+
+    def add_pending(self):
+        for row in self.pending:
+            self.add(row)
+        self.pending = []
+
+    def add(self, row):
+        cmd_match, offset = self.start
+        cmd, dlen, mode, addr, addr_hi = self.header.unpack_from(row)
+        addr = (addr | addr_hi << 16) - offset
+        if cmd == cmd_match and addr >= 0:
+            self.imagedata.write(addr, row[8 : dlen + 2])
+
 
 class Cas5aDecode(ImageDecode):
     supported_norad = [54684]
+    batch_decode = True
+    header = Struct(">BHHH9s")  # at 16: type, total, sequence, length, photo id
 
     def __init__(self, frame_file, norad_id, image_file):
         super().__init__(frame_file, norad_id, image_file)
 
     def main(self):
         self.parse_file()
-        num_images = 0
-        for pid in set(self.get_photo_ids()):
-            self.parse_frames(pid)
-            self.image_ext = f"_{num_images}.jpg"
-            self.write_image()
-            num_images += 1
-
-    def parse_frames(self, pid):
-        self.imagedata.seek(0)
-        self.imagedata.truncate()
+        self.decode()
+
+    def decode(self):
+        self.write_images(self.parse_frames())
+
+    @classmethod
+    def image_id(cls, data):
+        if len(data) < 32:
+            return None
+        ftype, ftot, fseq, flen, pid = cls.header.unpack_from(data, 16)
+        if (
+            ftype != 3
+            or pid[0] < 22  # year
+            or pid[0] > 25  # year
+            or pid[1] > 12  # month
+            or pid[2] > 31  # day
+            or pid[3] > 24  # hour
+            or pid[4] > 60  # minute
+            or pid[5] > 60  # second
+        ):  # sanity check
+            return None
+        return pid.hex()
+
+    def parse_frames(self):
+        """Route every frame to the image of its photo id in a single pass."""
+        images = {}
         dlen = 240  # assumed maxed out frames to multiply by sequence number
-        hlen = 32  # header length
-        for ts, row in self.frames:
-            if len(row) < 64:
-                continue
-            if pid != row[46:64] or int(row[32:34], 16) != 3:
-                continue
-            ftot = int(row[34:38], 16)
-            fseq = int(row[38:42], 16)
-            flen = int(row[42:46], 16) * 2 + hlen
-            if fseq <= ftot and flen <= len(row):
-                self.imagedata.seek((fseq - 1) * dlen)
-                self.imagedata.write(bytes.fromhex(row[64:flen]))
-
-    def get_photo_ids(self):
-        pids = set()
+        hlen = 16  # header length
         for ts, row in self.frames:
-            if len(row) < 64:
-                continue
-            if (
-                int(row[32:34], 16) != 3
-                or int(row[46:48], 16) < 22  # year
-                or int(row[46:48], 16) > 25  # year
-                or int(row[48:50], 16) > 12  # month
-                or int(row[50:52], 16) > 31  # day
-                or int(row[52:54], 16) > 24  # hour
-                or int(row[54:56], 16) > 60  # minute
-                or int(row[56:58], 16) > 60  # second
-            ):  # sanity check
+            if self.image_id(row) is None:
                 continue
-            pids.add(row[46:64])
-        return pids
+            ftype, ftot, fseq, flen, pid = self.header.unpack_from(row, 16)
+            flen += hlen
+            if 0 < fseq <= ftot and flen <= len(row):
+                image = images.setdefault(pid, ImageParts())
+                image.total = max(image.total, ftot)
+                image.write(fseq - 1, (fseq - 1) * dlen, row[32:flen])
+        return images
 
 
 class SirenDecode(ImageDecode):
     supported_norad = [53384]
+    streaming = True
+    batch_decode = True
+    header = Struct("<2s7xI")  # at 16: cmd, addr
+    cmd_match = b"\x24\x0c"
 
     def __init__(self, frame_file, norad_id, image_file):
+        self.offset = None  # memory offset from the start frame
+        self.pending = []  # frames received before the start frame
         super().__init__(frame_file, norad_id, image_file)
 
     def main(self):
         self.parse_file()
-        self.imagedata.seek(0)
-        self.imagedata.truncate()
-        cmd_match = "240C"
-        offset = 0
-        for ts, row in self.frames:  # find start frame, memory offset, detect lr/hr
-            if len(row) < 64:
-                continue
-            if row[58:64].upper() == "FFD8FF":
-                offset = int((row[52:54] + row[50:52]), 16)
-                break
-        LOGGER.debug(f"Siren: cmd_match={cmd_match}, offset={offset}")
-        for ts, row in self.frames:
-            if len(row) < 64:
-                continue
-            cmd = row[32:36]
-            addr = int((row[56:58] + row[54:56] + row[52:54] + row[50:52]), 16) - offset
-            payload = row[58:]
-            if cmd == cmd_match and addr >= 0:
-                self.imagedata.seek(addr)
-                self.imagedata.write(bytes.fromhex(payload))
+        self.decode()
+
+    def decode(self):
+        self.imagedata.clear()
+        for frame in self.frames:
+            self.add_frame(frame)
+        self.resolve()
         self.write_image()
 
+    def add_frame(self, frame):
+        ts, row = frame
+        if len(row) < 32:
+            return
+        if self.offset is None:
+            if row[29:32] != b"\xff\xd8\xff":  # wait for start frame
+                self.pending.append(row)
+                return
+            self.offset = self.header.unpack_from(row, 16)[1] & 0xFFFF
+            LOGGER.debug(
+                f"Siren: cmd_match={self.cmd_match.hex()}, offset={self.offset}"
+            )
+            self.add_pending()
+        self.add(row)
+
+    def flush(self):
+        self.resolve()
+        super().flush()
+
+    def resolve(self):
+        if self.offset is None:
+            self.offset = 0
+            self.add_pending()
+
+    def add_pending(self):
+        for row in self.pending:
+            self.add(row)
+        self.pending = []
+
+    def add(self, row):
+        cmd, addr = self.header.unpack_from(row, 16)
+        addr -= self.offset
+        if cmd == self.cmd_match and addr >= 0:
+            self.imagedata.write(addr, row[29:])
+
 
 class Lucky7Decode(ImageDecode):  # WIP
     supported_norad = [44406]
+    batch_decode = True
+    header = Struct(">BHHH")  # id, obc, mcu, packets
 
     def __init__(self, frame_file, norad_id, image_file):
         super().__init__(frame_file, norad_id, image_file)
 
     def main(self):
         self.parse_file()
-        num_images = 0
-        for pid in set(self.get_packet_ids()):
-            self.parse_frames(pid)
-            self.image_ext = f"_{num_images}.jpg"
-            self.write_image()
-            num_images += 1
-
-    def get_packet_ids(self):
-        pids = []
+        self.decode()
+
+    def decode(self):
+        self.write_images(self.parse_frames())
+
+    @classmethod
+    def image_id(cls, data):
+        if len(data) < 35:
+            return None
+        oid, obc, mcu, packets = cls.header.unpack_from(data)
+        if (oid == 128 or oid == 0) and obc >= 49152:
+            return str(packets)
+        return None
+
+    def parse_frames(self):
+        """Route every frame to the image of its packet id in a single pass."""
+        images = {}
         offset = 49152  # 0xC000
-        for row in self.frames:
-            if len(row) < 70:
+        for ts, row in self.frames:
+            if len(row) < 35:
                 continue
-            oid = int(row[0:2], 16)
-            obc = int(row[2:6], 16)
-            packets = int(row[10:14], 16)
+            oid, obc, mcu, packets = self.header.unpack_from(row)
             if (oid == 128 or oid == 0) and obc >= offset:
-                pids.append(packets)
-        return pids
-
-    def parse_frames(self, pid):
-        offset = 49152  # 0xC000
-        for row in self.frames:
-            if len(row) < 70:
-                continue
-            oid = int(row[0:2], 16)
-            obc = int(row[2:6], 16)
-            # mcu = int(row[6:10], 16)
-            packets = int(row[10:14], 16)
-            payload = row[14:70]
-            # print(f'ID {oid:4}, OBC {obc:5}, MCU {mcu:5}, packets {packets:5}: {row[0:14]} {payload}')
-            if (oid == 128 or oid == 0) and obc >= offset and packets == pid:
-                self.imagedata.seek((obc - offset) * 28)
-                self.imagedata.write(bytes.fromhex(payload))
+                image = images.setdefault(packets, ImageParts())
+                image.write(obc - offset, (obc - offset) * 28, row[7:35])
+        return images
 
 
 class SharjahsatDecode(ImageDecode):  # WIP
     supported_norad = [55104]
+    batch_decode = True
+    header = Struct("<4sBBH")  # at 16: id, type, len, addr (it's actually 32bit)
 
     def __init__(self, frame_file, norad_id, image_file):
         super().__init__(frame_file, norad_id, image_file)
 
     def main(self):
         self.parse_file()
-        self.imagedata.seek(0)
-        self.imagedata.truncate()
+        self.decode()
+
+    def decode(self):
+        self.imagedata.clear()
         lastframe = 0
         dsize = 246
-        for row in self.frames:
-            if len(row) < 64:
+        for ts, row in self.frames:
+            if len(row) < 32:
                 continue
-            if "FFD8FF" in row[52:58]:
-                lastframe = int(row[46:48] + row[44:46], 16)  # it's actually 32bit
-                dsize = int(row[42:44], 16)  # usually 246
-                print(f"dsize {dsize}, lastframe {lastframe}")
+            if row[26:29] == b"\xff\xd8\xff":
+                did, dt, dsize, lastframe = self.header.unpack_from(row, 16)
+                LOGGER.debug(f"dsize {dsize}, lastframe {lastframe}")  # usually 246
                 break
-        for row in self.frames:
-            if len(row) < 64:
+        for ts, row in self.frames:
+            if len(row) < 32:
                 continue
-            did = bytes.fromhex(row[32:40])
-            dt = row[40:42]
-            dlen = int(row[42:44], 16)
-            addr = int(row[46:48] + row[44:46], 16)  # it's actually 32bit
-            # header = row[0:52]
-            payload = row[52:]
-            # print(f'{call} dt:{dt} dl:{dlen} a:{addr} {header} {payload}')
-            if did == b"ESER" and dt == "41":
-                # if dlen != 246:
-                #     print(f"dsize {dlen}, addr {addr}\t{row}")
-                self.imagedata.seek(dsize * (lastframe - addr))
-                self.imagedata.write(bytes.fromhex(payload))
+            did, dt, dlen, addr = self.header.unpack_from(row, 16)
+            if did == b"ESER" and dt == 0x41 and addr <= lastframe:
+                self.imagedata.write(dsize * (lastframe - addr), row[26:])
         self.write_image()
 
 
-class ExternalDecode(ImageDecode):
+class ExternalDecode(ImageDecode):  # JY1Sat
     supported_norad = [43803]
 
     def __init__(self, frame_file, norad_id, image_file):
@@ -343,14 +626,193 @@ class ExternalDecode(ImageDecode):
             f.unlink(missing_ok=True)
 
 
+DECODERS = {
+    norad: decoder
+    for decoder in (
+        StratosatDecode,
+        Cas5aDecode,
+        SirenDecode,
+        Lucky7Decode,
+        SharjahsatDecode,
+        ExternalDecode,
+    )
+    for norad in decoder.supported_norad
+}
+
+
+def plugin_files():
+    """Map norad id to drop-in decoder file, read from the source without importing."""
+    plugins = {}
+    for plugin in sorted(Path(PLUGIN_PATH).glob("*.py")):
+        try:
+            match = _SUPPORTED_NORAD.search(plugin.read_text())
+        except (OSError, UnicodeDecodeError) as e:
+            LOGGER.warning(f"Unable to read plugin {plugin}: {e}")
+            continue
+        if match is None:
+            LOGGER.debug(f"No supported_norad found in plugin {plugin}")
+            continue
+        for norad in match.group(1).replace(",", " ").split():
+            plugins.setdefault(int(norad), plugin)
+    return plugins
+
+
+def load_plugin(norad_id):
+    """Find a decoder for norad_id among entry points and drop-in files."""
+    from importlib.metadata import entry_points  # slow import, only when needed
+
+    for ep in entry_points(group=PLUGIN_GROUP):
+        if ep.name == str(norad_id):
+            try:
+                return ep.load()
+            except Exception as e:
+                LOGGER.error(f"Unable to load decoder plugin {ep.value}: {e}")
+                return None
+    plugin = plugin_files().get(norad_id)
+    if plugin is None:
+        return None
+    # plugins import ImageDecode from here, also when running as a script
+    modules.setdefault("imagedecode", modules[__name__])
+    try:
+        spec = spec_from_file_location(f"imagedecode_{plugin.stem}", plugin)
+        module = module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except Exception as e:
+        LOGGER.error(f"Unable to load decoder plugin {plugin}: {e}")
+        return None
+    for obj in vars(module).values():
+        if isinstance(obj, type) and norad_id in getattr(obj, "supported_norad", []):
+            LOGGER.debug(f"Loaded {obj.__name__} from {plugin}")
+            return obj
+    LOGGER.warning(f"No decoder for {norad_id} in plugin {plugin}")
+    return None
+
+
+def export_files(sources):
+    """Files in the directories and matching the globs given."""
+    files = []
+    for source in sources:
+        if path.isdir(source):
+            files += sorted(e.path for e in scandir(source) if e.is_file())
+        else:
+            files += sorted(glob(source))
+    return files
+
+
+def parse_export(frame_file, norad_id=None):
+    """Norad id and frames of one export, the id is taken from the file name
+    (satnogs db: norad-user-date.csv) if not given.
+    """
+    if norad_id is None:
+        match = _EXPORT_NORAD.match(path.basename(frame_file))
+        norad_id = int(match.group(1)) if match else None
+    reader = ImageDecode()
+    reader.frame_file = frame_file
+    reader.parse_file()
+    return frame_file, norad_id, reader.frames
+
+
+def group_frames(decoder, frames, gap=BATCH_PASS_GAP):
+    """Split the frames of one satellite by image id, or by pass when the
+    decoder has no image id. Frames listed in several exports are used once.
+    """
+    by_id = decoder.image_id is not ImageDecode.image_id
+    groups = {}
+    last = None
+    for frame in sorted(set(frames)):
+        if by_id:
+            key = decoder.image_id(frame.data)
+            if key is None:
+                continue
+        elif last is None or (frame.ts - last).total_seconds() > gap:
+            key = frame.ts.strftime("%Y-%m-%dT%H-%M-%S")
+        last = frame.ts
+        groups.setdefault(key, []).append(frame)
+    return groups
+
+
+def decode_group(norad_id, key, frames, out_dir):
+    """Decode one group of frames, a report is written next to every image."""
+    decoder = ImageDecode.get_decoder(norad_id)(
+        None, norad_id, path.join(out_dir, f"{norad_id}_{key}")
+    )
+    decoder.image_ts = ""
+    decoder.frame_file = f"{norad_id} {key}"  # for the log
+    decoder.frames = frames
+    decoder.decode()
+    for report in decoder.reports:
+        report.update(
+            norad=norad_id,
+            group=key,
+            frames=len(frames),
+            first=str(frames[0].ts),
+            last=str(frames[-1].ts),
+        )
+        if report["file"] is not None:
+            with open(f"{path.splitext(report['file'])[0]}.json", "w") as f:
+                dump(report, f, indent=1)
+    return decoder.reports
+
+
+def batch(sources, out_dir, norad_id=None, jobs=None):
+    """Decode every image found in many exports, parsing and decoding in parallel."""
+    makedirs(out_dir, exist_ok=True)
+    frames = {}
+    reports = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        files = export_files(sources)
+        for frame_file, norad, parsed in executor.map(
+            parse_export, files, [norad_id] * len(files), chunksize=4
+        ):
+            if norad is None:
+                LOGGER.warning(f"No norad id for {frame_file}, use -n")
+                continue
+            frames.setdefault(norad, []).extend(parsed)
+        futures = []
+        for norad, sat_frames in frames.items():
+            decoder = ImageDecode.get_decoder(norad)
+            if decoder is None:
+                LOGGER.warning(f"No image decoder found for {norad}")
+                continue
+            if not decoder.batch_decode:
+                LOGGER.warning(f"{decoder.__name__} only decodes single files")
+                continue
+            for key, group in group_frames(decoder, sat_frames).items():
+                futures.append(
+                    executor.submit(decode_group, norad, key, group, out_dir)
+                )
+        for future in futures:
+            reports += future.result()
+    return reports
+
+
 if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
     LOGGER.setLevel(logging.INFO)
-    if len(argv) == 3:
+    if len(argv) > 1 and argv[1] in ["-b", "--batch"]:
+        parser = argparse.ArgumentParser(
+            description="Decode images from many frame exports at once"
+        )
+        parser.add_argument("-b", "--batch", action="store_true")
+        parser.add_argument("sources", nargs="+", help="directories or globs")
+        parser.add_argument("-O", "--out", default=".", help="output directory")
+        parser.add_argument("-n", "--norad", type=int, help="norad id of all files")
+        parser.add_argument("-j", "--jobs", type=int, help="worker processes")
+        args = parser.parse_args()
+        LOGGER.setLevel(logging.WARNING)
+        for report in batch(args.sources, args.out, args.norad, args.jobs):
+            print(
+                f"{report['file'] or 'skipped'}: {report['fill']}% in "
+                f"{len(report['gaps'])} gaps, {report['frames_used']}/"
+                f"{report['frames']} frames, {report['first']} - {report['last']}"
+            )
+    elif len(argv) == 3:
         ImageDecode(argv[1], argv[2])
     elif len(argv) == 4:
         ImageDecode(argv[1], argv[2], argv[3])
     else:
         print(
             f"Usage: {argv[0]} <frame_file> <norad_id> [output_prefix]\n"
+            f"       {argv[0]} --batch <dir|glob>... [-O dir] [-n norad_id] [-j jobs]\n"
             f"Frame file can be KISS, SatNOGS data export or GetKISS+"
         )
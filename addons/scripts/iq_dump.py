@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import logging
+from fcntl import flock, LOCK_EX, LOCK_NB
+from glob import glob
+from json import dump, load, loads, JSONDecodeError
+from os import getenv, nice, path, rename as os_rename, replace
+from shutil import which
+from subprocess import run, Popen, DEVNULL
+from sys import argv
+
+from find_samp_rate import find_samp_rate
+
+LOGGER = logging.getLogger("iq_dump")  # also imported by the hooks, leave the root
+LOGGER.setLevel(
+    getattr(
+        logging, getenv("IQ_DUMP_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    )
+)
+
+IQ_FORMAT = "cs16"  # gr-satnogs iq_sink, interleaved int16
+IQ_SCALE = 16768
+
+
+def enabled(name, default="False"):
+    return getenv(name, default).upper() in ["TRUE", "YES", "1"]
+
+
+def dump_name(obs_id, samp_rate):
+    """Name of a renamed dump without extension, the sidecar gets .json."""
+    return f"{getenv('IQ_DUMP_FILENAME', '/srv/iq')}_{obs_id}_{samp_rate}"
+
+
+def rename(obs_id, freq, tle, timestamp, baud, script, samp_rate=None):
+    """Move the IQ dump out of the way of the next observation and describe it."""
+    iq_file = getenv("IQ_DUMP_FILENAME", "/srv/iq")
+    samp_rate = samp_rate or getenv("HOOK_SAMP_RATE") or find_samp_rate(baud, script)
+    name = dump_name(obs_id, samp_rate)
+    try:
+        os_rename(iq_file, f"{name}.raw")
+    except OSError as e:
+        LOGGER.warning(f"Unable to rename {iq_file}: {e}")
+        return None
+    try:
+        tle = loads(tle)
+        norad = int(tle["tle2"].split()[1])
+        sat_name = tle["tle0"]
+    except (JSONDecodeError, KeyError, IndexError, ValueError, TypeError):
+        norad = 0
+        sat_name = ""
+    meta = {
+        "obs_id": obs_id,
+        "file": path.basename(f"{name}.raw"),
+        "format": IQ_FORMAT,
+        "scale": IQ_SCALE,
+        "samp_rate": int(samp_rate),
+        "frequency": int(float(freq)),
+        "timestamp": timestamp,  # observation start, %Y-%m-%dT%H-%M-%S UTC
+        "norad": norad,
+        "sat_name": sat_name,
+        "baud": baud,
+        "script": script,
+        "tle": tle if isinstance(tle, dict) else None,
+    }
+    write_meta(name, meta)
+    LOGGER.info(f"Renamed IQ dump to {name}.raw")
+    if enabled("IQ_DUMP_COMPRESS"):
+        start_compress()
+    return f"{name}.raw"
+
+
+def write_meta(name, meta):
+    with open(f"{name}.json.tmp", "w") as f:
+        dump(meta, f, indent=1)
+    replace(f"{name}.json.tmp", f"{name}.json")
+
+
+def start_compress():
+    """Start the queue worker in the background, it exits if one is running."""
+    Popen(
+        ["iq_dump.py", "compress"],
+        stdout=DEVNULL,
+        stderr=DEVNULL,
+        start_new_session=True,
+    )
+
+
+def pending_dumps():
+    return glob(f"{dump_name('*', '*')}.raw")
+
+
+def compress_queue():
+    """Compress renamed dumps one at a time, oldest first, until none are left."""
+    if which("zstd") is None:
+        LOGGER.warning("zstd not found, leaving the IQ dumps uncompressed")
+        return 0
+    try:
+        nice(int(getenv("IQ_COMPRESS_NICE", "10")))
+    except (OSError, ValueError) as e:
+        LOGGER.warning(f"Unable to set IQ_COMPRESS_NICE: {e}")
+    cmd = ["zstd", "-q", "--rm", "-f"]
+    cmd += [f"-{getenv('IQ_COMPRESS_LEVEL', '3')}"]
+    cmd += [f"-T{getenv('IQ_COMPRESS_THREADS', '2')}"]
+    ionice = getenv("IQ_COMPRESS_IONICE", "3")  # idle
+    if ionice and which("ionice"):
+        cmd = ["ionice", "-c", ionice] + cmd
+    lock_file = f"{getenv('SATNOGS_APP_PATH', '/tmp/.satnogs')}/iq_compress.lock"
+    done = 0
+    tried = set()  # failed ones are not retried by this worker
+    while True:
+        with open(lock_file, "w") as lock:
+            try:
+                flock(lock, LOCK_EX | LOCK_NB)
+            except BlockingIOError:
+                LOGGER.debug("Compression already running")
+                return done
+            while True:
+                pending = sorted(set(pending_dumps()) - tried, key=path.getmtime)
+                if len(pending) == 0:
+                    break
+                tried.add(pending[0])
+                done += compress(pending[0], cmd)
+        # the worker of a dump renamed after the last look found the lock
+        # still taken and exited, so look again now that it is released
+        if len(set(pending_dumps()) - tried) == 0:
+            return done
+
+
+def compress(raw_file, cmd):
+    LOGGER.info(f"Compressing {raw_file}")
+    try:
+        result = run(cmd + [raw_file], stdout=DEVNULL)
+    except OSError as e:
+        LOGGER.warning(f"Unable to run zstd on {raw_file}: {e}")
+        return 0
+    if result.returncode != 0 or path.exists(raw_file):
+        LOGGER.error(f"zstd failed on {raw_file}, leaving it uncompressed")
+        try:
+            os_rename(raw_file, f"{raw_file}.failed")
+        except OSError as e:
+            LOGGER.warning(f"Unable to rename {raw_file}: {e}")
+        return 0
+    name = path.splitext(raw_file)[0]
+    try:
+        with open(f"{name}.json", "r") as f:
+            meta = load(f)
+        meta["file"] = path.basename(f"{raw_file}.zst")
+        meta["compression"] = "zstd"
+        write_meta(name, meta)
+    except (OSError, JSONDecodeError) as e:
+        LOGGER.warning(f"Unable to update {name}.json: {e}")
+    return 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    if len(argv) == 8 and argv[1] == "rename":
+        rename(*argv[2:])
+    elif len(argv) == 2 and argv[1] == "compress":
+        print(f"Compressed {compress_queue()} IQ dumps")
+    else:
+        LOGGER.error(
+            "Usage: rename {{ID}} {{FREQ}} {{TLE}} {{TIMESTAMP}} {{BAUD}} {{SCRIPT_NAME}}"
+            " | compress"
+        )
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+from datetime import datetime, timedelta
+from re import compile as re_compile
+from struct import unpack
+from sys import argv
+
+FEND = 0xC0
+FESC = 0xDB
+CMD_DATA = 0x00
+CMD_TIMESTAMP = 0x09  # gr-satellites extension, 64bit ms since epoch
+CHUNK_SIZE = 65536
+
+_ESCAPED = re_compile(b"\xdb[\xdc\xdd]")
+_UNESCAPE = {b"\xdb\xdc": b"\xc0", b"\xdb\xdd": b"\xdb"}
+
+
+def unescape(frame):
+    """Undo KISS byte stuffing in a single pass."""
+    if FESC not in frame:
+        return frame
+    return _ESCAPED.sub(lambda m: _UNESCAPE[m.group()], frame)
+
+
+class KissDecoder(object):
+    """Incremental KISS decoder, keeps partial frames between calls.
+
+    Feed it arbitrary chunks of a KISS stream and it yields (timestamp, frame)
+    for every complete data frame. The state is kept so a file that is still
+    being written can be read again later and continue where it left off.
+    """
+
+    def __init__(self, ts=None):
+        self.buffer = bytearray()
+        self.ts = datetime.utcnow() if ts is None else ts  # MUST be overwritten
+        self.num_frames = 0
+
+    def feed(self, data):
+        self.buffer += data
+        start = 0
+        while True:
+            end = self.buffer.find(FEND, start)
+            if end < 0:
+                break
+            if end > start:
+                frame = self.decode(bytes(self.buffer[start:end]))
+                if frame is not None:
+                    yield frame
+            start = end + 1
+        if start:
+            del self.buffer[:start]
+
+    def read(self, infile, chunk_size=CHUNK_SIZE):
+        """Read from infile until EOF, can be called again when the file grows."""
+        while True:
+            data = infile.read(chunk_size)
+            if not data:
+                break
+            yield from self.feed(data)
+
+    def flush(self):
+        """Decode whatever is left in the buffer, used at the end of a stream."""
+        if len(self.buffer) > 0:
+            frame = self.decode(bytes(self.buffer))
+            self.buffer.clear()
+            if frame is not None:
+                yield frame
+
+    def decode(self, row):
+        row = unescape(row)
+        if row[0] == CMD_TIMESTAMP and len(row) == 9:
+            self.ts = datetime(1970, 1, 1) + timedelta(
+                seconds=unpack(">Q", row[1:])[0] / 1000
+            )
+        elif row[0] == CMD_DATA:
+            self.num_frames += 1
+            return self.ts, row[1:]
+        return None
+
+
+def parse_kiss_file(infile, ts=None, chunk_size=CHUNK_SIZE):
+    """Yield (timestamp, frame) from a KISS file without loading it into memory."""
+    decoder = KissDecoder(ts)
+    yield from decoder.read(infile, chunk_size)
+    yield from decoder.flush()
+
+
+if __name__ == "__main__":
+    if len(argv) != 2:
+        print(f"Usage: {argv[0]} <kiss_file>")
+        exit(0)
+    with open(argv[1], "rb") as f:
+        for ts, frame in parse_kiss_file(f):
+            print(f"{ts} {frame.hex()}")
@@ -14,14 +14,17 @@ SCRIPT="$7"  # $7 script name, satnogs_bpsk.py
 # default values
 : "${METEOR_NORAD:=57166 59051}"
 : "${UDP_DUMP_PORT:=57356}"
+: "${METEOR_UDP_PORT:=$UDP_DUMP_PORT}"  # set by satnogs_hooks.py with UDP_HUB_ENABLE
 : "${SATNOGS_APP_PATH:=/tmp/.satnogs}"
 : "${SATNOGS_OUTPUT_PATH:=/tmp/.satnogs/data}"
 
+: "${METEOR_STOP_TIMEOUT:=60}"  # for meteor_decode to write the image
 PRG="Meteor demod+decode"
-METEOR_PID="$SATNOGS_APP_PATH/meteor_$SATNOGS_STATION_ID.pid"
 IMAGE="$SATNOGS_OUTPUT_PATH/data_${ID}_${DATE}.png"
-SATNAME=$(echo "$TLE" | jq .tle0 | sed -e 's/ /_/g' | sed -e 's/[^A-Za-z0-9._-]//g')
-NORAD=$(echo "$TLE" | jq .tle2 | awk '{print $2}')
+# HOOK_* are set by satnogs_hooks.py, saves parsing the TLE again
+SATNAME=${HOOK_SATNAME:-$(echo "$TLE" | jq .tle0 | sed -e 's/ /_/g' | sed -e 's/[^A-Za-z0-9._-]//g')}
+NORAD=${HOOK_NORAD:-$(echo "$TLE" | jq .tle2 | awk '{print $2}')}
+source samp_rate.sh
 
 if [ "${CMD^^}" == "START" ]; then
   if [ -z ${METEOR_NORAD+x} ] || [[ " ${METEOR_NORAD} " =~ .*\ ${NORAD}\ .* ]]; then
@@ -29,10 +32,10 @@ if [ "${CMD^^}" == "START" ]; then
     if [ -z "$UDP_DUMP_HOST" ]; then
       echo "Warning: UDP_DUMP_HOST not set, no data will be sent to the demod"
     fi
-    SAMP=$(find_samp_rate.py "$BAUD" "$SCRIPT")
+    SAMP=${METEOR_SAMP_RATE:-${HOOK_SAMP_RATE:-$(find_samp_rate "$BAUD" "$SCRIPT")}}
     if [ -z "$SAMP" ]; then
       SAMP=144000
-      echo "WARNING: find_samp_rate.py did not return valid sample rate!"
+      echo "WARNING: find_samp_rate did not return valid sample rate!"
     fi
     SYMRATE=72000
     INTERLACE=""
@@ -43,15 +46,14 @@ if [ "${CMD^^}" == "START" ]; then
 #   else
 #     INTERLACE=""
 #   fi
-    ( udp2ishort.py -p "$UDP_DUMP_PORT" & echo $! > "$METEOR_PID" ) | \
-    meteor_demod --batch --quiet -O 8 -f 128 -s "$SAMP" -r "$SYMRATE" -m oqpsk --bps 16 --stdout - | \
-    meteor_decode --batch --quiet "$INTERLACE" --diff -a 65,65,64 -o "$IMAGE" - &
+    # stopping ends udp2stdout, the demod and decoder finish on EOF
+    supervisor.py start meteor -t "$METEOR_STOP_TIMEOUT" -- \
+      udp2stdout.py -p "$METEOR_UDP_PORT" -f s16 '|' \
+      meteor_demod --batch --quiet -O 8 -f 128 -s "$SAMP" -r "$SYMRATE" -m oqpsk --bps 16 --stdout - '|' \
+      meteor_decode --batch --quiet "$INTERLACE" --diff -a 65,65,64 -o "$IMAGE" -
   fi
 fi
 
 if [ "${CMD^^}" == "STOP" ]; then
-  if [ -f "$METEOR_PID" ]; then
-    kill "$(cat "$METEOR_PID")"
-    rm -f "$METEOR_PID"
-  fi
+  supervisor.py stop meteor
 fi
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from json import dump, dumps, load, JSONDecodeError
+from os import environ, getenv, makedirs, path, scandir
+from re import compile as re_compile
+from shutil import copyfile
+from socket import socket, AF_INET, SOCK_DGRAM
+from subprocess import Popen, PIPE
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+
+import numpy as np
+
+from udp2stdout import udp_sockets
+
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(
+        logging, getenv("REPLAY_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    ),
+)
+LOGGER = logging.getLogger("replay")
+
+PACKET_SIZE = 1472  # 184 complex float samples, like the flowgraph UDP sink
+CHUNK_SAMPLES = 1 << 12  # read, converted and paced at a time
+RX_LIMIT = 64 << 10  # queued in the decoder socket before waiting, stays below rmem
+BIND_TIMEOUT = 60  # seconds to wait for gr_satellites to open its port
+SETTLE_TIME = 2.0  # after the socket is drained, for the last frames
+FRAME_FILE = re_compile(r"_g\d+$")
+FRAME_EXT = (".kiss", ".hex", ".txt", ".csv")
+IQ_FILE = re_compile(r"_(\d+)_(\d+)\.raw(\.zst)?$")  # iq_dump_rename: _obs_rate.raw
+IQ_SCALE = 16768  # of the cs16 dumps
+
+
+def udp_socket_info(port):
+    """(rx_queue bytes, drops) of the local UDP socket on port, None if unbound."""
+    for info in udp_sockets():
+        if info.port == port:
+            return info.rx_queue, info.drops
+    return None
+
+
+def free_port():
+    with socket(AF_INET, SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_iq(iq_file, scale):
+    """Complex float32 chunks from a cs16 dump, zstd compressed or not."""
+    proc = None
+    if iq_file.endswith(".zst"):
+        proc = Popen(["zstd", "-dcq", iq_file], stdout=PIPE)
+        f = proc.stdout
+    else:
+        f = open(iq_file, "rb")
+    try:
+        while True:
+            raw = f.read(CHUNK_SAMPLES * 4)
+            if len(raw) < 4:
+                break
+            samples = np.frombuffer(raw, dtype="<i2", count=len(raw) // 4 * 2)
+            yield (samples.astype(np.float32) * (1 / scale)).tobytes()
+    finally:
+        f.close()
+        if proc is not None:
+            proc.wait()
+
+
+def send_iq(iq_file, scale, port, samp_rate, speed):
+    """Send the dump to port at speed times real time, 0 is as fast as the decoder
+    reads it. The socket queue is watched in both cases so nothing is dropped.
+    """
+    sent = 0
+    start = monotonic()
+    with socket(AF_INET, SOCK_DGRAM) as sock:
+        for chunk in read_iq(iq_file, scale):
+            while (udp_socket_info(port) or (0, 0))[0] > RX_LIMIT:
+                sleep(0.001)
+            for pos in range(0, len(chunk), PACKET_SIZE):
+                sock.sendto(chunk[pos : pos + PACKET_SIZE], ("127.0.0.1", port))
+            sent += len(chunk) // 8
+            if speed > 0:
+                ahead = start + sent / (samp_rate * speed) - monotonic()
+                if ahead > 0:
+                    sleep(ahead)
+    return sent
+
+
+def wait_for(test, timeout, interval=0.05):
+    deadline = monotonic() + timeout
+    while not test():
+        if monotonic() > deadline:
+            return False
+        sleep(interval)
+    return True
+
+
+def count_output(data_dir):
+    frames = images = 0
+    with scandir(data_dir) as it:
+        for entry in it:
+            if FRAME_FILE.search(entry.name):
+                frames += 1
+            else:
+                images += 1
+    return frames, images
+
+
+def load_meta(sidecar):
+    with open(sidecar, "r") as f:
+        meta = load(f)
+    meta["iq_file"] = path.join(path.dirname(sidecar), meta["file"])
+    return meta
+
+
+def iq_meta(iq_file, norad):
+    """Metadata of a dump without sidecar, from its name, None if it has none."""
+    match = IQ_FILE.search(path.basename(iq_file))
+    if match is None:
+        return None
+    return {
+        "obs_id": match.group(1),
+        "samp_rate": int(match.group(2)),
+        "norad": norad,
+        "file": path.basename(iq_file),
+        "iq_file": iq_file,
+        "scale": IQ_SCALE,
+    }
+
+
+def replay(job, out_dir, speed=0, settle=SETTLE_TIME):
+    """Run one archived observation through GrSat, returns its report."""
+    kind, source, meta = job
+    obs_id = str(meta.get("obs_id", "0"))
+    data_dir = path.join(out_dir, obs_id)
+    makedirs(data_dir, exist_ok=True)
+    report = {"obs_id": obs_id, "source": source, "norad": meta.get("norad", 0)}
+    start = monotonic()
+    saved = dict(environ)  # pool workers run many jobs
+    with TemporaryDirectory(prefix="replay_") as tmp:
+        port = free_port()
+        # GrSat and ImageDecode take their paths and ports from the environment
+        environ.update(
+            SATNOGS_APP_PATH=tmp,
+            SATNOGS_OUTPUT_PATH=data_dir,
+            SATNOGS_STATION_ID=obs_id,
+            UDP_DUMP_HOST="127.0.0.1",
+            GRSAT_UDP_PORT=str(port),
+            GRSAT_SAMP_RATE=str(meta.get("samp_rate", "")),
+            GRSAT_LIVE="False",
+            GRSAT_KEEPLOGS="False",
+        )
+        try:
+            report.update(run_job(kind, source, meta, data_dir, port, speed, settle))
+        finally:
+            environ.clear()
+            environ.update(saved)
+    report["wall_s"] = round(monotonic() - start, 2)
+    report["frames"], report["images"] = count_output(data_dir)
+    if report.get("duration_s"):
+        report["speed"] = round(report["duration_s"] / report["wall_s"], 1)
+    return report
+
+
+def run_job(kind, source, meta, data_dir, port, speed, settle):
+    """The start/stop steps of one observation, in the environment of replay()."""
+    from grsat import GrSat, ImageDecode
+
+    obs_id = str(meta.get("obs_id", "0"))
+    report = {}
+    tle = meta.get("tle") or {
+        "tle0": meta.get("sat_name", ""),
+        "tle1": "",
+        "tle2": f"2 {meta.get('norad', 0)}",
+    }
+    args = [
+        obs_id,
+        str(meta.get("frequency", 0)),
+        dumps(tle),
+        meta.get("timestamp", ""),
+        str(meta.get("baud", "")),
+        meta.get("script", ""),
+    ]
+    if kind == "iq":
+        GrSat("start", *args).main()
+        if not wait_for(lambda: udp_socket_info(port) is not None, BIND_TIMEOUT):
+            LOGGER.error(f"{obs_id}: gr_satellites did not open port {port}")
+        samples = send_iq(
+            meta["iq_file"],
+            meta.get("scale", IQ_SCALE),
+            port,
+            meta["samp_rate"],
+            speed,
+        )
+        wait_for(lambda: (udp_socket_info(port) or (0, 0))[0] == 0, 600)
+        sleep(settle)
+        info = udp_socket_info(port)
+        report["drops"] = info[1] if info else None
+        report["duration_s"] = round(samples / meta["samp_rate"], 1)
+        GrSat("stop", *args).main()
+    elif kind == "kiss":
+        grsat = GrSat("stop", *args)
+        copyfile(source, grsat.kiss_file)  # it is removed after processing
+        grsat.main()
+    else:  # hex export, parsed like imagedecode.py does
+        grsat = GrSat("stop", *args)
+        frames = ImageDecode()
+        frames.frame_file = source
+        frames.parse_file()
+        grsat.write_frames(frames.frames)
+        ImageDecode(source, grsat.norad, f"{data_dir}/data_{obs_id}_")
+    return report
+
+
+def find_jobs(sources, norad=0):
+    """IQ dumps by their sidecar, KISS and hex frame files as (kind, file, meta)."""
+    files = []
+    for source in sources:
+        if path.isdir(source):
+            files += sorted(entry.path for entry in scandir(source))
+        else:
+            files.append(source)
+    jobs = []
+    for f in files:
+        name, ext = path.splitext(f)
+        if ext == ".json":
+            try:
+                meta = load_meta(f)
+            except (OSError, JSONDecodeError, KeyError) as e:
+                LOGGER.warning(f"Skipping {f}: {e}")
+                continue
+            if path.isfile(meta["iq_file"]):
+                jobs.append(("iq", meta["iq_file"], meta))
+            else:
+                LOGGER.warning(f"Skipping {f}, {meta['iq_file']} not found")
+        elif ext in (".raw", ".zst"):
+            name = IQ_FILE.sub(lambda m: f"_{m.group(1)}_{m.group(2)}", f)
+            if path.isfile(f"{name}.json"):
+                if f"{name}.json" not in files:  # else it is found by the sidecar
+                    jobs.append(("iq", f, load_meta(f"{name}.json")))
+                continue
+            meta = iq_meta(f, norad)
+            if meta is None:
+                LOGGER.warning(f"Skipping {f}, not named like _obs-id_samp-rate.raw")
+            elif norad == 0:
+                LOGGER.warning(f"Skipping {f}, IQ dumps without .json need --norad")
+            else:
+                jobs.append(("iq", f, meta))
+        elif ext in FRAME_EXT:
+            if norad == 0:
+                LOGGER.warning(f"Skipping {f}, frame files need --norad")
+                continue
+            meta = {"obs_id": path.basename(name), "norad": norad}
+            jobs.append(("kiss" if ext == ".kiss" else "hex", f, meta))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay archived IQ dumps and frame files through grsat"
+    )
+    parser.add_argument(
+        "sources", nargs="+", help="IQ dump sidecar .json, .kiss, .hex or directories"
+    )
+    parser.add_argument("-O", "--out", default="replay", help="output directory")
+    parser.add_argument("-j", "--jobs", type=int, help="observations in parallel")
+    parser.add_argument(
+        "-s",
+        "--speed",
+        type=float,
+        default=float(getenv("REPLAY_SPEED", "0")),
+        help="times real time, 0 is unthrottled",
+    )
+    parser.add_argument("-n", "--norad", type=int, default=0, help="for frame files")
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    jobs = find_jobs(args.sources, args.norad)
+    reports = []
+    start = monotonic()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(replay, job, args.out, args.speed): job for job in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                LOGGER.error(f"{futures[future][1]} failed: {e}")
+                continue
+            reports.append(report)
+            print(
+                f"{report['obs_id']}: {report['frames']} frames, "
+                f"{report['images']} images, {report['wall_s']:.1f}s"
+                + (f", {report['speed']}x real time" if "speed" in report else "")
+                + (f", {report['drops']} drops" if report.get("drops") else "")
+            )
+    print(
+        f"Replayed {len(reports)}/{len(jobs)} observations, "
+        f"{sum(r['frames'] for r in reports)} frames in {monotonic() - start:.1f}s"
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            dump(reports, f, indent=1)
@@ -0,0 +1,28 @@
+#!/bin/bash
+# Sourced by the hooks: find_samp_rate {{BAUD}} {{SCRIPT_NAME}}
+# Looks up the table written by find_samp_rate.py --table, only starts python
+# for baudrates that are not in it.
+
+: "${SATYAML_PATH:=/usr/lib/python3/dist-packages/satellites/satyaml}"
+: "${SAMP_RATE_FILE:=$SATYAML_PATH/samp_rate.table}"
+declare -A SAMP_RATE_TABLE=()
+# shellcheck disable=SC1090
+if [ -r "$SAMP_RATE_FILE" ]; then source "$SAMP_RATE_FILE"; fi
+
+find_samp_rate() {
+  local BAUD="${1%.*}" TYPE
+  case "$2" in
+    *_bpsk*) TYPE=bpsk ;;
+    *_fsk*) TYPE=fsk ;;
+    *_sstv*) TYPE=sstv ;;
+    *_qubik*) TYPE=qubik ;;
+    *_apt*) TYPE=apt ;;
+    *_ssb*) TYPE=ssb ;;
+    *) TYPE=other ;;
+  esac
+  if [ -n "${SAMP_RATE_TABLE[$BAUD,$TYPE]:-}" ]; then
+    echo "${SAMP_RATE_TABLE[$BAUD,$TYPE]}"
+  else
+    find_samp_rate.py "$1" "$2"
+  fi
+}
@@ -15,51 +15,50 @@ PRG="SatDump:"
 : "${SATNOGS_APP_PATH:=/tmp/.satnogs}"
 : "${SATNOGS_OUTPUT_PATH:=/tmp/.satnogs/data/}"
 : "${UDP_DUMP_PORT:=57356}"
+: "${SATDUMP_UDP_PORT:=$UDP_DUMP_PORT}"  # set by satnogs_hooks.py with UDP_HUB_ENABLE
 : "${SATDUMP_KEEPLOGS:=no}"
 BIN=$(command -v satdump)
 LOG="SATNOGS_APP_PATH/satdump_$ID.log"
 OUT="SATNOGS_APP_PATH/satdump_$ID"
-PID="SATNOGS_APP_PATH/satdump_$SATNOGS_STATION_ID.pid"
+: "${SATDUMP_STOP_TIMEOUT:=30}"  # for satdump to finish the products
 
-SATNAME=$(echo "$TLE" | jq .tle0 | sed -e 's/ /_/g' | sed -e 's/[^A-Za-z0-9._-]//g')
-NORAD=$(echo "$TLE" | jq .tle2 | awk '{print $2}')
+# HOOK_* are set by satnogs_hooks.py, saves parsing the TLE again
+SATNAME=${HOOK_SATNAME:-$(echo "$TLE" | jq .tle0 | sed -e 's/ /_/g' | sed -e 's/[^A-Za-z0-9._-]//g')}
+NORAD=${HOOK_NORAD:-$(echo "$TLE" | jq .tle2 | awk '{print $2}')}
+source samp_rate.sh
 
 if [ "${CMD^^}" == "START" ]; then
   if [ -z "$UDP_DUMP_HOST" ]; then
 	  echo "$PRG WARNING! UDP_DUMP_HOST not set, no data will be sent to the demod"
   fi
-  SAMP=$(find_samp_rate.py "$BAUD" "$SCRIPT")
+  SAMP=${SATDUMP_SAMP_RATE:-${HOOK_SAMP_RATE:-$(find_samp_rate "$BAUD" "$SCRIPT")}}
   if [ -z "$SAMP" ]; then
     SAMP=66560
-    echo "$PRG WARNING! find_samp_rate.py did not return valid sample rate!"
+    echo "$PRG WARNING! find_samp_rate did not return valid sample rate!"
   fi
   OPT=""
   case "$NORAD" in
     "25338") # NOAA 15
-      OPT="live noaa_apt $OUT --source udp_source --port $UDP_DUMP_PORT --satellite_number 15 --samplerate $SAMP"
+      OPT="live noaa_apt $OUT --source udp_source --port $SATDUMP_UDP_PORT --satellite_number 15 --samplerate $SAMP"
       ;;
     "28654") # NOAA 18
-      OPT="live noaa_apt $OUT --source udp_source --port $UDP_DUMP_PORT --satellite_number 18 --samplerate $SAMP"
+      OPT="live noaa_apt $OUT --source udp_source --port $SATDUMP_UDP_PORT --satellite_number 18 --samplerate $SAMP"
       ;;
     "33591") # NOAA 19
-      OPT="live noaa_apt $OUT --source udp_source --port $UDP_DUMP_PORT --satellite_number 19 --samplerate $SAMP"
+      OPT="live noaa_apt $OUT --source udp_source --port $SATDUMP_UDP_PORT --satellite_number 19 --samplerate $SAMP"
       ;;
   esac
 
   if [ -n "$OPT" ]; then
     mkdir -p "$OUT"
     echo "$PRG running at $SAMP sps on $SATNAME"
-    $BIN $OPT > "$LOG" 2>> "$LOG" &
-    echo $! > "$PID"
+    supervisor.py start satdump -l "$LOG" -t "$SATDUMP_STOP_TIMEOUT" -- $BIN $OPT
   fi
 fi
 
 if [ "${CMD^^}" == "STOP" ]; then
-  if [ -f "$PID" ]; then
-    echo "$PRG Stopping observation $ID"
-    kill "$(cat "$PID")"
-    rm -f "$PID"
-  fi
+  echo "$PRG Stopping observation $ID"
+  supervisor.py stop satdump
 
   if [ -s "$OUT" ]; then
     echo "$PRG processing data to network"
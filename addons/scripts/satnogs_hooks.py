@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from json import loads, JSONDecodeError
+from os import environ, getenv
+from re import sub
+from subprocess import run
+from sys import argv
+from time import monotonic
+
+from find_samp_rate import find_samp_rate
+from supervisor import Supervisor
+
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(
+        logging, getenv("HOOKS_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    ),
+)
+LOGGER = logging.getLogger("hooks")
+
+
+def enabled(name, default="False"):
+    return getenv(name, default).upper() in ["TRUE", "YES", "1"]
+
+
+class Hooks(object):
+    """Pre/post observation hooks, parses the arguments once and runs the add-ons
+    of each stage in parallel.
+    """
+
+    def __init__(
+        self,
+        cmd="",
+        obs_id="0",
+        freq="0",
+        tle="",
+        timestamp="",
+        baud="",
+        script="",
+    ):
+        self.cmd = cmd
+        self.args = [obs_id, freq, tle, timestamp, baud, script]
+        self.freq = freq
+        try:
+            tle = loads(tle)
+            self.norad = int(tle["tle2"].split()[1])
+            self.sat_name = tle["tle0"]
+        except (JSONDecodeError, KeyError, IndexError, ValueError, TypeError):
+            self.norad = 0
+            self.sat_name = ""
+        # the shell add-ons use these instead of running jq on the TLE
+        self.env = dict(
+            environ,
+            HOOK_NORAD=str(self.norad),
+            HOOK_SATNAME=sub(r"[^A-Za-z0-9._-]", "", self.sat_name.replace(" ", "_")),
+            HOOK_SAMP_RATE=str(find_samp_rate(baud, script)),
+        )
+        self.timing = {}
+        self.hub = Supervisor("udphub")
+        self.telemetry = Supervisor("telemetry")
+
+    def main(self):
+        start = monotonic()
+        if "pre" in self.cmd:
+            self.pre()
+        elif "post" in self.cmd:
+            self.post()
+        else:
+            LOGGER.error("Unknown command, use pre or post")
+            return
+        self.timing["total"] = monotonic() - start
+        LOGGER.info(
+            f"{self.cmd} timing: "
+            + ", ".join(f"{name} {t:.3f}s" for name, t in self.timing.items())
+        )
+
+    def pre(self):
+        self.run_stage(
+            {
+                "bandscan": self.script("BANDSCAN_ENABLE", "bandscan.sh", "stop"),
+                "direwolf": self.script("DIREWOLF_ENABLE", "direwolf.sh", "stop"),
+                "udphub": self.start_hub if enabled("UDP_HUB_ENABLE") else None,
+                "telemetry": (
+                    self.start_telemetry if enabled("TELEMETRY_ENABLE") else None
+                ),
+            }
+        )
+        self.run_stage(
+            {
+                "grsat": self.grsat,
+                "satdump": self.script("SATDUMP_ENABLE", "satdump.sh", "start"),
+                "meteor": self.meteor("start"),
+                "gpio": self.gpio if enabled("GPIO_ENABLE") else None,
+            }
+        )
+
+    def post(self):
+        iq_dump = enabled("ENABLE_IQ_DUMP") and enabled("IQ_DUMP_RENAME")
+        self.run_stage(
+            {
+                "grsat": self.grsat,
+                "satdump": self.script("SATDUMP_ENABLE", "satdump.sh", "stop"),
+                "meteor": self.meteor("stop"),
+                "iq_dump_rename": self.iq_dump if iq_dump else None,
+                "udphub": self.stop_hub if enabled("UDP_HUB_ENABLE") else None,
+            }
+        )
+        self.run_stage(
+            {
+                "bandscan": self.script("BANDSCAN_ENABLE", "bandscan.sh", "start"),
+                "direwolf": self.script("DIREWOLF_ENABLE", "direwolf.sh", "start"),
+                "rotor_park": ["rotor-park.sh"] if enabled("ROT_PARK") else None,
+                "telemetry": (
+                    self.telemetry.stop if enabled("TELEMETRY_ENABLE") else None
+                ),
+            }
+        )
+
+    def script(self, enable, name, cmd):
+        """Command for a shell add-on, None if it is disabled."""
+        if not enabled(enable):
+            return None
+        if name in ["bandscan.sh", "direwolf.sh"]:
+            return [name, cmd]
+        return [name, cmd] + self.args
+
+    def run_stage(self, tasks):
+        tasks = {name: task for name, task in tasks.items() if task is not None}
+        if len(tasks) == 0:
+            return
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            for name, task in tasks.items():
+                executor.submit(self.run_task, name, task)
+
+    def run_task(self, name, task):
+        start = monotonic()
+        try:
+            if callable(task):
+                task()
+            else:
+                LOGGER.debug(" ".join(task))
+                run(task, env=self.env)
+        except Exception as e:
+            LOGGER.error(f"{name} failed: {e}")
+        self.timing[name] = monotonic() - start
+
+    def grsat(self):
+        from grsat import GrSat
+
+        GrSat("start" if "pre" in self.cmd else "stop", *self.args).main()
+
+    def iq_dump(self):
+        from iq_dump import rename
+
+        rename(*self.args, samp_rate=self.env["HOOK_SAMP_RATE"])
+
+    def meteor(self, cmd):
+        norad_list = getenv("METEOR_NORAD") or "57166 59051"
+        if cmd == "start" and str(self.norad) not in norad_list.split():
+            return None
+        return ["meteor.sh", cmd] + self.args
+
+    def start_hub(self):
+        """Receive UDP_DUMP_PORT once and forward a copy to each decoder port."""
+        port = int(getenv("UDP_DUMP_PORT", "57356"))
+        consumers = {
+            "GRSAT": True,
+            "SATDUMP": enabled("SATDUMP_ENABLE"),
+            "METEOR": self.meteor("start") is not None,
+        }
+        outputs = []
+        for offset, (name, active) in enumerate(consumers.items(), 1):
+            var = f"{name}_UDP_PORT"
+            if getenv(var) is None:  # grsat reads it from our environment
+                self.env[var] = environ[var] = str(port + offset)
+            if not active:
+                continue
+            output = f"udp:127.0.0.1:{self.env[var]}"
+            rate = getenv(f"{name}_HUB_RATE")  # resampled by the hub
+            if rate:
+                output += f"@{rate}"
+                self.env[f"{name}_SAMP_RATE"] = environ[f"{name}_SAMP_RATE"] = rate
+            outputs.append(output)
+        cmd = ["udphub.py", "-p", str(port), "-r", self.env["HOOK_SAMP_RATE"]]
+        cmd += outputs
+        LOGGER.debug(" ".join(cmd))
+        self.hub.start(cmd, env=self.env)
+
+    def stop_hub(self):
+        if self.hub.running() is None:
+            LOGGER.warning("udphub is not running")
+        self.hub.stop()
+
+    def start_telemetry(self):
+        """Record resource use until the post hook, after the decoders stopped."""
+        obs_id, script = self.args[0], self.args[5]
+        self.telemetry.start(["telemetry.py", obs_id, script], env=self.env)
+
+    def gpio(self):
+        try:
+            from gpio import set_outputs
+        except ImportError as e:
+            LOGGER.warning(f"Unable to load gpio: {e}")
+            return
+        set_outputs({"freq": int(float(self.freq))})
+
+
+if __name__ == "__main__":
+    if len(argv) != 8:
+        LOGGER.error(
+            "Wrong number of arguments, expected: "
+            "<pre|post> {{ID}} {{FREQ}} {{TLE}} {{TIMESTAMP}} {{BAUD}} {{SCRIPT_NAME}}"
+        )
+        exit(0)
+    Hooks(*argv[1:]).main()
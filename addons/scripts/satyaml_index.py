@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import logging
+from functools import lru_cache
+from os import getenv, path, replace, stat, utime
+from pathlib import Path
+from pickle import dump, load, HIGHEST_PROTOCOL, UnpicklingError
+from sys import argv
+
+# Maps the norad id to its satyaml file, transmitters and image decoder, so the
+# hooks know within milliseconds if and how gr_satellites is started.
+# Written by liveupdate-satyaml and when the image is built, like samp_rate.table.
+
+LOGGER = logging.getLogger("satyaml_index")  # imported by the hooks, leave the root
+LOGGER.setLevel(
+    getattr(
+        logging,
+        getenv("SATYAML_INDEX_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING")),
+    )
+)
+
+SATYAML_PATH = getenv(
+    "SATYAML_PATH", "/usr/lib/python3/dist-packages/satellites/satyaml"
+)
+INDEX_FILE = getenv("SATYAML_INDEX_FILE", f"{SATYAML_PATH}/satyaml.index")
+PLUGIN_PATH = getenv("IMAGEDECODE_PLUGIN_PATH", f"{SATYAML_PATH}/imagedecode")
+VERSION = 2
+
+
+def satyaml_entry(satyaml):
+    """Norad id and the parts of a satyaml file the add-ons use."""
+    import yaml  # only needed when building
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(satyaml, "r") as f:
+        sat = yaml.load(f, Loader=loader)
+    transmitters = []
+    for name, tx in (sat.get("transmitters") or {}).items():
+        transmitters.append(
+            {
+                "name": name,
+                "frequency": tx.get("frequency"),
+                "modulation": tx.get("modulation"),
+                "baudrate": tx.get("baudrate"),
+                "framing": tx.get("framing"),
+            }
+        )
+    entry = {
+        "name": sat.get("name", ""),
+        "alternative_names": sat.get("alternative_names") or [],
+        "file": str(satyaml),
+        "transmitters": transmitters,
+        "bauds": sorted(
+            {int(float(tx["baudrate"])) for tx in transmitters if tx["baudrate"]}
+        ),
+        "framings": sorted({tx["framing"] for tx in transmitters if tx["framing"]}),
+        "image_decoder": False,
+    }
+    return int(sat["norad"]), entry
+
+
+def image_decoders():
+    """Norad ids with a built-in, drop-in or installed image decoder."""
+    try:
+        from importlib.metadata import entry_points
+        from imagedecode import DECODERS, PLUGIN_GROUP, plugin_files
+    except ImportError as e:
+        LOGGER.warning(f"Unable to load imagedecode: {e}")
+        return None
+    norads = set(DECODERS) | set(plugin_files())
+    for ep in entry_points(group=PLUGIN_GROUP):
+        try:
+            norads.add(int(ep.name))
+        except ValueError:
+            pass
+    return norads
+
+
+def build(index_file=INDEX_FILE, satyaml_path=SATYAML_PATH):
+    """Parse every satyaml file and pickle the index next to them."""
+    sats = {}
+    for satyaml in sorted(Path(satyaml_path).glob("*.yml")):
+        try:
+            norad, entry = satyaml_entry(satyaml)
+        except Exception as e:
+            LOGGER.warning(f"Skipping {satyaml}: {e}")
+            continue
+        sats.setdefault(norad, entry)  # the first file wins, like gr_satellites
+    decoders = image_decoders()
+    for norad, entry in sats.items():
+        entry["image_decoder"] = None if decoders is None else norad in decoders
+    index = {
+        "version": VERSION,
+        "satyaml_path": str(satyaml_path),
+        "plugin_path": PLUGIN_PATH,  # a decoder dropped in later clears image_decoder
+        "sats": sats,
+    }
+    with open(f"{index_file}.tmp", "wb") as f:
+        dump(index, f, protocol=HIGHEST_PROTOCOL)
+    replace(f"{index_file}.tmp", index_file)
+    utime(index_file)  # newer than the directory it was renamed in
+    return len(sats)
+
+
+@lru_cache(maxsize=1)
+def load_index(index_file=INDEX_FILE):
+    """The index, None if it is missing or older than the satyaml directory."""
+    try:
+        with open(index_file, "rb") as f:
+            index = load(f)
+    except FileNotFoundError:
+        LOGGER.debug(f"No satyaml index {index_file}")
+        return None
+    except (OSError, EOFError, UnpicklingError, AttributeError) as e:
+        LOGGER.warning(f"Unable to read the satyaml index {index_file}: {e}")
+        return None
+    try:
+        if index.get("version") != VERSION or newer(
+            index["satyaml_path"], index_file, index["plugin_path"]
+        ):
+            LOGGER.warning(f"{index_file} is out of date, run satyaml_index.py --build")
+            return None
+    except (OSError, KeyError, AttributeError):
+        return None
+    return index
+
+
+def newer(satyaml_path, index_file, plugin_path=None):
+    """True if a satyaml file or image decoder plugin was added, removed or renamed
+    after the index was built. Files changed in place are picked up when
+    liveupdate rebuilds it.
+    """
+    built = stat(index_file).st_mtime_ns
+    if stat(satyaml_path).st_mtime_ns > built:
+        return True
+    return (
+        plugin_path is not None
+        and path.isdir(plugin_path)
+        and stat(plugin_path).st_mtime_ns > built
+    )
+
+
+def known(norad):
+    """True if there is a satyaml file for norad, None if that is not known."""
+    index = load_index()
+    return None if index is None else norad in index["sats"]
+
+
+def lookup(norad):
+    """Satyaml entry of norad, None if it is unknown or there is no index."""
+    index = load_index()
+    return None if index is None else index["sats"].get(norad)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    if len(argv) >= 2 and argv[1] == "--build":
+        index_file = argv[2] if len(argv) >= 3 else INDEX_FILE
+        print(f"Indexed {build(index_file)} satellites to {index_file}")
+    elif len(argv) == 2 and argv[1].isdigit():
+        print(lookup(int(argv[1])))
+    else:
+        print(f"Usage: {argv[0]} <norad> | --build [file]")
@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from ctypes import CDLL
+from fcntl import flock, LOCK_EX
+from json import dump, load, JSONDecodeError
+from os import getenv, getpid, kill, listdir, makedirs, path, replace, rmdir
+from os import cpu_count, nice, sched_getaffinity, sched_setaffinity, sysconf, unlink
+from os import wait4, waitstatus_to_exitcode, WNOHANG
+from signal import pthread_sigmask, signal, sigtimedwait, SIG_BLOCK
+from signal import SIGCHLD, SIGINT, SIGKILL, SIGTERM
+from subprocess import run, CalledProcessError, Popen, DEVNULL, PIPE
+from sys import executable
+from time import monotonic, sleep, time
+
+LOGGER = logging.getLogger("supervisor")  # imported by the add-ons, leave the root
+LOGGER.setLevel(
+    getattr(
+        logging, getenv("SUPERVISOR_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    )
+)
+
+try:
+    STOP_TIMEOUT = float(getenv("SUPERVISOR_STOP_TIMEOUT", "10"))
+    STATS_INTERVAL = float(getenv("SUPERVISOR_STATS_INTERVAL", "5"))
+    RESERVE = float(getenv("SUPERVISOR_RESERVE", "100"))
+except ValueError:
+    STOP_TIMEOUT = 10.0
+    STATS_INTERVAL = 5.0
+    RESERVE = 100.0
+# refused when the measured load leaves no room for them and the flowgraph
+OPTIONAL = getenv("SUPERVISOR_OPTIONAL", "").split()  # satdump meteor grsat_live
+CGROUP_ROOT = "/sys/fs/cgroup"
+KILL_GRACE = 2.0  # between SIGTERM to every process and SIGKILL
+PIPE_TOKEN = "|"  # separates the commands of a pipeline
+PR_SET_CHILD_SUBREAPER = 36
+CLK_TCK = sysconf("SC_CLK_TCK")
+PAGE_KB = sysconf("SC_PAGE_SIZE") // 1024
+
+
+def proc_stat(pid):
+    """Command name and the fields after it in /proc/pid/stat, None if gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            data = f.read()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    name, _, fields = data[data.index("(") + 1 :].rpartition(")")
+    return [name] + fields.split()
+
+
+def start_time(pid):
+    """Start time of pid in clock ticks since boot, tells a reused pid apart."""
+    stat = proc_stat(pid)
+    return None if stat is None or stat[1] == "Z" else int(stat[20])
+
+
+def peak_rss(pid):
+    """Peak RSS in kB since the last exec of pid, None if gone or a zombie."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return None
+
+
+def group_usage(pgid):
+    """CPU ticks and RSS of every live process in the process group."""
+    usage = {}
+    for entry in listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = proc_stat(entry)
+        if stat is None or stat[1] == "Z" or int(stat[3]) != pgid:
+            continue
+        usage[int(entry)] = {
+            "name": stat[0],
+            "ticks": int(stat[12]) + int(stat[13]),
+            "rss_kb": int(stat[22]) * PAGE_KB,
+        }
+    return usage
+
+
+def parse_cpus(text):
+    """CPU numbers from a list like 0,2-3."""
+    cpus = set()
+    for part in text.replace(" ", "").split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def cpu_busy(cpus):
+    """Busy percentage summed over cpus, from the 1 minute load average spread
+    evenly over every cpu. Read without waiting, the add-ons start at AOS.
+    """
+    with open("/proc/loadavg", "r") as f:
+        load = float(f.read().split()[0])
+    per_cpu = min(load / (cpu_count() or 1), 1.0)
+    return 100 * per_cpu * len(cpus)
+
+
+class Schedule(object):
+    """CPU affinity, priority and cgroup limits of one add-on, from NAME_CPUS,
+    NAME_NICE, NAME_IONICE, NAME_CPU_QUOTA and NAME_MEMORY_MAX.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        prefix = name.upper()
+        try:
+            self.cpus = parse_cpus(getenv(f"{prefix}_CPUS", ""))
+            self.nice = int(getenv(f"{prefix}_NICE", "0"))
+        except ValueError:
+            LOGGER.warning(f"Invalid {prefix}_CPUS or {prefix}_NICE, ignored")
+            self.cpus, self.nice = set(), 0
+        self.ionice = getenv(f"{prefix}_IONICE", "")  # class[:level], 3 is idle
+        self.cpu_quota = getenv(f"{prefix}_CPU_QUOTA", "")  # percent of one core
+        self.memory_max = getenv(f"{prefix}_MEMORY_MAX", "")  # bytes, 512M etc.
+        self.optional = name in OPTIONAL
+        self.cgroup = None
+        self.cost_file = (
+            f"{getenv('SATNOGS_APP_PATH', '/tmp/.satnogs')}/supervisor.cost"
+        )
+
+    def admit(self):
+        """False if an optional add-on would not fit in the idle CPU, judged by
+        what it used the last time and the RESERVE kept for the flowgraph. One
+        without a measured cost is always started, to measure it.
+        """
+        if not self.optional:
+            return True
+        cost = self.costs().get(self.name, 0)
+        if cost <= 0:
+            return True
+        cpus = self.cpus or sched_getaffinity(0)
+        busy = cpu_busy(cpus)
+        if busy + cost > 100 * len(cpus) - RESERVE:
+            LOGGER.warning(
+                f"Not starting {self.name}, it needs {cost:.0f}% CPU and "
+                f"{busy:.0f}% of {100 * len(cpus)}% is busy"
+            )
+            return False
+        return True
+
+    def costs(self):
+        try:
+            with open(self.cost_file, "r") as f:
+                return load(f)
+        except (FileNotFoundError, JSONDecodeError):
+            return {}
+
+    def record_cost(self, cpu_s, wall_s):
+        """Average CPU of the last run, used by admit() next time."""
+        if wall_s < 1:
+            return
+        # the post hook stops several add-ons at once, their monitors take turns
+        with open(f"{self.cost_file}.lock", "w") as lock:
+            flock(lock, LOCK_EX)
+            costs = self.costs()
+            costs[self.name] = round(100 * cpu_s / wall_s, 1)
+            tmp = f"{self.cost_file}.{getpid()}.tmp"
+            with open(tmp, "w") as f:
+                dump(costs, f)
+            replace(tmp, self.cost_file)
+
+    def apply(self):
+        """Set up the monitor process, the commands it starts inherit all of it."""
+        if self.cpus:
+            try:
+                sched_setaffinity(0, self.cpus)
+            except (OSError, ValueError) as e:
+                LOGGER.warning(f"{self.name}: unable to set affinity {self.cpus}: {e}")
+        if self.nice:
+            try:
+                nice(self.nice)
+            except OSError as e:
+                LOGGER.warning(f"{self.name}: unable to set nice {self.nice}: {e}")
+        if self.ionice:
+            ioclass, _, level = self.ionice.partition(":")
+            cmd = ["ionice", "-c", ioclass] + (["-n", level] if level else [])
+            try:
+                run(cmd + ["-p", str(getpid())], check=True, stderr=DEVNULL)
+            except (OSError, CalledProcessError) as e:
+                LOGGER.warning(f"{self.name}: unable to set ionice {self.ionice}: {e}")
+        if self.cpu_quota or self.memory_max:
+            self.join_cgroup()
+
+    def cgroup_path(self):
+        if not path.isfile(path.join(CGROUP_ROOT, "cgroup.controllers")):
+            raise OSError("cgroup v2 is not mounted")
+        with open("/proc/self/cgroup", "r") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    own = line[3:].strip()
+                    base = path.join(CGROUP_ROOT, own.lstrip("/"))
+                    if path.basename(own).startswith("satnogs_"):
+                        base = path.dirname(base)
+                    return path.join(base, f"satnogs_{self.name}")
+        raise OSError("cgroup v2 is not available")
+
+    def join_cgroup(self):
+        """Put the monitor in its own cgroup v2 with cpu.max and memory.max."""
+        try:
+            group = self.cgroup_path()
+            try:
+                with open(
+                    path.join(path.dirname(group), "cgroup.subtree_control"), "w"
+                ) as f:
+                    f.write("+cpu +memory")
+            except OSError:
+                pass  # already enabled, or the parent is not ours to change
+            makedirs(group, exist_ok=True)
+            if self.cpu_quota:
+                period = 100000
+                with open(path.join(group, "cpu.max"), "w") as f:
+                    f.write(f"{int(float(self.cpu_quota) * period / 100)} {period}")
+            if self.memory_max:
+                with open(path.join(group, "memory.max"), "w") as f:
+                    f.write(self.memory_max)
+            with open(path.join(group, "cgroup.procs"), "w") as f:
+                f.write(str(getpid()))
+            self.cgroup = group
+        except (OSError, ValueError) as e:
+            LOGGER.warning(
+                f"{self.name}: unable to apply cgroup limits, "
+                f"the cgroup needs to be writable: {e}"
+            )
+
+    def remove_cgroup(self):
+        try:
+            rmdir(self.cgroup_path())
+        except OSError:
+            pass
+
+
+class Supervisor(object):
+    """Runs an add-on command or pipeline in its own process group, under a small
+    monitor process that reaps it, records CPU/RSS and stops it gracefully.
+
+    The state file in SATNOGS_APP_PATH has the monitor pid and start time, so a
+    stale file is never used to signal an unrelated process.
+    """
+
+    def __init__(self, name, station=None):
+        self.name = name
+        station = getenv("SATNOGS_STATION_ID", "0") if station is None else station
+        self.state_file = (
+            f"{getenv('SATNOGS_APP_PATH', '/tmp/.satnogs')}/{name}_{station}.proc"
+        )
+        self.schedule = Schedule(name)
+
+    def read_state(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return load(f)
+        except (FileNotFoundError, JSONDecodeError):
+            return None
+
+    def write_state(self, state):
+        with open(f"{self.state_file}.tmp", "w") as f:
+            dump(state, f)
+        replace(f"{self.state_file}.tmp", self.state_file)
+
+    def running(self, state=None):
+        """State of the monitor if it is still running, None otherwise."""
+        state = state or self.read_state()
+        if state is None or "exit" in state:
+            return None
+        if start_time(state["pid"]) != state["start"]:
+            return None
+        return state
+
+    def start(self, cmd, log=None, timeout=STOP_TIMEOUT, env=None, wait=5.0):
+        """Launch the monitor in the background, returns its pid, or None if an
+        optional add-on was refused because of the CPU load.
+        """
+        if self.running():
+            LOGGER.warning(f"{self.name} is already running, stopping it first")
+            self.stop()
+        if not self.schedule.admit():
+            return None
+        try:
+            unlink(self.state_file)
+        except FileNotFoundError:
+            pass
+        monitor = [executable, path.abspath(__file__), "run", self.name]
+        monitor += ["-t", str(timeout)] + (["-l", log] if log else []) + ["--"] + cmd
+        proc = Popen(
+            monitor, env=env, stdout=DEVNULL, stderr=DEVNULL, start_new_session=True
+        )
+        deadline = monotonic() + wait
+        while self.read_state() is None and monotonic() < deadline:
+            if proc.poll() is not None:
+                break
+            sleep(0.01)
+        return proc.pid
+
+    def stop(self, wait=None):
+        """Ask the monitor to stop the command, returns True if it ended by itself
+        within the timeout, False if it was killed or was not running.
+        """
+        state = self.running()
+        if state is None:
+            self.report(self.read_state())  # ended by itself, or never started
+            return False
+        wait = state["timeout"] + KILL_GRACE + 1 if wait is None else wait
+        try:
+            kill(state["pid"], SIGTERM)
+        except ProcessLookupError:
+            return False
+        deadline = monotonic() + wait
+        while start_time(state["pid"]) == state["start"]:
+            if monotonic() > deadline:
+                LOGGER.warning(f"{self.name} monitor did not exit")
+                return False
+            sleep(0.05)
+        final = self.read_state() or {}
+        self.report(final)
+        if self.schedule.cpu_quota or self.schedule.memory_max:
+            self.schedule.remove_cgroup()
+        return final.get("exit", {}).get("graceful", False)
+
+    def report(self, state):
+        """Log how the commands ended, the record stays in the state file until
+        the next start. A state without one is left by a dead monitor.
+        """
+        if state is None:
+            return
+        if "exit" not in state:
+            self.cleanup()
+            return
+        result = state["exit"]
+        failed = not result["graceful"] and any(
+            p["code"] != 0 for p in result["processes"]
+        )
+        LOGGER.log(
+            logging.WARNING if failed else logging.INFO,
+            f"{self.name}: "
+            + ("stopped" if result["stopped"] else "ended")
+            + ("" if result["graceful"] or not result["stopped"] else " forcibly")
+            + ", "
+            + ", ".join(
+                f"{p['cmd']} exited {p['code']} after {p['cpu_s']}s CPU, "
+                + (
+                    f"{p['max_rss_kb']} kB"
+                    if p.get("max_rss_kb") is not None
+                    else f"at most {p['max_rss_kb_bound']} kB"
+                )
+                for p in result["processes"]
+            ),
+        )
+
+    def cleanup(self):
+        try:
+            unlink(self.state_file)
+        except FileNotFoundError:
+            pass
+
+    def usage(self):
+        """Per process CPU percentage and RSS from the last sample."""
+        state = self.running()
+        return {} if state is None else state.get("usage", {})
+
+    def run(self, cmd, log=None, timeout=STOP_TIMEOUT):
+        """Monitor: start the stages, reap them and handle the stop request."""
+        self.stopping = False
+        signal(SIGTERM, self.request_stop)  # until the signals are blocked
+        try:
+            CDLL(None).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)  # reap orphans too
+        except (OSError, AttributeError):
+            pass
+        if log:  # else the monitor logs only reach the state file
+            handler = logging.FileHandler(log)
+            handler.setFormatter(
+                logging.Formatter("%(asctime)s %(name)s - %(levelname)s - %(message)s")
+            )
+            LOGGER.addHandler(handler)
+        self.schedule.apply()
+        out = open(log, "a") if log else DEVNULL
+        stages = []
+        commands = [[]]
+        for arg in cmd:
+            if arg == PIPE_TOKEN:
+                commands.append([])
+            else:
+                commands[-1].append(arg)
+        try:
+            for i, command in enumerate(commands):
+                proc = Popen(
+                    command,
+                    stdin=stages[-1].stdout if stages else DEVNULL,
+                    stdout=out if i == len(commands) - 1 else PIPE,
+                    stderr=out,
+                )
+                if stages:
+                    stages[-1].stdout.close()  # only the next stage holds the pipe
+                stages.append(proc)
+        except OSError as e:
+            LOGGER.error(f"{self.name}: unable to start {command[0]}: {e}")
+            for proc in stages:
+                proc.kill()
+        pthread_sigmask(SIG_BLOCK, [SIGCHLD, SIGTERM, SIGINT])
+        pids = {proc.pid: proc.args[0] for proc in stages}
+        state = {
+            "pid": getpid(),
+            "start": start_time(getpid()),
+            "timeout": timeout,
+            "started": time(),
+            "cmd": cmd,
+            "pids": list(pids),
+        }
+        self.write_state(state)
+        LOGGER.info(f"{self.name}: started {' '.join(cmd)}")
+
+        exits = {}
+        peaks = {}  # VmHWM of the commands, rusage has the monitor's from the fork
+        deadline = None
+        escalated = 0  # 1 after SIGTERM to every stage, 2 after SIGKILL
+        last_usage, last_sample = group_usage(getpid()), monotonic()
+        while True:
+            self.reap(pids, exits, peaks)
+            if len(exits) == len(pids):
+                break
+            now = monotonic()
+            if self.stopping and deadline is None:
+                # the first stage ends, the rest see EOF and flush their output
+                self.signal([stages[0].pid], SIGTERM, exits)
+                deadline = now + timeout
+            elif deadline is not None and escalated == 0 and now > deadline:
+                LOGGER.warning(f"{self.name}: not done after {timeout}s, terminating")
+                self.signal(pids, SIGTERM, exits)
+                escalated = 1
+            elif escalated == 1 and now > deadline + KILL_GRACE:
+                LOGGER.warning(f"{self.name}: killing")
+                self.signal(group_usage(getpid()), SIGKILL, {getpid(): None})
+                escalated = 2
+            if now - last_sample >= STATS_INTERVAL:
+                usage = group_usage(getpid())
+                for pid in pids:
+                    peaks[pid] = peak_rss(pid) or peaks.get(pid)
+                state["usage"] = {
+                    str(pid): {
+                        "name": u["name"],
+                        "cpu": round(
+                            100
+                            * (u["ticks"] - last_usage.get(pid, {}).get("ticks", 0))
+                            / CLK_TCK
+                            / (now - last_sample),
+                            1,
+                        ),
+                        "rss_kb": u["rss_kb"],
+                    }
+                    for pid, u in usage.items()
+                    if pid != getpid()
+                }
+                last_usage, last_sample = usage, now
+                self.write_state(state)
+            wake = last_sample + STATS_INTERVAL - now
+            if deadline is not None and escalated < 2:
+                wake = min(wake, deadline + KILL_GRACE * escalated - now)
+            signum = sigtimedwait([SIGCHLD, SIGTERM, SIGINT], max(wake, 0.01))
+            if signum is not None and signum.si_signo in (SIGTERM, SIGINT):
+                self.stopping = True
+
+        leftover = [pid for pid in group_usage(getpid()) if pid != getpid()]
+        self.signal(leftover, SIGTERM, {})
+        state["exit"] = {
+            "graceful": self.stopping and escalated == 0,
+            "stopped": self.stopping,
+            "processes": list(exits.values()),
+        }
+        state.pop("usage", None)
+        self.write_state(state)
+        self.schedule.record_cost(
+            sum(e["cpu_s"] for e in exits.values()), time() - state["started"]
+        )
+        LOGGER.info(f"{self.name}: done")
+
+    def reap(self, pids, exits, peaks):
+        """Collect everything that has exited, orphaned grandchildren included.
+
+        The peak memory is from the last sample, or an upper bound from rusage
+        for commands that ended before one, as it includes the monitor's.
+        """
+        while True:
+            try:
+                pid, status, rusage = wait4(-1, WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in pids:
+                exits[pid] = {
+                    "cmd": pids[pid],
+                    "code": waitstatus_to_exitcode(status),
+                    "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 2),
+                    "max_rss_kb": peaks.get(pid),
+                    "max_rss_kb_bound": rusage.ru_maxrss,
+                }
+                LOGGER.info(f"{self.name}: {pids[pid]} exited {exits[pid]}")
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    @staticmethod
+    def signal(pids, signum, exits):
+        for pid in pids:
+            if pid in exits:
+                continue
+            try:
+                kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+
+def states():
+    """Every supervisor state file in SATNOGS_APP_PATH."""
+    app_path = getenv("SATNOGS_APP_PATH", "/tmp/.satnogs")
+    for entry in sorted(listdir(app_path)):
+        if entry.endswith(".proc"):
+            name, _, station = entry[: -len(".proc")].rpartition("_")
+            supervisor = Supervisor(name, station)
+            yield supervisor, supervisor.read_state()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Start, stop and watch add-on processes",
+        epilog="example: supervisor.py start direwolf -- rx_fm ... - '|' direwolf ...",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ["start", "run"]:
+        p = sub.add_parser(
+            name, help="start in the background" if name == "start" else "monitor"
+        )
+        p.add_argument("name")
+        p.add_argument("-l", "--log", help="stdout and stderr of all commands")
+        p.add_argument(
+            "-t", "--timeout", type=float, default=STOP_TIMEOUT, help="graceful stop"
+        )
+        p.add_argument("command", nargs="+", help="command, pipelines split by '|'")
+    p = sub.add_parser("stop", help="stop and wait for the command to finish")
+    p.add_argument("name")
+    sub.add_parser("status", help="CPU and memory use of the running commands")
+    args = parser.parse_args()
+
+    if args.cmd == "start":
+        if Supervisor(args.name).start(args.command, args.log, args.timeout) is None:
+            exit(1)
+    elif args.cmd == "run":
+        Supervisor(args.name).run(args.command, args.log, args.timeout)
+    elif args.cmd == "stop":
+        Supervisor(args.name).stop()
+    else:
+        for supervisor, state in states():
+            if state is None or supervisor.running(state) is None:
+                continue
+            print(f"{supervisor.name}: {' '.join(state['cmd'])}")
+            for pid, u in state.get("usage", {}).items():
+                print(
+                    f"  {pid:>7} {u['name']:<16} {u['cpu']:5.1f}% {u['rss_kb']:>8} kB"
+                )
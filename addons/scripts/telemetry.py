@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from os import getenv, getpgid, listdir, path, unlink
+from signal import signal, SIGTERM
+from threading import Event, Thread
+from time import time
+
+import psutil
+
+from supervisor import states
+from udp2stdout import udp_sockets
+
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(
+        logging, getenv("TELEMETRY_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    ),
+)
+LOGGER = logging.getLogger("telemetry")
+
+try:
+    INTERVAL = float(getenv("TELEMETRY_INTERVAL", "1"))
+except ValueError:
+    INTERVAL = 1.0
+try:
+    PORT = int(getenv("TELEMETRY_PORT", "0"))  # prometheus endpoint, 0 is off
+except ValueError:
+    PORT = 0
+try:
+    KEEP = int(getenv("TELEMETRY_KEEP", "50"))  # observations kept
+except ValueError:
+    KEEP = 50
+UDP_PORTS = ["UDP_DUMP_PORT", "GRSAT_UDP_PORT", "SATDUMP_UDP_PORT", "METEOR_UDP_PORT"]
+
+
+class Recorder(object):
+    """Samples the flowgraph, the supervised add-ons and the UDP sockets every
+    INTERVAL seconds for one observation.
+
+    Every sample is a line of JSON in telemetry_<obs_id>.jsonl, per add-on
+    [cpu %, rss kB, read kB, written kB] and per port [rx_queue, drops].
+    """
+
+    def __init__(self, obs_id, script="", out_dir=None):
+        self.obs_id = obs_id
+        self.script = script  # flowgraph, satnogs_fsk.py etc
+        self.out_dir = out_dir or getenv("SATNOGS_APP_PATH", "/tmp/.satnogs")
+        self.out_file = path.join(self.out_dir, f"telemetry_{obs_id}.jsonl")
+        self.ports = set()
+        for var in UDP_PORTS:
+            try:
+                self.ports.add(int(getenv(var, "57356" if var == UDP_PORTS[0] else "")))
+            except ValueError:
+                pass
+        self.flowgraph = None
+        self.sample = {}
+        self.first = None
+        self.peak = {}
+        self.stopped = Event()
+
+    def find_flowgraph(self):
+        for p in psutil.process_iter(["cmdline"]):
+            cmdline = p.info["cmdline"] or []
+            if any(arg.endswith(self.script) for arg in cmdline[:3]):
+                return p.pid
+        return None
+
+    def add_ons(self):
+        """Process group of every running supervised add-on."""
+        groups = {}
+        for supervisor, state in states():
+            if state is not None and supervisor.running(state) is not None:
+                groups[state["pid"]] = supervisor.name
+        return groups
+
+    def take(self):
+        if self.flowgraph is None and self.script:
+            self.flowgraph = self.find_flowgraph()
+        groups = self.add_ons()
+        procs = {}
+        for p in psutil.process_iter():
+            try:
+                if p.pid == self.flowgraph:
+                    name = "flowgraph"
+                else:
+                    name = groups.get(getpgid(p.pid))
+                if name is None or p.pid in groups:  # skip the monitors
+                    continue
+                with p.oneshot():
+                    cpu = p.cpu_percent()
+                    rss = p.memory_info().rss
+                    try:
+                        io = p.io_counters()
+                        read, written = io.read_bytes, io.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        read = written = 0
+            except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError):
+                continue
+            total = procs.setdefault(name, [0.0, 0, 0, 0])
+            total[0] += cpu
+            total[1] += rss // 1024
+            total[2] += read // 1024
+            total[3] += written // 1024
+        if self.flowgraph is not None and "flowgraph" not in procs:
+            self.flowgraph = None  # restarted
+        mem = psutil.virtual_memory()
+        disk = psutil.disk_io_counters()
+        self.sample = {
+            "t": round(time(), 1),
+            "cpu": psutil.cpu_percent(),
+            "load": round(psutil.getloadavg()[0], 2),
+            "mem_avail_kb": mem.available // 1024,
+            "disk_kb": (
+                [disk.read_bytes // 1024, disk.write_bytes // 1024] if disk else None
+            ),
+            "proc": {name: [round(v[0], 1)] + v[1:] for name, v in procs.items()},
+            "udp": {
+                str(info.port): [info.rx_queue, info.drops]
+                for info in udp_sockets()
+                if info.port in self.ports
+            },
+        }
+        if self.first is None:
+            self.first = self.sample
+        for name, (cpu, rss, _, _) in procs.items():
+            peak = self.peak.setdefault(name, [0.0, 0])
+            peak[0], peak[1] = max(peak[0], cpu), max(peak[1], rss)
+        return self.sample
+
+    def summary(self):
+        """Peak cpu and rss per add-on and UDP drops during the observation."""
+        drops = {}
+        for port, (_, dropped) in self.sample.get("udp", {}).items():
+            start = self.first.get("udp", {}).get(port, (0, dropped))[1]
+            drops[port] = dropped - start
+        return {"summary": {"peak": self.peak, "udp_drops": drops}}
+
+    def run(self):
+        signal(SIGTERM, lambda signum, frame: self.stopped.set())
+        psutil.cpu_percent()
+        if PORT > 0:
+            server = ThreadingHTTPServer(("", PORT), self.handler())
+            Thread(target=server.serve_forever, daemon=True).start()
+        with open(self.out_file, "w") as f:
+            while not self.stopped.is_set():
+                f.write(dumps(self.take(), separators=(",", ":")) + "\n")
+                f.flush()
+                self.stopped.wait(INTERVAL)
+            summary = self.summary()
+            f.write(dumps(summary, separators=(",", ":")) + "\n")
+        LOGGER.info(f"{self.out_file}: {summary}")
+        cleanup(self.out_dir)
+
+    def metrics(self):
+        """Latest sample in the prometheus text format."""
+        s = self.sample
+        if not s:
+            return ""
+        obs = f'obs_id="{self.obs_id}"'
+        lines = [
+            f"satnogs_cpu_percent{{{obs}}} {s['cpu']}",
+            f"satnogs_load1{{{obs}}} {s['load']}",
+            f"satnogs_memory_available_bytes{{{obs}}} {s['mem_avail_kb'] * 1024}",
+        ]
+        if s["disk_kb"]:
+            lines += [
+                f"satnogs_disk_read_bytes_total{{{obs}}} {s['disk_kb'][0] * 1024}",
+                f"satnogs_disk_written_bytes_total{{{obs}}} {s['disk_kb'][1] * 1024}",
+            ]
+        for name, (cpu, rss, read, written) in s["proc"].items():
+            labels = f'{obs},process="{name}"'
+            lines += [
+                f"satnogs_process_cpu_percent{{{labels}}} {cpu}",
+                f"satnogs_process_rss_bytes{{{labels}}} {rss * 1024}",
+                f"satnogs_process_read_bytes_total{{{labels}}} {read * 1024}",
+                f"satnogs_process_written_bytes_total{{{labels}}} {written * 1024}",
+            ]
+        for port, (queue, drops) in s["udp"].items():
+            labels = f'{obs},port="{port}"'
+            lines += [
+                f"satnogs_udp_rx_queue_bytes{{{labels}}} {queue}",
+                f"satnogs_udp_drops_total{{{labels}}} {drops}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def handler(self):
+        recorder = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = recorder.metrics().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+
+def cleanup(out_dir, keep=KEEP):
+    """Remove all but the newest keep recordings."""
+    files = sorted(
+        (path.join(out_dir, f) for f in listdir(out_dir) if f.startswith("telemetry_")),
+        key=path.getmtime,
+    )
+    for f in files[: max(len(files) - keep, 0)]:
+        unlink(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record CPU, memory, IO and UDP drops during an observation"
+    )
+    parser.add_argument("obs_id")
+    parser.add_argument("script", nargs="?", default="", help="flowgraph script")
+    parser.add_argument("-o", "--out", help="directory, default SATNOGS_APP_PATH")
+    args = parser.parse_args()
+    Recorder(args.obs_id, args.script, args.out).run()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from bandscan_stats import BurstFinder
+
+
+def runs(above):
+    """(channel, start, end) of every run, end exclusive, one row at a time."""
+    found = []
+    for chan in range(above.shape[1]):
+        start = None
+        for row, value in enumerate(above[:, chan]):
+            if value and start is None:
+                start = row
+            elif not value and start is not None:
+                found.append((chan, start, row))
+                start = None
+        if start is not None:
+            found.append((chan, start, len(above)))
+    return sorted(found)
+
+
+def find(above, block_rows):
+    finder = BurstFinder(above.shape[1])
+    for offset in range(0, len(above), block_rows):
+        finder.feed(above[offset : offset + block_rows], offset)
+    chans, starts, ends = finder.finish(len(above))
+    return sorted(zip(chans.tolist(), starts.tolist(), ends.tolist()))
+
+
+def test_runs_continue_across_blocks():
+    above = np.zeros((10, 3), dtype=bool)
+    above[2:8, 0] = True  # spans three blocks
+    above[3:4, 1] = True
+    above[6:8, 1] = True  # two runs in one block
+    above[8:, 2] = True  # still going at the end
+    assert find(above, 3) == [(0, 2, 8), (1, 3, 4), (1, 6, 8), (2, 8, 10)]
+
+
+def test_run_from_the_first_row():
+    above = np.ones((4, 1), dtype=bool)
+    assert find(above, 2) == [(0, 0, 4)]
+
+
+@pytest.mark.parametrize("block_rows", [1, 2, 7, 64, 500])
+def test_matches_a_row_by_row_search(block_rows):
+    above = np.random.default_rng(1).random((300, 16)) > 0.6
+    assert find(above, block_rows) == runs(above)
+
+
+def test_nothing_above():
+    assert find(np.zeros((5, 4), dtype=bool), 2) == []
@@ -0,0 +1,87 @@
+from socketserver import UnixStreamServer
+from threading import Thread
+
+import pytest
+
+import gpio
+from gpio import Controller, RequestHandler, StubDevice, pin_values
+
+
+def test_pin_values():
+    assert pin_values({"lna": 1, "freq": 145800000, "pa": 1, "rot": 0}) == {
+        0: False,
+        1: False,
+        2: True,
+        3: True,
+    }
+    assert pin_values({"freq": 437000000}) == {1: True}
+    assert pin_values({}) == {}
+
+
+def test_only_changed_pins_are_written():
+    controller = Controller("stub")
+    assert controller.apply({"lna": 1, "freq": 437000000}) == [0, 1]
+    assert controller.apply({"lna": 1, "freq": 437000000}) == []
+    assert controller.apply({"lna": 0, "freq": 437000000}) == [0]
+    assert controller.device.writes == 3
+    assert controller.device.values == [True, True, False, False]
+    assert controller.status() == {
+        "lna": True,
+        "antenna": True,
+        "pa": None,
+        "rot": None,
+    }
+
+
+@pytest.fixture
+def failing(monkeypatch):
+    """The stub fails on the next writes, like an unplugged device."""
+    failures = []
+    write = StubDevice.write
+
+    def flaky(self, pin, value):
+        if failures:
+            failures.pop()
+            raise OSError("USB error")
+        write(self, pin, value)
+
+    monkeypatch.setattr(StubDevice, "write", flaky)
+    return failures
+
+
+def test_reopened_and_retried_after_a_failure(failing):
+    controller = Controller("stub")
+    controller.apply({"pa": 1, "rot": 1})
+    device = controller.device
+    failing.append(1)
+    assert controller.apply({"pa": 1, "lna": 1}) == [0, 2]  # nothing cached
+    assert controller.device is not device
+    assert controller.device.values[:3] == [False, False, True]
+
+
+def test_none_after_the_retry_fails(failing):
+    controller = Controller("stub")
+    failing.extend([1, 1])
+    assert controller.apply({"pa": 1}) is None
+    assert controller.device is None
+    assert controller.status()["pa"] is None
+    assert controller.apply({"pa": 1}) == [2]
+
+
+def test_requests_over_the_socket(tmp_path):
+    sock_path = str(tmp_path / "gpio.sock")
+    server = UnixStreamServer(sock_path, RequestHandler)
+    server.controller = Controller("stub")
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        reply = gpio.request({"freq": 437000000, "pa": 1}, sock_path)
+        assert reply["changed"] == [1, 2]
+        assert reply["state"]["antenna"] is True
+        assert gpio.request({"pa": 1}, sock_path)["changed"] == []
+        assert "error" in gpio.request({"pa": "on"}, sock_path)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert gpio.request({"pa": 1}, str(tmp_path / "missing.sock")) is None
@@ -0,0 +1,89 @@
+from base64 import b64decode
+from io import BytesIO
+from json import loads
+from struct import pack
+
+import pytest
+
+import grsat
+
+TLE = '{"tle0": "TEST", "tle1": "", "tle2": "2 99999 0"}'
+STAMP = pack(">Q", 1704067200000)  # 2024-01-01T00:00:00
+
+
+def kiss(*frames):
+    return b"".join(b"\xc0\x09" + STAMP + b"\xc0\xc0\x00" + f + b"\xc0" for f in frames)
+
+
+@pytest.fixture
+def station(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    monkeypatch.setenv("SATNOGS_APP_PATH", str(tmp_path))
+    monkeypatch.setenv("SATNOGS_OUTPUT_PATH", str(tmp_path / "data"))
+    monkeypatch.setenv("GRSAT_SAMP_RATE", "48000")
+    return tmp_path
+
+
+def grsat_obs(cmd="stop"):
+    return grsat.GrSat(cmd, "42", "437e6", TLE, "2024-01-01T00-00-00", "9600", "")
+
+
+def exported(station):
+    """Frames in the data files, by file name."""
+    return {
+        p.name: b64decode(loads(p.read_text())["pdu"])
+        for p in (station / "data").iterdir()
+    }
+
+
+def test_stop_exports_after_the_live_frames(station, monkeypatch):
+    live = grsat_obs("live")
+    with open(live.kiss_file, "wb") as f:
+        f.write(kiss(b"one", b"two"))
+    monkeypatch.setattr(grsat, "sleep", lambda s: live.stop_following(None, None))
+    live.follow_kiss()
+    assert sorted(exported(station).values()) == [b"one", b"two"]
+    with open(live.kiss_file, "ab") as f:
+        f.write(kiss(b"three"))  # after the live process was killed
+
+    obs = grsat_obs()
+    obs.stop_gr_satellites()  # the live process is not running, so not done
+    files = exported(station)
+    assert sorted(files.values()) == [b"one", b"three", b"two"]
+    assert files["data_42_2024-01-01T00-00-00_g2"] == b"three"
+    assert sorted(p.name for p in station.glob("grsat_42*")) == []
+
+
+def test_stop_exports_everything_without_live_state(station):
+    obs = grsat_obs()
+    with open(obs.kiss_file, "wb") as f:
+        f.write(kiss(b"one", b"two"))
+    obs.kiss_to_json()
+    assert sorted(exported(station).values()) == [b"one", b"two"]
+
+
+def test_new_exports_follow_the_existing_suffixes(station):
+    data = station / "data"
+    prefix = "data_42_2024-01-01T00-00-00"
+    for name in ["_g0", "_g1", "_g3", "_gx", ""]:
+        (data / f"{prefix}{name}").write_text("old")
+    (data / "data_43_2024-01-01T00-00-00_g7").write_text("other observation")
+    obs = grsat_obs()
+    assert obs.scan_suffixes() == {"2024-01-01T00-00-00": 4}
+    with open(obs.kiss_file, "wb") as f:
+        f.write(kiss(b"one", b"two"))
+    obs.kiss_to_json()
+    (data / f"{prefix}_g6").write_text("written meanwhile")
+    obs.write_frames(grsat.parse_kiss_file(BytesIO(kiss(b"three", b"four"))))
+    new = {
+        p.name[len(prefix) :]: p.read_text()
+        for p in data.glob(f"{prefix}_g*")
+        if p.read_text() not in ["old", "written meanwhile"]
+    }
+    assert {name: b64decode(loads(pdu)["pdu"]) for name, pdu in new.items()} == {
+        "_g4": b"one",
+        "_g5": b"two",
+        "_g7": b"three",
+        "_g8": b"four",
+    }
+    assert (data / f"{prefix}_g6").read_text() == "written meanwhile"
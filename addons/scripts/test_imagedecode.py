@@ -0,0 +1,228 @@
+from struct import pack
+
+from imagedecode import ChunkStore, ImageDecode
+from imagedecode import Cas5aDecode, Lucky7Decode, SharjahsatDecode, SirenDecode
+from imagedecode import StratosatDecode
+
+
+def test_gaps_and_fill():
+    store = ChunkStore(max_size=100, max_gap=50)
+    store.write(0, b"a" * 10)
+    store.write(20, b"b" * 10)
+    assert len(store) == 30
+    assert store.ranges() == [[0, 10], [20, 30]]
+    assert store.gaps() == [(10, 20)]
+    assert store.fill() == 100.0 * 20 / 30
+    assert store.getvalue() == b"a" * 10 + b"\x00" * 10 + b"b" * 10
+
+
+def test_gap_at_the_start():
+    store = ChunkStore(max_size=100, max_gap=50)
+    store.write(10, b"x" * 5)
+    assert store.gaps() == [(0, 10)]
+    assert store.getvalue(8, 12) == b"\x00\x00xx"
+
+
+def test_overlaps_merge_and_the_last_write_wins():
+    store = ChunkStore(max_size=100, max_gap=50)
+    store.write(0, b"a" * 10)
+    store.write(5, b"b" * 10)
+    store.write(10, b"c" * 2)
+    assert store.ranges() == [[0, 15]]
+    assert store.gaps() == []
+    assert store.getvalue() == b"a" * 5 + b"b" * 5 + b"cc" + b"b" * 3
+
+
+def test_a_resent_chunk_replaces_the_one_at_its_address():
+    store = ChunkStore(max_size=100, max_gap=50)
+    store.write(0, b"a" * 10)
+    store.write(0, b"d" * 3)
+    assert store.ranges() == [[0, 3]]
+    assert store.getvalue() == b"ddd"
+
+
+def test_rejects_chunks_outside_the_image():
+    store = ChunkStore(max_size=100, max_gap=50)
+    assert store.write(-1, b"x") is False
+    assert store.write(95, b"x" * 6) is False
+    assert store.write(95, b"x" * 5) is True
+    assert (store.accepted, store.rejected) == (1, 2)
+    assert len(store) == 100
+
+
+def test_chunks_after_a_large_gap_are_dropped():
+    store = ChunkStore(max_size=1000, max_gap=50)
+    store.write(0, b"a" * 10)
+    store.write(500, b"b" * 10)
+    assert store.ranges() == [[0, 10]]
+    assert len(store) == 10
+    assert store.getvalue() == b"a" * 10
+
+
+def test_dirty_range_and_clear():
+    store = ChunkStore(max_size=100, max_gap=50)
+    assert store.dirty is None
+    store.write(20, b"x" * 5)
+    store.write(10, b"y" * 2)
+    assert store.dirty == (10, 25)
+    store.clear()
+    assert (len(store), store.dirty, store.accepted, store.fill()) == (0, None, 0, 0.0)
+
+
+def test_preview_keeps_the_rest_when_the_first_chunk_is_resent(tmp_path):
+    decoder = ImageDecode(image_file=str(tmp_path / "image"))
+    decoder.image_ts = ""
+    decoder.imagedata.write(0, b"A" * 10)
+    decoder.imagedata.write(10, b"B" * 10)
+    decoder.update(force=True)
+    preview = tmp_path / "image.jpg"
+    assert preview.read_bytes() == b"A" * 10 + b"B" * 10
+    decoder.imagedata.write(0, b"C" * 10)
+    decoder.update(force=True)
+    assert preview.read_bytes() == b"C" * 10 + b"B" * 10
+    decoder.imagedata.write(20, b"D" * 5)
+    decoder.update(force=True)
+    assert preview.read_bytes() == b"C" * 10 + b"B" * 10 + b"D" * 5
+
+
+def kiss_file(tmp_path, frames):
+    path = tmp_path / "frames.kiss"
+    escaped = (
+        f.replace(b"\xdb", b"\xdb\xdd").replace(b"\xc0", b"\xdb\xdc") for f in frames
+    )
+    path.write_bytes(b"".join(b"\xc0\x00" + frame + b"\xc0" for frame in escaped))
+    return str(path)
+
+
+def images(tmp_path):
+    return {p.name[len("image") :]: p.read_bytes() for p in tmp_path.glob("image*")}
+
+
+def decode(decoder, norad, tmp_path, frames):
+    result = decoder(kiss_file(tmp_path, frames), norad, str(tmp_path / "image"))
+    return result, images(tmp_path)
+
+
+def stratosat(cmd, addr, payload, mode=b"\x00\x00"):
+    row = cmd + pack("<B2sHB", len(payload) + 6, mode, addr & 0xFFFF, addr >> 16)
+    return (row + payload).ljust(64, b"\x00")
+
+
+def test_stratosat(tmp_path):
+    jpeg = b"\xff\xd8\xff" + bytes(range(53))
+    frames = [
+        stratosat(b"\x01\x00", 0x10038, b"b" * 56),  # before the start frame
+        stratosat(b"\x01\x00", 0x10000, jpeg),  # the offset is its address
+        stratosat(b"\x02\x00", 0x10070, b"x" * 56),  # another command
+        stratosat(b"\x01\x00", 0x0FFF0, b"y" * 56),  # before the offset
+        stratosat(b"\x01\x00", 0x10070, b"c" * 20),
+        stratosat(b"\x01\x00", 0x10070, b"c" * 20)[:63],  # not 64 bytes
+    ]
+    decoder, written = decode(StratosatDecode, 53385, tmp_path, frames)
+    assert decoder.start == (b"\x01\x00", 0x10000)
+    assert decoder.imagedata.ranges() == [[0, 132]]
+    assert StratosatDecode.image_id(frames[1]) is None
+    assert list(written.values()) == [jpeg + b"b" * 56 + b"c" * 20]
+
+
+def test_stratosat_high_resolution_starts_at_zero(tmp_path):
+    jpeg = b"\xff\xd8\xff" + b"a" * 53
+    frames = [stratosat(b"\x01\x00", 0x38, jpeg, mode=b"\x20\x98")]
+    decoder, written = decode(StratosatDecode, 57167, tmp_path, frames)
+    assert decoder.start == (b"\x01\x00", 0)
+    assert decoder.imagedata.ranges() == [[0x38, 0x38 + 56]]
+    assert list(written.values()) == [b"\x00" * 0x38 + jpeg]
+
+
+def siren(cmd, addr, payload):
+    return b"h" * 16 + cmd + b"\x00" * 7 + pack("<I", addr) + payload
+
+
+def test_siren(tmp_path):
+    jpeg = b"\xff\xd8\xff" + b"a" * 97
+    frames = [
+        siren(b"\x24\x0c", 0x264, b"b" * 100),  # before the start frame
+        siren(b"\x24\x0c", 0x200, jpeg),  # the offset is its address
+        siren(b"\x24\x0d", 0x2C8, b"x" * 100),  # another command
+        siren(b"\x24\x0c", 0x100, b"y" * 100),  # before the offset
+        siren(b"\x24\x0c", 0x2C8, b"c" * 30),
+        siren(b"\x24\x0c", 0x2C8, b"")[:31],  # too short
+    ]
+    decoder, written = decode(SirenDecode, 53384, tmp_path, frames)
+    assert decoder.offset == 0x200
+    assert decoder.imagedata.ranges() == [[0, 230]]
+    assert list(written.values()) == [jpeg + b"b" * 100 + b"c" * 30]
+
+
+def sharjah(did, dtype, dlen, addr, payload):
+    return b"h" * 16 + did + pack("<BBH", dtype, dlen, addr) + b"\x00" * 2 + payload
+
+
+def test_sharjahsat_counts_down_from_the_start_frame(tmp_path):
+    jpeg = b"\xff\xd8\xff" + b"a" * 17
+    frames = [
+        sharjah(b"ESER", 0x41, 20, 4, b"b" * 20),
+        sharjah(b"ESER", 0x41, 20, 5, jpeg),  # the last address, at 0
+        sharjah(b"ESER", 0x41, 20, 6, b"x" * 20),  # after the last address
+        sharjah(b"ESEX", 0x41, 20, 3, b"x" * 20),  # another id
+        sharjah(b"ESER", 0x42, 20, 3, b"x" * 20),  # another type
+        sharjah(b"ESER", 0x41, 20, 3, b"c" * 20),
+    ]
+    decoder, written = decode(SharjahsatDecode, 55104, tmp_path, frames)
+    assert decoder.imagedata.ranges() == [[0, 60]]
+    assert list(written.values()) == [jpeg + b"b" * 20 + b"c" * 20]
+
+
+def cas5a(total, seq, pid, payload, ftype=3):
+    header = pack(">BHHH9s", ftype, total, seq, len(payload) + 16, pid)
+    return b"h" * 16 + header + payload + b"pad"
+
+
+def test_cas5a_images_by_photo_id(tmp_path):
+    first = bytes([23, 5, 1, 12, 30, 0, 1, 2, 3])
+    second = bytes([23, 5, 1, 12, 45, 0, 1, 2, 3])
+    frames = [
+        cas5a(3, 2, first, b"b" * 240),
+        cas5a(2, 1, second, b"X" * 240),
+        cas5a(3, 1, first, b"a" * 240),
+        cas5a(2, 2, second, b"Y" * 10),
+        cas5a(3, 3, first, b"x" * 240, ftype=4),  # not a photo
+        cas5a(3, 3, bytes([30]) + first[1:], b"x" * 240),  # bad year
+        cas5a(3, 4, first, b"x" * 240),  # past the total
+    ]
+    assert Cas5aDecode.image_id(frames[0]) == first.hex()
+    assert Cas5aDecode.image_id(frames[4]) is None
+    assert Cas5aDecode.image_id(frames[5]) is None
+    decoder, written = decode(Cas5aDecode, 54684, tmp_path, frames)
+    assert sorted(written) == [f"{decoder.image_ts}_0.jpg", f"{decoder.image_ts}_1.jpg"]
+    assert written[f"{decoder.image_ts}_0.jpg"] == b"a" * 240 + b"b" * 240
+    assert written[f"{decoder.image_ts}_1.jpg"] == b"X" * 240 + b"Y" * 10
+    first_report, second_report = decoder.reports
+    assert first_report["total_chunks"] == 3
+    assert first_report["missing"] == [2]
+    assert (second_report["total_chunks"], second_report["missing"]) == (2, [])
+
+
+def lucky7(oid, obc, packets, payload):
+    return pack(">BHHH", oid, obc, 0, packets) + payload.ljust(28, b"\x00") + b"crc"
+
+
+def test_lucky7_images_by_packet_id(tmp_path):
+    frames = [
+        lucky7(128, 0xC001, 7, b"b" * 28),
+        lucky7(0, 0xC000, 5, b"X" * 28),
+        lucky7(128, 0xC000, 7, b"a" * 28),
+        lucky7(128, 0xC002, 5, b"Z" * 28),
+        lucky7(64, 0xC002, 7, b"x" * 28),  # another id
+        lucky7(128, 0xBFFF, 7, b"x" * 28),  # not image data
+        lucky7(128, 0xC003, 7, b"x" * 28)[:34],  # too short
+    ]
+    assert Lucky7Decode.image_id(frames[0]) == "7"
+    assert Lucky7Decode.image_id(frames[4]) is None
+    assert Lucky7Decode.image_id(frames[5]) is None
+    decoder, written = decode(Lucky7Decode, 44406, tmp_path, frames)
+    assert written == {
+        f"{decoder.image_ts}_0.jpg": b"X" * 28 + b"\x00" * 28 + b"Z" * 28,
+        f"{decoder.image_ts}_1.jpg": b"a" * 28 + b"b" * 28,
+    }
+    assert [r["missing"] for r in decoder.reports] == [[1], []]
@@ -0,0 +1,81 @@
+from json import dump, load
+
+import pytest
+
+import iq_dump
+
+ZSTD = """#!/bin/sh
+for arg; do file="$arg"; done
+case "$file" in *iq_bad_*) exit 1;; esac
+exec /bin/mv "$file" "$file.zst"
+"""
+
+
+@pytest.fixture
+def dumps(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "zstd").write_text(ZSTD)
+    (bin_dir / "zstd").chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))  # no ionice either
+    monkeypatch.setenv("SATNOGS_APP_PATH", str(tmp_path))
+    monkeypatch.setenv("IQ_DUMP_FILENAME", str(tmp_path / "iq"))
+    monkeypatch.setattr(iq_dump, "nice", lambda increment: None)
+    return tmp_path
+
+
+def add_dump(tmp_path, obs_id):
+    name = iq_dump.dump_name(obs_id, 48000)
+    with open(f"{name}.raw", "wb") as f:
+        f.write(b"\x00" * 16)
+    iq_dump.write_meta(name, {"obs_id": obs_id, "file": f"iq_{obs_id}_48000.raw"})
+    return name
+
+
+def test_compress_the_queue(dumps):
+    first, bad = add_dump(dumps, 1), add_dump(dumps, "bad")
+    assert iq_dump.compress_queue() == 1
+    with open(f"{first}.json") as f:
+        assert load(f)["file"] == "iq_1_48000.raw.zst"
+    assert (dumps / "iq_1_48000.raw.zst").exists()
+    assert (dumps / "iq_bad_48000.raw.failed").exists()
+
+
+def test_a_dump_renamed_as_the_queue_empties(dumps, monkeypatch):
+    add_dump(dumps, 1)
+    pending_dumps = iq_dump.pending_dumps
+    late = []
+
+    def renamed_meanwhile():
+        pending = pending_dumps()
+        if not pending and not late:  # its worker finds the lock taken
+            late.append(add_dump(dumps, 2))
+        return pending
+
+    monkeypatch.setattr(iq_dump, "pending_dumps", renamed_meanwhile)
+    assert iq_dump.compress_queue() == 2
+    assert sorted(p.name for p in dumps.glob("*.zst")) == [
+        "iq_1_48000.raw.zst",
+        "iq_2_48000.raw.zst",
+    ]
+
+
+def test_without_zstd(dumps, monkeypatch):
+    monkeypatch.setenv("PATH", str(dumps / "missing"))
+    add_dump(dumps, 1)
+    assert iq_dump.compress_queue() == 0
+    assert (dumps / "iq_1_48000.raw").exists()
+
+
+def test_zstd_that_cannot_run(dumps):
+    (dumps / "bin" / "zstd").write_text("not a script")
+    add_dump(dumps, 1)
+    assert iq_dump.compress_queue() == 0
+    assert (dumps / "iq_1_48000.raw").exists()
+
+
+def test_bad_nice_setting(dumps, monkeypatch):
+    monkeypatch.setenv("IQ_COMPRESS_NICE", "low")
+    monkeypatch.setattr(iq_dump, "nice", lambda increment: pytest.fail("niced"))
+    add_dump(dumps, 1)
+    assert iq_dump.compress_queue() == 1
@@ -0,0 +1,63 @@
+from datetime import datetime
+from io import BytesIO
+from struct import pack
+
+from kiss import KissDecoder, parse_kiss_file
+
+TS = datetime(2024, 1, 1)
+
+
+def kiss(*frames):
+    return b"".join(b"\xc0\x00" + frame + b"\xc0" for frame in frames)
+
+
+def test_frames_split_across_chunks():
+    stream = kiss(b"first", b"second", b"third")
+    decoder = KissDecoder(TS)
+    frames = []
+    for i in range(len(stream)):
+        frames += decoder.feed(stream[i : i + 1])
+    assert frames == [(TS, b"first"), (TS, b"second"), (TS, b"third")]
+    assert decoder.num_frames == 3
+    assert decoder.buffer == b""
+
+
+def test_escapes_are_undone_once():
+    # FESC TFESC is an escaped FESC, not the start of an escaped FEND
+    stream = kiss(b"a\xdb\xdcb\xdb\xddc\xdb\xdd\xdc")
+    assert list(KissDecoder(TS).feed(stream)) == [(TS, b"a\xc0b\xdbc\xdb\xdc")]
+
+
+def test_escape_split_across_chunks():
+    stream = kiss(b"x\xdb\xdcy")
+    decoder = KissDecoder(TS)
+    frames = list(decoder.feed(stream[:4])) + list(decoder.feed(stream[4:]))
+    assert frames == [(TS, b"x\xc0y")]
+
+
+def test_timestamp_frames():
+    stamp = b"\xc0\x09" + pack(">Q", 1704067200500) + b"\xc0"
+    frames = list(KissDecoder(TS).feed(stamp + kiss(b"data")))
+    assert frames == [(datetime(2024, 1, 1, 0, 0, 0, 500000), b"data")]
+
+
+def test_flush_decodes_the_unterminated_frame():
+    decoder = KissDecoder(TS)
+    assert list(decoder.feed(kiss(b"done") + b"\xc0\x00partial")) == [(TS, b"done")]
+    assert list(decoder.flush()) == [(TS, b"partial")]
+    assert list(decoder.flush()) == []
+
+
+def test_read_continues_when_the_file_grows():
+    f = BytesIO(kiss(b"one") + b"\xc0\x00tw")
+    decoder = KissDecoder(TS)
+    assert list(decoder.read(f, chunk_size=2)) == [(TS, b"one")]
+    f.write(b"o\xc0")
+    f.seek(-2, 1)
+    assert list(decoder.read(f, chunk_size=2)) == [(TS, b"two")]
+
+
+def test_parse_kiss_file():
+    f = BytesIO(kiss(b"a", b"b") + b"\xc0\x00c")
+    frames = [frame for ts, frame in parse_kiss_file(f, TS, chunk_size=3)]
+    assert frames == [b"a", b"b", b"c"]
@@ -0,0 +1,108 @@
+from os import stat, utime
+
+import pytest
+
+import imagedecode
+import satyaml_index
+from imagedecode import DECODERS
+
+SATYAML = """name: {name}
+norad: {norad}
+transmitters:
+  1k2 FSK downlink:
+    frequency: 435.0e+6
+    modulation: FSK
+    baudrate: 1200
+    framing: AX.25
+  9k6 FSK downlink:
+    frequency: 435.0e+6
+    modulation: FSK
+    baudrate: 9600
+    framing: AX.25 G3RUH
+"""
+IMAGE_NORAD = next(iter(DECODERS))
+
+
+@pytest.fixture
+def satyaml(tmp_path, monkeypatch):
+    plugins = tmp_path / "imagedecode"
+    plugins.mkdir()
+    monkeypatch.setattr(imagedecode, "PLUGIN_PATH", str(plugins))
+    monkeypatch.setattr(satyaml_index, "PLUGIN_PATH", str(plugins))
+    (tmp_path / "A.yml").write_text(SATYAML.format(name="A", norad=10001))
+    (tmp_path / "B.yml").write_text(SATYAML.format(name="B", norad=IMAGE_NORAD))
+    (tmp_path / "C.yml").write_text(SATYAML.format(name="C dup", norad=10001))
+    (tmp_path / "broken.yml").write_text("name: [")
+    satyaml_index.load_index.cache_clear()
+    return tmp_path
+
+
+def build(satyaml):
+    index_file = satyaml / "satyaml.index"
+    assert satyaml_index.build(index_file, satyaml) == 2
+    return index_file
+
+
+def age(*paths):
+    """Move the mtime back, so a change within the same tick is newer."""
+    for p in paths:
+        mtime = stat(p).st_mtime - 10
+        utime(p, (mtime, mtime))
+
+
+def test_build_and_lookup(satyaml):
+    sats = satyaml_index.load_index(build(satyaml))["sats"]
+    entry = sats[10001]
+    assert entry["name"] == "A"  # the first file wins
+    assert entry["file"] == str(satyaml / "A.yml")
+    assert entry["bauds"] == [1200, 9600]
+    assert entry["framings"] == ["AX.25", "AX.25 G3RUH"]
+    assert entry["transmitters"][0]["frequency"] == 435e6
+    assert entry["image_decoder"] is False
+    assert sats[IMAGE_NORAD]["image_decoder"] is True
+
+
+def test_known_and_lookup_use_the_index(satyaml, monkeypatch):
+    index = satyaml_index.load_index(build(satyaml))
+    monkeypatch.setattr(satyaml_index, "load_index", lambda: index)
+    assert satyaml_index.known(10001) is True
+    assert satyaml_index.known(10002) is False
+    assert satyaml_index.lookup(10001)["name"] == "A"
+    assert satyaml_index.lookup(10002) is None
+    monkeypatch.setattr(satyaml_index, "load_index", lambda: None)
+    assert satyaml_index.known(10001) is None
+    assert satyaml_index.lookup(10001) is None
+
+
+def test_missing_or_broken_index(satyaml):
+    assert satyaml_index.load_index(satyaml / "missing.index") is None
+    (satyaml / "broken.index").write_bytes(b"not a pickle")
+    assert satyaml_index.load_index(satyaml / "broken.index") is None
+
+
+def test_newer_when_a_file_is_added(satyaml):
+    index_file = build(satyaml)
+    age(satyaml, satyaml / "imagedecode")
+    assert not satyaml_index.newer(satyaml, index_file, satyaml / "imagedecode")
+    (satyaml / "D.yml").write_text(SATYAML.format(name="D", norad=10003))
+    assert satyaml_index.newer(satyaml, index_file, satyaml / "imagedecode")
+    assert satyaml_index.load_index(index_file) is None
+
+
+def test_newer_when_a_plugin_is_added(satyaml):
+    index_file = build(satyaml)
+    age(satyaml, satyaml / "imagedecode")
+    assert satyaml_index.load_index(index_file) is not None
+    plugin = "class Decoder(object):\n    supported_norad = [10001]\n"
+    (satyaml / "imagedecode" / "a.py").write_text(plugin)
+    assert satyaml_index.newer(satyaml, index_file, satyaml / "imagedecode")
+    satyaml_index.load_index.cache_clear()
+    assert satyaml_index.load_index(index_file) is None
+    satyaml_index.load_index.cache_clear()
+    assert satyaml_index.load_index(build(satyaml))["sats"][10001]["image_decoder"]
+
+
+def test_a_missing_plugin_dir_is_ignored(satyaml):
+    index_file = build(satyaml)
+    age(satyaml)
+    assert not satyaml_index.newer(satyaml, index_file, satyaml / "missing")
@@ -0,0 +1,138 @@
+import logging
+from json import load
+from multiprocessing import Process
+from os import getpid
+
+import pytest
+
+import supervisor
+from supervisor import Schedule, parse_cpus
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("SATNOGS_APP_PATH", str(tmp_path))
+    monkeypatch.setenv("SATDUMP_CPUS", "0-1")
+    monkeypatch.setattr(supervisor, "OPTIONAL", ["satdump"])
+    monkeypatch.setattr(supervisor, "RESERVE", 50.0)
+    return tmp_path
+
+
+def busy(monkeypatch, percent):
+    monkeypatch.setattr(supervisor, "cpu_busy", lambda cpus: percent)
+
+
+def test_parse_cpus():
+    assert parse_cpus("0-2,5") == {0, 1, 2, 5}
+    assert parse_cpus("") == set()
+
+
+def test_record_cost(app):
+    schedule = Schedule("satdump")
+    assert schedule.costs() == {}
+    schedule.record_cost(30, 60)
+    Schedule("meteor").record_cost(10, 100)
+    schedule.record_cost(0.5, 0.5)  # too short to judge
+    assert schedule.costs() == {"satdump": 50.0, "meteor": 10.0}
+    assert sorted(p.name for p in app.iterdir()) == [
+        "supervisor.cost",
+        "supervisor.cost.lock",
+    ]
+
+
+def test_broken_cost_file(app):
+    (app / "supervisor.cost").write_text("{")
+    schedule = Schedule("satdump")
+    assert schedule.costs() == {}
+    schedule.record_cost(60, 60)
+    assert schedule.costs() == {"satdump": 100.0}
+
+
+def record(name):
+    for i in range(20):
+        Schedule(name).record_cost(i, 100)
+
+
+def test_concurrent_record_cost(app):
+    names = [f"addon{i}" for i in range(6)]
+    procs = [Process(target=record, args=(name,)) for name in names]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    with open(app / "supervisor.cost") as f:
+        assert load(f) == {name: 19.0 for name in names}
+
+
+def test_admit_by_cost_and_load(app, monkeypatch):
+    schedule = Schedule("satdump")
+    assert schedule.cpus == {0, 1}
+    busy(monkeypatch, 100)
+    assert schedule.admit()  # no cost recorded yet
+    schedule.record_cost(50, 100)
+    assert schedule.admit()  # 200 - 100 busy - 50 reserve = 50
+    busy(monkeypatch, 101)
+    assert not schedule.admit()
+
+
+def test_admit_without_a_cost_with_the_default_reserve(app, monkeypatch):
+    monkeypatch.setenv("SATDUMP_CPUS", "0")
+    monkeypatch.setattr(supervisor, "RESERVE", 100.0)
+    schedule = Schedule("satdump")
+    busy(monkeypatch, 31)
+    assert schedule.admit()  # nothing measured yet, it is started to measure it
+    schedule.record_cost(10, 100)
+    assert not schedule.admit()  # no room for 10% next to the reserve
+
+
+def test_required_addons_are_always_admitted(app, monkeypatch):
+    schedule = Schedule("iq_dump")
+    schedule.record_cost(400, 100)
+    busy(monkeypatch, 1000)
+    assert schedule.admit()
+
+
+@pytest.mark.parametrize("load_1m, percent", [(0.0, 0), (2.0, 100), (9.5, 200)])
+def test_cpu_busy_from_loadavg(tmp_path, monkeypatch, load_1m, percent):
+    (tmp_path / "loadavg").write_text(f"{load_1m} 1.00 1.00 2/300 4242\n")
+    real_open = open
+
+    def fake_open(file, *args):
+        return real_open(
+            tmp_path / "loadavg" if file == "/proc/loadavg" else file, *args
+        )
+
+    monkeypatch.setattr(supervisor, "open", fake_open, raising=False)
+    monkeypatch.setattr(supervisor, "cpu_count", lambda: 4)
+    assert supervisor.cpu_busy({0, 1}) == percent
+
+
+def test_peak_rss():
+    assert supervisor.peak_rss(getpid()) > 0
+    assert supervisor.peak_rss(2**22 + 1) is None  # above pid_max
+
+
+def test_report_the_rusage_peak_as_a_bound(app, caplog):
+    state = {
+        "exit": {
+            "graceful": True,
+            "stopped": True,
+            "processes": [
+                {"cmd": "a", "code": 0, "cpu_s": 1.0, "max_rss_kb": 1716},
+                {
+                    "cmd": "b",
+                    "code": 0,
+                    "cpu_s": 0.0,
+                    "max_rss_kb": None,
+                    "max_rss_kb_bound": 14540,
+                },
+            ],
+        }
+    }
+    with caplog.at_level(logging.INFO, "supervisor"):
+        supervisor.Supervisor("test").report(state)
+    assert caplog.messages == [
+        "test: stopped, a exited 0 after 1.0s CPU, 1716 kB, "
+        "b exited 0 after 0.0s CPU, at most 14540 kB"
+    ]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from udphub import Resampler
+
+
+def tone(freq, rate, count):
+    return np.exp(2j * np.pi * freq / rate * np.arange(count)).astype(np.complex64)
+
+
+@pytest.mark.parametrize(
+    "in_rate, out_rate, up, down",
+    [
+        (48000, 48000, 1, 1),
+        (96000, 48000, 1, 2),
+        (48000, 96000, 2, 1),
+        (57600, 48000, 5, 6),
+        (250000, 48000, 24, 125),
+    ],
+)
+def test_ratio_and_output_count(in_rate, out_rate, up, down):
+    resampler = Resampler(in_rate, out_rate)
+    assert (resampler.up, resampler.down) == (up, down)
+    blocks = [1, 7, 999, 1000, 13, 4096] * 10
+    total = sum(len(resampler.process(np.zeros(n, np.complex64))) for n in blocks)
+    assert abs(total - sum(blocks) * up / down) <= 1
+
+
+@pytest.mark.parametrize("in_rate, out_rate", [(96000, 48000), (250000, 48000)])
+def test_tone_passes_at_unit_gain(in_rate, out_rate):
+    resampler = Resampler(in_rate, out_rate)
+    out = np.concatenate(
+        [resampler.process(block) for block in np.split(tone(5000, in_rate, 50000), 50)]
+    )
+    expected = tone(5000, out_rate, len(out))
+    settled = slice(200, None)  # past the filter delay
+    assert np.allclose(np.abs(out[settled]), 1, atol=0.01)
+    # a pure tone stays one, at the same frequency, after the filter delay
+    phase = np.angle(out[settled] * np.conj(expected[settled]))
+    assert np.ptp(np.unwrap(phase)) < 0.01
+
+
+def test_out_of_band_tone_is_filtered():
+    resampler = Resampler(96000, 48000)
+    out = resampler.process(tone(40000, 96000, 20000))
+    assert np.max(np.abs(out[200:])) < 0.01
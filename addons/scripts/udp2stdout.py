@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from collections import namedtuple
+from os import getenv, fstat, write
+from signal import signal, SIGTERM
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF, MSG_DONTWAIT
+from sys import stdout
+from time import monotonic
+
+import numpy as np
+
+LOGGER = logging.getLogger("udp2stdout")  # imported by other add-ons, leave the root
+LOGGER.setLevel(
+    getattr(logging, getenv("UDP_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING")))
+)
+
+PSIZE = 65536  # largest datagram
+BATCH_SIZE = 1 << 18  # bytes received before converting and writing
+RCVBUF = 4 << 20
+STATS_INTERVAL = 60
+# scale and numpy type of each output format, cf32 is passed through as is
+FORMATS = {
+    "s16": (16768, np.int16),  # same scale as the udp2ishort flowgraph
+    "s8": (127, np.int8),
+    "cf32": (None, np.float32),
+}
+
+
+UdpSocket = namedtuple("UdpSocket", ["port", "inode", "rx_queue", "drops"])
+
+
+def udp_sockets():
+    """Local port, inode, queued bytes and drops of every UDP socket."""
+    sockets = []
+    try:
+        with open("/proc/net/udp", "r") as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if len(fields) > 12:
+                    sockets.append(
+                        UdpSocket(
+                            int(fields[1].split(":")[1], 16),
+                            int(fields[9]),
+                            int(fields[4].split(":")[1], 16),
+                            int(fields[12]),
+                        )
+                    )
+    except (OSError, ValueError, IndexError):
+        pass
+    return sockets
+
+
+def udp_drops(sock):
+    """Datagrams the kernel dropped on this socket."""
+    inode = fstat(sock.fileno()).st_ino
+    for info in udp_sockets():
+        if info.inode == inode:
+            return info.drops
+    return None
+
+
+class UdpBridge(object):
+    """Receive complex float IQ from a SatNOGS flowgraph UDP sink and write it
+    to stdout, converted to interleaved integers for the command line demods.
+    """
+
+    def __init__(self, host="0.0.0.0", port=57356, fmt="s16", scale=None, out=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt}, use one of {', '.join(FORMATS)}")
+        default_scale, self.dtype = FORMATS[fmt]
+        self.scale = default_scale if scale is None else scale
+        self.out = stdout.fileno() if out is None else out
+        self.sock = socket(AF_INET, SOCK_DGRAM)
+        self.sock.setsockopt(SOL_SOCKET, SO_RCVBUF, RCVBUF)
+        self.sock.bind((host, port))
+        self.buffer = bytearray(BATCH_SIZE + PSIZE)
+        self.view = memoryview(self.buffer)
+        self.work = np.empty(len(self.buffer) // 4, dtype=np.float32)
+        self.samples = np.empty(len(self.buffer) // 4, dtype=self.dtype)
+        self.packets = 0
+        self.bytes = 0
+        self.batches = 0
+        self.last_stats = monotonic()
+
+    def run(self):
+        pos = 0  # bytes in buffer, a partial sample is kept for the next batch
+        while True:
+            pos += self.receive(pos)
+            whole = pos - pos % 8
+            self.write(whole)
+            self.buffer[: pos - whole] = self.buffer[whole:pos]
+            pos -= whole
+            if monotonic() - self.last_stats > STATS_INTERVAL:
+                self.log_stats()
+
+    def receive(self, pos):
+        """Block for one datagram, then take what is queued up to BATCH_SIZE."""
+        start = pos
+        pos += self.sock.recv_into(self.view[pos:])
+        self.packets += 1
+        while pos < BATCH_SIZE:
+            try:
+                pos += self.sock.recv_into(self.view[pos:], 0, MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            self.packets += 1
+        self.bytes += pos - start
+        self.batches += 1
+        return pos - start
+
+    def write(self, size):
+        if size == 0:
+            return
+        if self.scale is None:
+            data = self.view[:size]
+        else:
+            count = size // 4
+            work = self.work[:count]
+            np.multiply(
+                np.frombuffer(self.buffer, np.float32, count), self.scale, out=work
+            )
+            info = np.iinfo(self.dtype)
+            np.clip(np.rint(work, out=work), info.min, info.max, out=work)
+            samples = self.samples[:count]
+            np.copyto(samples, work, casting="unsafe")
+            data = memoryview(samples).cast("B")
+        while len(data) > 0:
+            data = data[write(self.out, data) :]
+
+    def log_stats(self):
+        self.last_stats = monotonic()
+        drops = udp_drops(self.sock)
+        msg = (
+            f"{self.packets} packets, {self.bytes} bytes in {self.batches} batches, "
+            f"{drops if drops is not None else 'unknown'} dropped by the kernel"
+        )
+        if drops:
+            LOGGER.warning(msg)
+        else:
+            LOGGER.info(msg)
+
+
+def terminate(signum, frame):
+    raise SystemExit(0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(
+        description="Read UDP IQ from a SatNOGS flowgraph and write it to stdout"
+    )
+    parser.add_argument("-u", "--host", default="0.0.0.0", help="host/ip to bind")
+    parser.add_argument("-p", "--port", type=int, default=57356, help="udp port")
+    parser.add_argument(
+        "-f", "--format", default="s16", choices=FORMATS.keys(), help="output format"
+    )
+    parser.add_argument("-s", "--scale", type=float, help="override the scale")
+    args = parser.parse_args()
+    signal(SIGTERM, terminate)
+    bridge = UdpBridge(args.host, args.port, args.format, args.scale)
+    try:
+        bridge.run()
+    except (KeyboardInterrupt, SystemExit, BrokenPipeError):
+        pass
+    finally:
+        bridge.log_stats()
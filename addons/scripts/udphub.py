@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+from collections import deque
+from fractions import Fraction
+from os import getenv, open as os_open, write, close, O_WRONLY
+from signal import signal, SIGTERM
+from socket import socket, AF_INET, AF_UNIX, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from socket import MSG_DONTWAIT
+from threading import Condition, Thread
+from time import monotonic
+
+import numpy as np
+
+from udp2stdout import PSIZE, RCVBUF, STATS_INTERVAL, udp_drops
+
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(
+        logging, getenv("UDP_LOG_LEVEL", getenv("SATNOGS_LOG_LEVEL", "WARNING"))
+    ),
+)
+LOGGER = logging.getLogger("udphub")
+
+try:
+    RING_SIZE = int(getenv("UDP_HUB_BUFFER", 4096))  # datagrams per consumer
+except ValueError:
+    RING_SIZE = 4096
+BATCH_PACKETS = 64  # datagrams received before handing them to the consumers
+PACKET_SIZE = 1472  # resampled output is sent like the flowgraph does, 184 samples
+TAPS_PER_ZERO = 8  # filter length in zero crossings of the sinc on each side
+
+
+class Resampler(object):
+    """Streaming polyphase resampler for complex float samples.
+
+    The ratio is made rational, up / down, and only the outputs that are kept
+    after decimation are computed, all of them at once for each block.
+    """
+
+    def __init__(self, in_rate, out_rate):
+        ratio = Fraction(int(out_rate), int(in_rate)).limit_denominator(10000)
+        self.up, self.down = ratio.numerator, ratio.denominator
+        factor = max(self.up, self.down)
+        half = TAPS_PER_ZERO * factor
+        taps = np.arange(-half, half + 1)
+        fir = np.sinc(taps / factor) * np.kaiser(len(taps), 8.0) * self.up / factor
+        self.ntaps = -(-len(fir) // self.up)  # taps per phase
+        fir = np.pad(fir, (0, self.ntaps * self.up - len(fir)))
+        # phase p holds fir[p], fir[p + up], ..., reversed to line up with the input
+        self.phases = fir.reshape(self.ntaps, self.up).T[:, ::-1].astype(np.float32)
+        self.history = np.zeros(self.ntaps - 1, dtype=np.complex64)
+        self.next = 0  # upsampled index of the next output, from the block start
+
+    def process(self, samples):
+        x = np.concatenate((self.history, samples))
+        count = len(samples)
+        pos = np.arange(self.next, count * self.up, self.down)
+        self.next = (
+            pos[-1] + self.down if len(pos) > 0 else self.next
+        ) - count * self.up
+        self.history = x[len(x) - len(self.history) :]
+        index = pos // self.up + np.arange(self.ntaps)[:, None]
+        out = np.einsum("ij,ji->i", self.phases[pos % self.up], x[index])
+        return out.astype(np.complex64)
+
+
+class Consumer(object):
+    """One output of the hub, with its own bounded ring and sender thread.
+
+    udp:host:port and unix:/path get the datagrams as they are, fifo:/path gets
+    them as a stream. When the consumer falls behind the oldest datagrams are
+    dropped so it can not stall the others.
+    """
+
+    def __init__(self, spec, size=RING_SIZE):
+        self.spec = spec
+        self.kind, _, self.target = spec.partition(":")
+        self.open()
+        self.ring = deque()
+        self.size = size
+        self.cond = Condition()
+        self.running = True
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = Thread(target=self.run, name=spec, daemon=True)
+        self.thread.start()
+
+    def open(self):
+        if self.kind == "udp":
+            host, _, port = self.target.rpartition(":")
+            self.addr = (host or "127.0.0.1", int(port))
+            self.sock = socket(AF_INET, SOCK_DGRAM)
+        elif self.kind == "unix":
+            self.addr = self.target
+            self.sock = socket(AF_UNIX, SOCK_DGRAM)
+        elif self.kind == "fifo":
+            self.fd = None
+        else:
+            raise ValueError(f"Unknown consumer {self.spec}, use udp:, unix: or fifo:")
+
+    def put(self, packets):
+        with self.cond:
+            self.ring.extend(packets)
+            while len(self.ring) > self.size:
+                self.ring.popleft()
+                self.dropped += 1
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(1)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and len(self.ring) == 0:
+                    self.cond.wait()
+                if not self.running:
+                    break
+                packets, self.ring = self.ring, deque()
+            try:
+                self.send(packets)
+                self.sent += len(packets)
+            except OSError as e:
+                if self.errors == 0:
+                    LOGGER.warning(f"{self.spec}: {e}")
+                self.errors += 1
+                self.dropped += len(packets)
+        if self.kind == "fifo" and self.fd is not None:
+            close(self.fd)
+
+    def send(self, packets):
+        if self.kind == "fifo":
+            if self.fd is None:
+                self.fd = os_open(self.target, O_WRONLY)  # waits for the reader
+            data = memoryview(b"".join(packets))
+            try:
+                while len(data) > 0:
+                    data = data[write(self.fd, data) :]
+            except BrokenPipeError:
+                close(self.fd)
+                self.fd = None
+                raise
+        else:
+            for packet in packets:
+                self.sock.sendto(packet, self.addr)
+
+    def stats(self):
+        return f"{self.spec}: {self.sent} sent, {self.dropped} dropped, {self.errors} errors"
+
+
+class ResampleStage(Consumer):
+    """Resamples once for all the outputs that want the same rate."""
+
+    def __init__(self, in_rate, out_rate, size=RING_SIZE):
+        self.resampler = Resampler(in_rate, out_rate)
+        self.outputs = []
+        self.carry = b""  # partial sample left from the previous batch
+        super().__init__(f"resample:{out_rate}", size)
+
+    def open(self):
+        LOGGER.info(
+            f"Resampling to {self.target} sps, {self.resampler.up}/"
+            f"{self.resampler.down} with {self.resampler.ntaps} taps per phase"
+        )
+
+    def send(self, packets):
+        data = self.carry + b"".join(packets)
+        whole = len(data) - len(data) % 8
+        self.carry = data[whole:]
+        samples = np.frombuffer(data, dtype=np.complex64, count=whole // 8)
+        out = self.resampler.process(samples).tobytes()
+        packets = [out[i : i + PACKET_SIZE] for i in range(0, len(out), PACKET_SIZE)]
+        for output in self.outputs:
+            output.put(packets)
+
+
+class UdpHub(object):
+    """Receive the flowgraph UDP IQ once and fan it out to several decoders.
+
+    Outputs can ask for their own sample rate with @rate, the input rate is then
+    needed. Each rate is resampled once, no matter how many outputs share it.
+    """
+
+    def __init__(self, host="0.0.0.0", port=57356, outputs=(), rate=None):
+        self.consumers = []  # fed by the receive loop
+        self.outputs = []
+        stages = {}
+        for spec in outputs:
+            spec, _, out_rate = spec.partition("@")
+            output = Consumer(spec)
+            self.outputs.append(output)
+            if out_rate and rate is None:
+                LOGGER.warning(f"No input rate given, not resampling {spec}")
+            elif out_rate and int(out_rate) != int(rate):
+                if int(out_rate) not in stages:
+                    stages[int(out_rate)] = ResampleStage(rate, int(out_rate))
+                stages[int(out_rate)].outputs.append(output)
+                continue
+            self.consumers.append(output)
+        self.consumers.extend(stages.values())
+        self.sock = socket(AF_INET, SOCK_DGRAM)
+        self.sock.setsockopt(SOL_SOCKET, SO_RCVBUF, RCVBUF)
+        self.sock.bind((host, port))
+        self.packets = 0
+        self.last_stats = monotonic()
+
+    def run(self):
+        while True:
+            packets = [self.sock.recv(PSIZE)]
+            while len(packets) < BATCH_PACKETS:
+                try:
+                    packets.append(self.sock.recv(PSIZE, MSG_DONTWAIT))
+                except BlockingIOError:
+                    break
+            self.packets += len(packets)
+            for consumer in self.consumers:
+                consumer.put(packets)
+            if monotonic() - self.last_stats > STATS_INTERVAL:
+                self.log_stats()
+
+    def stop(self):
+        for consumer in self.consumers + self.outputs:
+            consumer.stop()  # stages first, they feed the outputs
+        self.log_stats()
+
+    def log_stats(self):
+        self.last_stats = monotonic()
+        drops = udp_drops(self.sock)
+        LOGGER.info(
+            f"{self.packets} packets received, "
+            f"{drops if drops is not None else 'unknown'} dropped by the kernel"
+        )
+        stages = [c for c in self.consumers if c not in self.outputs]
+        for consumer in self.outputs + stages:
+            if consumer.dropped or consumer.errors:
+                LOGGER.warning(consumer.stats())
+            else:
+                LOGGER.info(consumer.stats())
+
+
+def terminate(signum, frame):
+    raise SystemExit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Receive UDP IQ from a SatNOGS flowgraph and forward it to "
+        "several consumers"
+    )
+    parser.add_argument("-u", "--host", default="0.0.0.0", help="host/ip to bind")
+    parser.add_argument("-p", "--port", type=int, default=57356, help="udp port")
+    parser.add_argument("-r", "--rate", type=int, help="input sample rate")
+    parser.add_argument(
+        "outputs",
+        nargs="+",
+        help="udp:host:port, unix:/path or fifo:/path, optionally @rate",
+    )
+    args = parser.parse_args()
+    signal(SIGTERM, terminate)
+    hub = UdpHub(args.host, args.port, args.outputs, args.rate)
+    try:
+        hub.run()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        hub.stop()
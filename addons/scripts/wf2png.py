@@ -1,17 +1,215 @@
 #!/usr/bin/env python3
-import sys
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv, path, scandir
+from struct import pack
+from zlib import compressobj, crc32
 
-from satnogsclient.waterfall import EmptyArrayError, Waterfall
+import numpy as np
 
-if len(sys.argv) > 1:
+logging.basicConfig(
+    format="%(name)s - %(levelname)s - %(message)s",
+    level=getattr(logging, getenv("SATNOGS_LOG_LEVEL", "WARNING")),
+)
+LOGGER = logging.getLogger("wf2png")
+
+# satnogs-client waterfall header: timestamp, nchan, samp_rate, nfft_per_row,
+# center_freq, endianess. Followed by rows of int64 tabs and float32 spec[nchan]
+HEADER = np.dtype(
+    [
+        ("timestamp", "S32"),
+        ("nchan", ">i4"),
+        ("samp_rate", ">i4"),
+        ("nfft_per_row", ">i4"),
+        ("center_freq", ">f4"),
+        ("endianess", ">i4"),
+    ]
+)
+BLOCK_ROWS = 1024  # rows read from the file at a time
+# viridis, sampled at 9 points and interpolated to 256 colors
+_VIRIDIS = [
+    (68, 1, 84),
+    (71, 44, 122),
+    (59, 81, 139),
+    (44, 113, 142),
+    (33, 144, 141),
+    (39, 173, 129),
+    (92, 200, 99),
+    (170, 220, 50),
+    (253, 231, 37),
+]
+COLORMAP = np.array(
+    [
+        np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, len(_VIRIDIS)), channel)
+        for channel in zip(*_VIRIDIS)
+    ],
+    dtype=np.uint8,
+).T
+
+
+class EmptyWaterfallError(Exception):
+    pass
+
+
+def bins(count, size):
+    """Start index of each of size bins over count items."""
+    return (np.arange(size) * count) // size
+
+
+def read_waterfall(filename):
+    """Header and a memmap of the rows, nothing is read until it is used."""
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if len(header) == 0:
+        raise EmptyWaterfallError(f"No header in {filename}")
+    header = header[0]
+    rows = np.dtype([("tabs", "<i8"), ("spec", "<f4", (int(header["nchan"]),))])
+    count = (path.getsize(filename) - HEADER.itemsize) // rows.itemsize
+    if count <= 0:
+        raise EmptyWaterfallError(f"No data in {filename}")
+    data = np.memmap(
+        filename, dtype=rows, mode="r", offset=HEADER.itemsize, shape=count
+    )
+    return header, data
+
+
+def reduce_rows(data, height, mode="max"):
+    """Bin the rows down to height, block by block, and collect value statistics."""
+    count = len(data)
+    height = min(height, count)
+    starts = bins(count, height)
+    image = np.empty((height, data.dtype["spec"].shape[0]), dtype=np.float32)
+    sums = np.zeros(3)  # count, sum, sum of squares of valid values
+    reduce = np.maximum if mode == "max" else np.add
+    for start in range(0, count, BLOCK_ROWS):
+        block = np.asarray(data["spec"][start : start + BLOCK_ROWS], dtype=np.float32)
+        valid = block[block > -200.0]
+        sums += (
+            valid.size,
+            valid.sum(dtype=np.float64),
+            np.square(valid, dtype=np.float64).sum(),
+        )
+        end = start + len(block)
+        first = np.searchsorted(starts, start, side="right") - 1
+        last = np.searchsorted(starts, end - 1, side="right") - 1
+        idx = np.maximum(starts[first : last + 1] - start, 0)
+        reduced = reduce.reduceat(block, idx, axis=0)
+        if starts[first] < start:  # bin started in the previous block
+            reduced[0] = reduce(reduced[0], image[first])
+        image[first : last + 1] = reduced
+    if mode != "max":
+        image /= np.diff(np.append(starts, count))[:, None]
+    return image, sums
+
+
+def reduce_columns(image, width, mode="max"):
+    width = min(width, image.shape[1])
+    if width == image.shape[1]:
+        return image
+    starts = bins(image.shape[1], width)
+    if mode == "max":
+        return np.maximum.reduceat(image, starts, axis=1)
+    counts = np.diff(np.append(starts, image.shape[1]))
+    return np.add.reduceat(image, starts, axis=1) / counts
+
+
+def png_chunk(kind, data):
+    return pack(">I", len(data)) + kind + data + pack(">I", crc32(kind + data))
+
+
+def write_png(filename, rgb):
+    """8 bit RGB PNG, rows are compressed one at a time."""
+    height, width, _ = rgb.shape
+    z = compressobj(6)
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(png_chunk(b"IHDR", pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        data = bytearray()
+        for row in rgb:
+            data += z.compress(b"\x00" + row.tobytes())  # filter type none
+            if len(data) > 1 << 16:
+                f.write(png_chunk(b"IDAT", bytes(data)))
+                data.clear()
+        data += z.flush()
+        f.write(png_chunk(b"IDAT", bytes(data)))
+        f.write(png_chunk(b"IEND", b""))
+
+
+def render(
+    dat_file, png_file, width=None, height=2000, vmin=None, vmax=None, mode="max"
+):
+    """Render a waterfall .dat to png, time goes upwards like satnogs-client."""
+    header, data = read_waterfall(dat_file)
+    image, (count, total, squares) = reduce_rows(data, height, mode)
+    image = reduce_columns(image, width or image.shape[1], mode)
+    if vmin is None or vmax is None:
+        vmin, vmax = -100, -50
+        if count > 100:  # same automatic scale as satnogs-client
+            mean = total / count
+            std = np.sqrt(max(squares / count - mean * mean, 0))
+            vmin, vmax = mean - 2.0 * std, mean + 4.0 * std
+    scaled = np.clip((image - vmin) * (255 / max(vmax - vmin, 1e-6)), 0, 255)
+    write_png(png_file, COLORMAP[scaled.astype(np.uint8)[::-1]])
+    LOGGER.info(
+        f"{png_file}: {len(data)}x{header['nchan']} -> {image.shape[0]}x{image.shape[1]}, "
+        f"scale {vmin:.1f} to {vmax:.1f} dB"
+    )
+
+
+def render_prefix(prefix, **kwargs):
     try:
-        waterfall = Waterfall('{}.dat'.format(sys.argv[1]))
-        waterfall.plot('{}.png'.format(sys.argv[1]))
+        render(f"{prefix}.dat", f"{prefix}.png", **kwargs)
     except FileNotFoundError:
-        print('No waterfall data file found')
-    except (EmptyArrayError, IndexError):
-        print('Waterfall data array is empty')
+        print(f"No waterfall data file found: {prefix}.dat")
+        return False
+    except EmptyWaterfallError:
+        print(f"Waterfall data array is empty: {prefix}.dat")
+        return False
+    return True
+
+
+def render_dir(directory, jobs=None, force=False, **kwargs):
+    """Render every .dat in directory that has no .png yet, in parallel."""
+    prefixes = [
+        path.splitext(entry.path)[0]
+        for entry in scandir(directory)
+        if entry.name.endswith(".dat")
+        and (force or not path.exists(f"{path.splitext(entry.path)[0]}.png"))
+    ]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(render_prefix, p, **kwargs) for p in prefixes]
+    return sum(1 for f in futures if f.result())
+
 
-else:
-    print("useage: {0} <file prefix>\nexample: {0} test\nwill read test.dat and create test.png".
-          format(sys.argv[0]))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render satnogs waterfall .dat files to png",
+        epilog="example: wf2png.py test, will read test.dat and create test.png",
+    )
+    parser.add_argument("prefix", nargs="?", help="file prefix")
+    parser.add_argument("-d", "--dir", help="render all .dat files in a directory")
+    parser.add_argument("-j", "--jobs", type=int, help="processes for --dir")
+    parser.add_argument("-f", "--force", action="store_true", help="overwrite png")
+    parser.add_argument("-W", "--width", type=int, help="width, default all channels")
+    parser.add_argument("-H", "--height", type=int, default=2000, help="height")
+    parser.add_argument("--vmin", type=float, help="dB at the bottom of the scale")
+    parser.add_argument("--vmax", type=float, help="dB at the top of the scale")
+    parser.add_argument(
+        "-m", "--mode", choices=["max", "mean"], default="max", help="binning"
+    )
+    args = parser.parse_args()
+    options = {
+        "width": args.width,
+        "height": args.height,
+        "vmin": args.vmin,
+        "vmax": args.vmax,
+        "mode": args.mode,
+    }
+    if args.dir:
+        print(
+            f"Rendered {render_dir(args.dir, args.jobs, args.force, **options)} files"
+        )
+    elif args.prefix:
+        render_prefix(args.prefix, **options)
+    else:
+        parser.print_help()